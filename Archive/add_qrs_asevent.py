@@ -7,7 +7,7 @@
 import numpy as np
 import mne
 import os
-from scipy.io import loadmat
+from get_qrs import get_qrs
 from get_conditioninfo import get_conditioninfo
 from get_channels import get_channels
 
@@ -18,11 +18,8 @@ def add_qrs_asevent(subject, condition, srmr_nr, sampling_rate):
     cond_info = get_conditioninfo(condition, srmr_nr)
     cond_name = cond_info.cond_name
 
-    # Read .mat file with QRS events
-    input_path_m = "/data/pt_02569/tmp_data/prepared/"+subject_id+"/esg/prepro/"
-    fname_m = f"raw_{sampling_rate}_spinal_{cond_name}"
-    matdata = loadmat(input_path_m + fname_m + '.mat')
-    QRSevents_m = matdata['QRSevents'][0]
+    # QRS events from the store built from QRS_Timing (build_qrs_store)
+    QRSevents_m = get_qrs(subject, condition, srmr_nr, sampling_rate)
 
     _, esg_chans, _ = get_channels(subject, False, False, srmr_nr)  # Ignoring ECG and EOG channels
 
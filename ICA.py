@@ -7,6 +7,9 @@ import matplotlib.pyplot as plt
 from scipy.io import loadmat
 from get_conditioninfo import *
 from epoch_data import rereference_data
+from fif_fmt import get_fif_fmt
+from get_filtered_raw import get_filtered_raw
+from filter_esg import filter_esg
 
 
 def run_ica(subject, condition, srmr_nr, sampling_rate, choose_limited):
@@ -30,17 +33,12 @@ def run_ica(subject, condition, srmr_nr, sampling_rate, choose_limited):
     fname = f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif'
     raw = mne.io.read_raw_fif(input_path + fname, preload=True)
 
-    # make a copy to filter
-    raw_filtered = raw.copy().drop_channels(['ECG'])
-
-    # filtering
+    # filtered copy, shared with the other stages filtering this recording
     cfg = loadmat(cfg_path + 'cfg.mat')
     notch_freq = cfg['notch_freq'][0]
     esg_bp_freq = cfg['esg_bp_freq'][0]
 
-    raw_filtered.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-                        iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-    raw_filtered.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+    raw_filtered = get_filtered_raw(input_path + fname, esg_bp_freq, notch_freq).drop_channels(['ECG'])
 
     # ICA
     ica = mne.preprocessing.ICA(n_components=len(raw_filtered.ch_names), max_iter='auto', random_state=97)
@@ -77,24 +75,21 @@ def run_ica(subject, condition, srmr_nr, sampling_rate, choose_limited):
     # add reference channel to data - average rereferencing
     mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
 
-    raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-               iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
+    filter_esg(raw, esg_bp_freq, notch_freq)  # Band-pass and notch in one pass
     # raw_FzRef.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw_FzRef.ch_names), method='iir',
     #                  iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
     # raw_antRef.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw_antRef.ch_names), method='iir',
     #                   iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-
-    raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
     # raw_FzRef.notch_filter(freqs=notch_freq, n_jobs=len(raw_FzRef.ch_names), method='fir', phase='zero')
     # raw_antRef.notch_filter(freqs=notch_freq, n_jobs=len(raw_antRef.ch_names), method='fir', phase='zero')
 
     # Save raw data
     if choose_limited:
         fname = 'clean_baseline_ica_auto_' + cond_name + '_lim.fif'
-        raw.save(os.path.join(save_path, fname), fmt='double', overwrite=True)
+        raw.save(os.path.join(save_path, fname), fmt=get_fif_fmt(), overwrite=True)
     else:
         fname = 'clean_baseline_ica_auto_' + cond_name + '.fif'
-        raw.save(os.path.join(save_path, fname), fmt='double', overwrite=True)
+        raw.save(os.path.join(save_path, fname), fmt=get_fif_fmt(), overwrite=True)
     # fname = 'clean_baseline_ica_auto_antRef_' + cond_name + '.fif'
     # raw_antRef.save(os.path.join(save_path, fname), fmt='double', overwrite=True)
     # fname = 'clean_baseline_ica_auto_FzRef_' + cond_name + '.fif'
@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 from scipy.io import loadmat
 from get_conditioninfo import *
 from epoch_data import rereference_data
+from fif_fmt import get_fif_fmt
+from get_filtered_raw import get_filtered_raw
+from filter_esg import filter_esg
 
 
 def run_ica_anterior(subject, condition, srmr_nr, sampling_rate):
@@ -35,17 +38,16 @@ def run_ica_anterior(subject, condition, srmr_nr, sampling_rate):
     elif nerve == 2:
         raw_antRef = rereference_data(raw, 'AL')
 
-    # make a copy to filter
-    raw_filtered = raw_antRef.copy().drop_channels(['ECG'])
-
-    # filtering
+    # filtered copy with the same reference, shared with the other stages filtering this recording
     cfg = loadmat(cfg_path + 'cfg.mat')
     notch_freq = cfg['notch_freq'][0]
     esg_bp_freq = cfg['esg_bp_freq'][0]
 
-    raw_filtered.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-                        iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-    raw_filtered.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+    if nerve == 1:
+        raw_filtered = get_filtered_raw(input_path + fname, esg_bp_freq, notch_freq, 'AC')
+    elif nerve == 2:
+        raw_filtered = get_filtered_raw(input_path + fname, esg_bp_freq, notch_freq, 'AL')
+    raw_filtered.drop_channels(['ECG'])
 
     # ICA
     ica = mne.preprocessing.ICA(n_components=len(raw_filtered.ch_names), max_iter='auto', random_state=97)
@@ -67,12 +69,9 @@ def run_ica_anterior(subject, condition, srmr_nr, sampling_rate):
     # Apply the ica we got from the filtered data onto the unfiltered raw
     ica.apply(raw_antRef)
 
-    raw_antRef.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw_antRef.ch_names), method='iir',
-                      iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-
-    raw_antRef.notch_filter(freqs=notch_freq, n_jobs=len(raw_antRef.ch_names), method='fir', phase='zero')
+    filter_esg(raw_antRef, esg_bp_freq, notch_freq)  # Band-pass and notch in one pass
 
     # Save data
     fname = 'anterior_clean_baseline_ica_auto_' + cond_name + '.fif'
-    raw_antRef.save(os.path.join(save_path, fname), fmt='double', overwrite=True)
+    raw_antRef.save(os.path.join(save_path, fname), fmt=get_fif_fmt(), overwrite=True)
 
@@ -7,6 +7,9 @@ from scipy.io import loadmat
 from get_conditioninfo import *
 from epoch_data import rereference_data
 from get_esg_channels import get_esg_channels
+from fif_fmt import get_fif_fmt
+from get_filtered_raw import get_filtered_raw
+from filter_esg import filter_esg
 
 
 def run_ica_separatepatches(subject, condition, srmr_nr, sampling_rate):
@@ -32,14 +35,11 @@ def run_ica_separatepatches(subject, condition, srmr_nr, sampling_rate):
     fname = f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif'
     raw = mne.io.read_raw_fif(input_path + fname, preload=True)
 
-    # Make a filtered copy
-    raw_filtered = raw.copy().drop_channels(['ECG'])
+    # Filtered copy, shared with the other stages filtering this recording
     cfg = loadmat(cfg_path + 'cfg.mat')
     notch_freq = cfg['notch_freq'][0]
     esg_bp_freq = cfg['esg_bp_freq'][0]
-    raw_filtered.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-                        iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-    raw_filtered.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+    raw_filtered = get_filtered_raw(input_path + fname, esg_bp_freq, notch_freq).drop_channels(['ECG'])
 
     # ICA
     # Perform ica separately for lumbar and cervical channels
@@ -80,12 +80,9 @@ def run_ica_separatepatches(subject, condition, srmr_nr, sampling_rate):
     raw.add_channels([raw_patch])  # Add back the channels I removed
 
     # Filter
-    raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-               iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-
-    raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+    filter_esg(raw, esg_bp_freq, notch_freq)  # Band-pass and notch in one pass
 
     # Save data
     fname = 'separated_clean_baseline_ica_auto_' + cond_name + '.fif'
-    raw.save(os.path.join(save_path, fname), fmt='double', overwrite=True)
+    raw.save(os.path.join(save_path, fname), fmt=get_fif_fmt(), overwrite=True)
 
@@ -12,6 +12,8 @@ import pandas as pd
 from invert import invert
 from scipy.stats import variation
 from epoch_data import rereference_data
+from get_filtered_raw import get_filtered_raw
+from get_ssp_raw import get_ssp_raw
 import matplotlib.pyplot as plt
 
 
@@ -167,14 +169,12 @@ if __name__ == '__main__':
                             file_path = "/data/pt_02569/tmp_data/ecg_rm_py/"
                             file_name = f'data_clean_ecg_spinal_{cond_name}_withqrs.fif'
                         elif method == 'SSP':
-                            file_path = "/data/p_02569/SSP/"
-                            file_name = f'ssp_cleaned_{cond_name}.fif'
+                            file_path = "/data/p_02569/SSP/"  # Read through get_ssp_raw
 
                         # Process SSP data
                         if method == 'SSP':
                             for n in np.arange(5, 7):
-                                input_path = file_path + subject_id + "/" + str(n) + " projections/"
-                                raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
+                                raw = get_ssp_raw(subject_id, cond_name, n, preload=True)
                                 # Create epochs
                                 epochs = get_cropped_epochs(raw, iv_epoch, iv_baseline, potential_window, trigger_name)
                                 var = get_coeffofvariation(epochs, channel)
@@ -187,15 +187,11 @@ if __name__ == '__main__':
                         # Process all other methods
                         else:
                             input_path = file_path + subject_id + "/esg/prepro/"
-                            raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
-
                             if method == 'Prep' or method == 'PCA':
-                                # add reference channel to data
-                                mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-                                raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names),
-                                           method='iir',
-                                           iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-                                raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+                                # reference channel added and filtered, shared with the pipeline stages
+                                raw = get_filtered_raw(f"{input_path}{file_name}", esg_bp_freq, notch_freq, 'TH6')
+                            else:
+                                raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
 
                             epochs = get_cropped_epochs(raw, iv_epoch, iv_baseline, potential_window, trigger_name)
                             var = get_coeffofvariation(epochs, channel)
@@ -6,6 +6,8 @@ import h5py
 from scipy.io import loadmat
 from SNR_functions import *
 from epoch_data import rereference_data
+from get_filtered_raw import get_filtered_raw
+from get_ssp_raw import get_ssp_raw
 import matplotlib.pyplot as plt
 
 
@@ -72,25 +74,20 @@ if __name__ == '__main__':
                         file_path = "/data/pt_02569/tmp_data/baseline_ica_py/"
                         file_name = f'clean_baseline_ica_auto_{cond_name}.fif'
                     elif method == 'SSP_5' or method == 'SSP_6':
-                        file_path = "/data/p_02569/SSP/"
-                        file_name = f'ssp_cleaned_{cond_name}.fif'
+                        file_path = "/data/p_02569/SSP/"  # Read through get_ssp_raw
+
+                    if method != 'SSP_5' and method != 'SSP_6':
+                        input_path = file_path + subject_id + "/esg/prepro/"
 
                     if method == 'SSP_5':
-                        input_path = file_path + subject_id + '/5 projections/'
+                        raw = get_ssp_raw(subject_id, cond_name, 5, preload=True)
                     elif method == 'SSP_6':
-                        input_path = file_path + subject_id + '/6 projections/'
+                        raw = get_ssp_raw(subject_id, cond_name, 6, preload=True)
+                    elif method == 'Prep' or method == 'PCA':
+                        # reference channel added and filtered, shared with the pipeline stages
+                        raw = get_filtered_raw(f"{input_path}{file_name}", esg_bp_freq, notch_freq, 'TH6')
                     else:
-                        input_path = file_path + subject_id + "/esg/prepro/"
-
-                    raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
-
-                    if method == 'Prep' or method == 'PCA':
-                        # add reference channel to data
-                        mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-
-                        raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-                                   iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-                        raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+                        raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
 
                     # Form epochs
                     events, event_ids = mne.events_from_annotations(raw)
@@ -12,6 +12,7 @@ import pandas as pd
 from invert import invert
 from scipy.stats import variation
 from epoch_data import rereference_data
+from get_ssp_raw import get_ssp_raw
 import matplotlib.pyplot as plt
 
 
@@ -197,14 +198,12 @@ if __name__ == '__main__':
                             file_path = "/data/pt_02569/tmp_data/ecg_rm_py/"
                             file_name = f'data_clean_ecg_spinal_{cond_name}_withqrs.fif'
                         elif method == 'SSP':
-                            file_path = "/data/p_02569/SSP/"
-                            file_name = f'ssp_cleaned_{cond_name}.fif'
+                            file_path = "/data/p_02569/SSP/"  # Read through get_ssp_raw
 
                         # Process SSP data
                         if method == 'SSP':
                             for n in np.arange(5, 7):
-                                input_path = file_path + subject_id + "/" + str(n) + " projections/"
-                                raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
+                                raw = get_ssp_raw(subject_id, cond_name, n, preload=True)
                                 # Create epochs
                                 epochs = get_cropped_epochs(raw, iv_epoch, iv_baseline, potential_window, trigger_name)
                                 no_drops, var = get_coeffofvariation(epochs, channel)
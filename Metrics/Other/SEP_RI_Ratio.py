@@ -6,6 +6,7 @@ import pandas as pd
 from scipy.io import loadmat
 from SNR_functions import *
 from epoch_data import rereference_data
+from get_ssp_raw import get_ssp_raw
 
 if __name__ == '__main__':
     reduced_epochs = False
@@ -44,8 +45,7 @@ if __name__ == '__main__':
 
                 if method == 'SSP':
                     # Load SSP projection data
-                    file_path = "/data/p_02569/SSP/"
-                    file_name = f"{subject_id}/6 projections/ssp_cleaned_{cond_name}.fif"
+                    file_path = "/data/p_02569/SSP/"  # Read through get_ssp_raw
                 elif method == 'Prep':
                     file_path = f"/data/pt_02569/tmp_data/prepared_py/"
                     file_name = f'{subject_id}/esg/prepro/noStimart_sr1000_{cond_name}_withqrs.fif'
@@ -56,7 +56,10 @@ if __name__ == '__main__':
                     file_path = f"/data/pt_02569/tmp_data/baseline_ica_py/"
                     file_name = f'{subject_id}/esg/prepro/clean_baseline_ica_auto_{cond_name}.fif'
 
-                raw = mne.io.read_raw_fif(f"{file_path}{file_name}", preload=True)
+                if method == 'SSP':
+                    raw = get_ssp_raw(subject_id, cond_name, 6, preload=True)
+                else:
+                    raw = mne.io.read_raw_fif(f"{file_path}{file_name}", preload=True)
 
                 if (method == 'Prep' or method == 'PCA'):
                     # add reference channel to data
@@ -9,7 +9,9 @@ import numpy as np
 import h5py
 from scipy.io import loadmat
 from SNR_functions import *
+from epoch_store import get_epoch_store, evoked_from_store
 from epoch_data import rereference_data
+from get_ssp_raw import get_ssp_fname, apply_ssp_projs
 
 if __name__ == '__main__':
     reduced_epochs = False  # Use a smaller number of epochs to calculate the SNR
@@ -65,16 +67,20 @@ if __name__ == '__main__':
 
                         subject_id = f'sub-{str(subject).zfill(3)}'
 
+                        # Only the epoch windows are read, from a memory-mapped copy of the data saved by apply_SSP
+                        store = get_epoch_store(get_ssp_fname(subject_id, cond_name))
+                        evoked_filtered = evoked_from_store(store, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
+
                         # Want the SNR for each projection tried from 1 to 20
                         for n in np.arange(1, 21):  # (5, 21)
-                            # Load SSP projection data
-                            input_path = "/data/p_02569/SSP/" + subject_id
-                            savename = input_path + "/" + str(n) + " projections/"
+                            # SSP projection - linear, so the same on the evoked response as on the raw data
+                            evoked = apply_ssp_projs(evoked_filtered.copy(), n)
                             if ant_ref:
-                                raw = mne.io.read_raw_fif(f"{savename}ssp_cleaned_{cond_name}_antRef.fif")
-                            else:
-                                raw = mne.io.read_raw_fif(f"{savename}ssp_cleaned_{cond_name}.fif")
-                            evoked = evoked_from_raw(raw, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
+                                # anterior reference
+                                if cond_name == 'median':
+                                    evoked = rereference_data(evoked, 'AC')
+                                elif cond_name == 'tibial':
+                                    evoked = rereference_data(evoked, 'AL')
                             snr, chan = calculate_SNR_evoked(evoked, cond_name, iv_baseline, reduced_window)
 
                             # Now have one snr for relevant channel in each subject + condition
@@ -168,25 +174,23 @@ if __name__ == '__main__':
                             file_name = f"separated_clean_baseline_ica_auto_{cond_name}.fif"
 
                         input_path = file_path + subject_id + "/esg/prepro/"
-                        raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
 
+                        # Only the epoch windows are read, from a memory-mapped copy of the data - for these methods
+                        # the copy holds the data with TH6 added and filtered, so they are filtered once, not each run
                         if (method == 'Prep' or method == 'PCA' or method == 'PCA Tukey' or method == 'PCA PCHIP' or
                                 method == 'PCA Tukey PCHIP'):
-                            # add reference channel to data
-                            mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-                            raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names),
-                                       method='iir',
-                                       iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-                            raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+                            store = get_epoch_store(f"{input_path}{file_name}", esg_bp_freq, notch_freq)
+                        else:
+                            store = get_epoch_store(f"{input_path}{file_name}")
+
+                        evoked = evoked_from_store(store, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
 
                         if ant_ref:
-                            # anterior reference
+                            # anterior reference - linear, so the same on the evoked response as on the raw data
                             if nerve == 1:
-                                raw = rereference_data(raw, 'AC')
+                                evoked = rereference_data(evoked, 'AC')
                             elif nerve == 2:
-                                raw = rereference_data(raw, 'AL')
-
-                        evoked = evoked_from_raw(raw, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
+                                evoked = rereference_data(evoked, 'AL')
                         snr, chan = calculate_SNR_evoked(evoked, cond_name, iv_baseline, reduced_window)
 
                         # Now have one snr related to each subject and condition
@@ -0,0 +1,127 @@
+# Memory-mapped access to the epochs of a recording for metrics that only need evoked responses
+# The first call converts the .fif to a sidecar array next to it (time major, so each epoch window is one contiguous
+# read) with the channel info and annotations alongside - later calls memory map the sidecar, and evoked_from_store
+# reads only the samples inside the epoch windows rather than the full recording
+# With esg_bp_freq and notch_freq the sidecar holds the data after adding TH6 and filtering as in the metrics scripts,
+# taken from the filtered recording shared with the pipeline stages (get_filtered_raw), with the filter method
+# (filter_esg) of the pipeline
+# store = get_epoch_store(input_path + file_name, esg_bp_freq, notch_freq)
+# evoked = evoked_from_store(store, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
+
+import os
+import mne
+import numpy as np
+import h5py
+from numpy.lib.format import open_memmap
+from get_filtered_raw import get_filtered_raw
+from filter_esg import get_filter_method
+
+
+def get_epoch_store(fname, esg_bp_freq=None, notch_freq=None, chunk_sec=60):
+    # Declare class to hold the store
+    class EpochStore():
+        def __init__(self):
+            pass
+
+    filtered = esg_bp_freq is not None
+    assert filtered == (notch_freq is not None), "Error. Give both esg_bp_freq and notch_freq, or neither."
+    base = os.path.splitext(fname)[0] + ('_filtered' if filtered else '')
+    data_fname = base + '_store.npy'
+    meta_fname = base + '_store.h5'
+    info_fname = base + '_store-info.fif'
+
+    # Convert when there is no sidecar yet, it was made from an earlier version of the .fif or filtered differently
+    # The metadata is written last, so a conversion that did not finish is never taken for a valid sidecar
+    filter_freqs = np.concatenate([np.ravel(esg_bp_freq), np.ravel(notch_freq)]) if filtered else np.zeros(0)
+    filter_method = get_filter_method() if filtered else 'none'
+    source_mtime = os.stat(fname).st_mtime_ns
+    convert = not all(os.path.isfile(f) for f in [data_fname, meta_fname, info_fname])
+    if not convert:
+        with h5py.File(meta_fname, "r") as infile:
+            convert = not np.array_equal(infile["filter_freqs"][()], filter_freqs) or \
+                "filter_method" not in infile or infile["filter_method"][()].decode() != filter_method or \
+                "source_mtime" not in infile or infile["source_mtime"][()] != source_mtime
+
+    if convert:
+        if filtered:
+            # reference channel added and filtered, from the cache shared with the pipeline stages
+            raw = get_filtered_raw(fname, esg_bp_freq, notch_freq, 'TH6')
+        else:
+            raw = mne.io.read_raw_fif(fname, preload=False)
+
+        # Written under temporary names of this process and moved, so a parallel caller never reads a partly written
+        # file - the data and info first, the metadata that validates them last
+        tmp_fname = f'{base}_store.{os.getpid()}.tmp'
+        # Copy over chunk by chunk, without preload only one chunk is in memory at a time
+        data = open_memmap(tmp_fname + '.npy', mode='w+', dtype=np.float64, shape=(int(raw.n_times), len(raw.ch_names)))
+        chunk = int(chunk_sec * raw.info['sfreq'])
+        for start in np.arange(0, raw.n_times, chunk):
+            stop = min(start + chunk, raw.n_times)
+            data[start:stop] = raw.get_data(start=start, stop=stop).T
+        data.flush()
+        del data
+        os.replace(tmp_fname + '.npy', data_fname)
+
+        mne.io.write_info(tmp_fname + '-info.fif', raw.info)
+        os.replace(tmp_fname + '-info.fif', info_fname)
+        # Onsets relative to the first sample, as mne.Epochs uses them
+        with h5py.File(tmp_fname + '.h5', "w") as outfile:
+            outfile.create_dataset('onset', data=raw.annotations.onset - raw._first_time)
+            outfile.create_dataset('duration', data=raw.annotations.duration)
+            outfile.create_dataset('description', data=np.array(list(raw.annotations.description), dtype='S'))
+            outfile.create_dataset('filter_freqs', data=filter_freqs)
+            outfile.create_dataset('filter_method', data=filter_method.encode())
+            outfile.create_dataset('source_mtime', data=source_mtime)
+        os.replace(tmp_fname + '.h5', meta_fname)
+        del raw
+
+    store = EpochStore()
+    store.data = np.load(data_fname, mmap_mode='r')  # [n_times x n_channels]
+    store.info = mne.io.read_info(info_fname)
+    with h5py.File(meta_fname, "r") as infile:
+        store.onset = infile["onset"][()]
+        store.duration = infile["duration"][()]
+        store.description = infile["description"][()].astype(str)
+
+    return store
+
+
+# Same evoked response as evoked_from_raw in SNR_functions: epochs overlapping a bad annotation or running over the
+# ends of the recording are dropped, and the baseline is removed from the average (same as from each epoch, as both
+# are linear)
+def evoked_from_store(store, iv_epoch, iv_baseline, trigger_name, reduced_epochs, block_size=256):
+    sfreq = store.info['sfreq']
+    n_times = store.data.shape[0]
+    window = np.arange(int(round(iv_epoch[0] * sfreq)), int(round(iv_epoch[1] * sfreq)) + 1)
+    times = window / sfreq
+
+    # Events of the trigger, in samples
+    event_samples = np.round(store.onset[store.description == trigger_name] * sfreq).astype(int)
+    if reduced_epochs and trigger_name == 'Median - Stimulation':
+        event_samples = event_samples[900:1100]
+    elif reduced_epochs and trigger_name == 'Tibial - Stimulation':
+        event_samples = event_samples[800:1200]
+
+    # Drop epochs that run over the ends of the recording or overlap a bad annotation
+    starts = event_samples + window[0]
+    stops = starts + len(window)
+    keep = (starts >= 0) & (stops <= n_times)
+    bad = np.char.startswith(np.char.lower(store.description), 'bad')
+    bad_onset = store.onset[bad]
+    bad_end = bad_onset + store.duration[bad]
+    overlap = (bad_onset[np.newaxis, :] < stops[:, np.newaxis] / sfreq) & \
+              (bad_end[np.newaxis, :] > starts[:, np.newaxis] / sfreq)
+    starts = starts[keep & ~np.any(overlap, axis=1)]
+    assert len(starts) > 0, f"Error. No epochs of {trigger_name} left."
+
+    # Sum the epoch windows a block of epochs at a time, each read straight from the memory map
+    data = np.zeros((store.data.shape[1], len(window)))
+    for b in np.arange(0, len(starts), block_size):
+        idx = starts[b:b + block_size, np.newaxis] + np.arange(len(window))
+        data += np.sum(store.data[idx], axis=0).T
+    data /= len(starts)
+
+    evoked = mne.EvokedArray(data, store.info, tmin=times[0], nave=len(starts), comment=trigger_name)
+    evoked.apply_baseline(tuple(iv_baseline))
+
+    return evoked
@@ -5,6 +5,8 @@ import numpy as np
 import mne
 import yasa
 import h5py
+from filter_esg import filter_esg
+from get_ssp_raw import get_ssp_raw
 
 
 # Function to get the fundamental frequency of the heartbeat and the first 4 harmonics
@@ -107,9 +109,7 @@ if __name__ == '__main__':
                             subject_id = f'sub-{str(subject).zfill(3)}'
 
                             # Load data
-                            input_path = "/data/p_02569/SSP/" + subject_id
-                            savename = input_path + "/" + str(n) + " projections/"
-                            raw = mne.io.read_raw_fif(f"{savename}ssp_cleaned_{cond_name}.fif")
+                            raw = get_ssp_raw(subject_id, cond_name, n)
 
                             # Compute power at the fundamental frequency and harmonics + get power
                             freq = get_harmonics(raw, trigger_name, sampling_rate)
@@ -183,10 +183,7 @@ if __name__ == '__main__':
                                 method == 'PCA Tukey PCHIP'):
                             # add reference channel to data
                             mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-                            raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names),
-                                       method='iir',
-                                       iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-                            raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+                            filter_esg(raw, esg_bp_freq, notch_freq)  # Band-pass and notch in one pass
 
                         # Compute power at the harmonics
                         freq = get_harmonics(raw, trigger_name, sampling_rate)
@@ -8,7 +8,8 @@ from scipy.io import loadmat
 import numpy as np
 import mne
 import h5py
-from SNR_functions import evoked_from_raw
+from epoch_store import get_epoch_store, evoked_from_store
+from get_ssp_raw import get_ssp_fname, apply_ssp_projs
 
 if __name__ == '__main__':
     choose_limited = False  # If true, use data where only top 4 components chosen - use FALSE, see main
@@ -78,10 +79,11 @@ if __name__ == '__main__':
                             subject_id = f'sub-{str(subject).zfill(3)}'
 
                             # Want the RMS of the data, load data
-                            input_path = "/data/p_02569/SSP/" + subject_id
-                            savename = input_path + "/" + str(n) + " projections/"
-                            raw = mne.io.read_raw_fif(f"{savename}ssp_cleaned_{cond_name}.fif")
-                            evoked = evoked_from_raw(raw, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
+                            # Only the epoch windows are read, from a memory-mapped copy of the data saved by apply_SSP
+                            store = get_epoch_store(get_ssp_fname(subject_id, cond_name))
+                            evoked = evoked_from_store(store, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
+                            # SSP projection - linear, so the same on the evoked response as on the raw data
+                            evoked = apply_ssp_projs(evoked, n)
 
                             # Now we have an evoked potential about the heartbeat
                             # Want to compute the RMS for each channel
@@ -154,18 +156,16 @@ if __name__ == '__main__':
                             file_name = f"separated_clean_baseline_ica_auto_{cond_name}.fif"
 
                         input_path = file_path + subject_id + "/esg/prepro/"
-                        raw = mne.io.read_raw_fif(f"{input_path}{file_name}", preload=True)
 
+                        # Only the epoch windows are read, from a memory-mapped copy of the data - for these methods
+                        # the copy holds the data with TH6 added and filtered, so they are filtered once, not each run
                         if (method == 'Prep' or method == 'PCA' or method == 'PCA Tukey' or method == 'PCA PCHIP' or
                                 method == 'PCA Tukey PCHIP'):
-                            # add reference channel to data
-                            mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-                            raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names),
-                                       method='iir',
-                                       iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-                            raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
-
-                        evoked = evoked_from_raw(raw, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
+                            store = get_epoch_store(f"{input_path}{file_name}", esg_bp_freq, notch_freq)
+                        else:
+                            store = get_epoch_store(f"{input_path}{file_name}")
+
+                        evoked = evoked_from_store(store, iv_epoch, iv_baseline, trigger_name, reduced_epochs)
 
                         # Now we have an evoked potential about the heartbeat
                         # Want to compute the RMS for each channel
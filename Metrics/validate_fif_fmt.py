@@ -0,0 +1,115 @@
+############## Validates storing the .fif output of each stage as float32 (fif_fmt 'single') ##############
+# Each float64 ('double') output is written again as float32 and read back, and the SNR, residual intensity and
+# INPS power are computed from both as in compute_SNR, residual_intensity and inps_yasa
+# Reports the maximum deviation of the data and the maximum relative deviation of each metric between the two, per
+# method, across subjects and conditions (and channels)
+
+import os
+import tempfile
+from scipy.io import loadmat
+import numpy as np
+import mne
+import h5py
+from SNR_functions import evoked_from_raw, calculate_SNR_evoked
+from inps_yasa import get_harmonics, get_power
+from filter_esg import filter_esg
+from get_ssp_raw import apply_ssp_projs
+
+
+# Metrics of one recording, as computed by the metrics scripts
+def get_metrics(raw, cond_name, needs_filtering, esg_chans, iv_epoch, iv_baseline, esg_bp_freq, notch_freq):
+    if cond_name == 'tibial':
+        trigger_name = 'Tibial - Stimulation'
+    elif cond_name == 'median':
+        trigger_name = 'Median - Stimulation'
+
+    if needs_filtering:
+        # add reference channel to data
+        mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
+        filter_esg(raw, esg_bp_freq, notch_freq)  # Band-pass and notch in one pass
+
+    # SNR of the evoked response to stimulation
+    evoked = evoked_from_raw(raw, iv_epoch, iv_baseline, trigger_name, False)
+    snr, _ = calculate_SNR_evoked(evoked, cond_name, iv_baseline, False)
+
+    # RMS of the evoked response about the R-peak, 300ms before to 400ms after
+    evoked = evoked_from_raw(raw, [-300 / 1000, 400 / 1000], [-300 / 1000, -200 / 1000], 'qrs', False)
+    res = np.sqrt(np.mean(evoked.get_data(picks=esg_chans) ** 2, axis=1))
+
+    # Power at the heart rate and its harmonics
+    freq = np.around(get_harmonics(raw, 'qrs', raw.info['sfreq']), decimals=1)
+    power = get_power(raw.get_data(picks=esg_chans) * 1e6, freq, raw.info['sfreq'], esg_chans)
+
+    return np.concatenate([[snr], res, power])
+
+
+if __name__ == '__main__':
+    # Define the channel names so they come out of each dataset the same
+    esg_chans = ['S35', 'S24', 'S36', 'Iz', 'S17', 'S15', 'S32', 'S22',
+                 'S19', 'S26', 'S28', 'S9', 'S13', 'S11', 'S7', 'SC1', 'S4', 'S18',
+                 'S8', 'S31', 'SC6', 'S12', 'S16', 'S5', 'S30', 'S20', 'S34', 'AC',
+                 'S21', 'S25', 'L1', 'S29', 'S14', 'S33', 'S3', 'AL', 'L4', 'S6',
+                 'S23']
+
+    subjects = np.arange(1, 37)  # 1 through 36 to access subject data
+    cond_names = ['median', 'tibial']
+
+    cfg_path = "/data/pt_02569/"  # Contains important info about experiment
+    cfg = loadmat(cfg_path + 'cfg.mat')
+    notch_freq = cfg['notch_freq'][0]
+    esg_bp_freq = cfg['esg_bp_freq'][0]
+    iv_epoch = cfg['iv_epoch'][0] / 1000
+    iv_baseline = cfg['iv_baseline'][0] / 1000
+
+    # Method: (folder, file name, filtered before the metrics)
+    which_method = {'Prep': ("/data/pt_02569/tmp_data/prepared_py/", 'noStimart_sr1000_{}_withqrs.fif', True),
+                    'PCA': ("/data/pt_02569/tmp_data/ecg_rm_py/", 'data_clean_ecg_spinal_{}_withqrs.fif', True),
+                    'PCA Tukey': ("/data/pt_02569/tmp_data/ecg_rm_py_tukey/", 'data_clean_ecg_spinal_{}_withqrs.fif',
+                                  True),
+                    'ICA': ("/data/pt_02569/tmp_data/baseline_ica_py/", 'clean_baseline_ica_auto_{}.fif', False),
+                    'SSP': ("/data/p_02569/SSP/", 'ssp_filtered_{}.fif', False)}
+
+    class save_deviation():
+        def __init__(self):
+            pass
+
+    savedev = save_deviation()
+    for method, (file_path, file_name, needs_filtering) in which_method.items():
+        max_data = 0  # Max absolute deviation of the stored data
+        max_metrics = np.zeros(3)  # Max relative deviation of the SNR, residual intensity and INPS power
+        for subject in subjects:
+            subject_id = f'sub-{str(subject).zfill(3)}'
+            for cond_name in cond_names:
+                if method == 'SSP':
+                    fname = f"{file_path}{subject_id}/{file_name.format(cond_name)}"
+                else:
+                    fname = f"{file_path}{subject_id}/esg/prepro/{file_name.format(cond_name)}"
+                raw = mne.io.read_raw_fif(fname, preload=True)
+
+                # Write as float32 and read back, as a stage saving with fif_fmt 'single' would
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    raw.save(os.path.join(tmp_dir, 'single_raw.fif'), fmt='single')
+                    raw_single = mne.io.read_raw_fif(os.path.join(tmp_dir, 'single_raw.fif'), preload=True)
+                max_data = max(max_data, np.max(np.abs(raw_single.get_data() - raw.get_data())))
+                if method == 'SSP':
+                    # Metrics of the 6 projector variant, projected as get_ssp_raw does
+                    apply_ssp_projs(raw, 6)
+                    apply_ssp_projs(raw_single, 6)
+
+                metrics = get_metrics(raw, cond_name, needs_filtering, esg_chans, iv_epoch, iv_baseline, esg_bp_freq,
+                                      notch_freq)
+                metrics_single = get_metrics(raw_single, cond_name, needs_filtering, esg_chans, iv_epoch, iv_baseline,
+                                             esg_bp_freq, notch_freq)
+                deviation = np.abs(metrics_single - metrics) / np.abs(metrics)
+                max_metrics = np.fmax(max_metrics, [deviation[0], np.nanmax(deviation[1:len(esg_chans) + 1]),
+                                                    np.nanmax(deviation[len(esg_chans) + 1:])])
+
+        print(f'{method}: max data deviation {max_data:.3g} V, max relative deviation SNR {max_metrics[0]:.3g}, '
+              f'residual intensity {max_metrics[1]:.3g}, INPS power {max_metrics[2]:.3g}')
+        setattr(savedev, method.replace(' ', '_'), np.concatenate([[max_data], max_metrics]))
+
+    # Save to file - [data (V), SNR, residual intensity, INPS power] for each method
+    dataset_keywords = [a for a in dir(savedev) if not a.startswith('__')]
+    with h5py.File("/data/pt_02569/tmp_data/fif_fmt_deviation.h5", "w") as outfile:
+        for keyword in dataset_keywords:
+            outfile.create_dataset(keyword, data=getattr(savedev, keyword))
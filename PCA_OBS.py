@@ -4,6 +4,8 @@ from scipy.signal import filtfilt, detrend
 import matplotlib.pyplot as plt
 from sklearn.decomposition import PCA
 from fit_ecgTemplate import fit_ecgTemplate
+from pca_basis import pca_basis
+from filtfilt_fft import filtfilt_fft
 import math
 import h5py
 
@@ -31,6 +33,8 @@ def PCA_OBS(data, **kwargs):
     ch_names = kwargs['ch_names']
     sub_nr = kwargs['sub_nr']
     condition = kwargs['condition']
+    svd_solver = kwargs.get('svd_solver', 'full')  # Optional, 'full', 'arpack', 'randomized' or 'covariance'
+    filter_backend = kwargs.get('filter_backend', 'direct')  # Optional, 'direct' or 'fft'
     if debug_mode:  # Only need current channel and saving if we're debugging
         current_channel = kwargs['current_channel']
         savename = kwargs['savename']
@@ -86,8 +90,11 @@ def PCA_OBS(data, **kwargs):
     steps = 1 * pa
     peak_count = pa
 
-    # Filter channel
-    eegchan = filtfilt(filter_coords, 1, data)
+    # Filter channel - 'fft' applies the long FIR kernel with overlap-add, 'direct' convolves in the time domain
+    if filter_backend == 'fft':
+        eegchan = filtfilt_fft(filter_coords, data)
+    else:
+        eegchan = filtfilt(filter_coords, 1, data)
 
     # build PCA matrix(heart-beat-epochs x window-length)
     pcamat = np.zeros((peak_count - 1, 2*peak_range+1))  # [epoch x time]
@@ -104,19 +111,28 @@ def PCA_OBS(data, **kwargs):
     ###################################################################
     # Perform PCA with sklearn
     ###################################################################
+    # define selected number of  components using profile likelihood
+    pca_info.nComponents = 4
+
     # run PCA(performs SVD(singular value decomposition))
-    pca = PCA(svd_solver="full")
-    pca.fit(dpcamat)
-    eigen_vectors = pca.components_
-    eigen_values = pca.explained_variance_
-    factor_loadings = pca.components_.T*np.sqrt(pca.explained_variance_)
+    # svd_solver 'full' computes every component, 'arpack', 'randomized' and 'covariance' only the ones used
+    # One extra component is kept by the truncated solvers for the explained variance in the debug plots
+    if svd_solver == 'covariance':
+        eigen_vectors, eigen_values, expl_var = pca_basis(dpcamat, pca_info.nComponents + 1, svd_solver)
+    else:
+        if svd_solver == 'full':
+            pca = PCA(svd_solver="full")
+        else:
+            pca = PCA(n_components=pca_info.nComponents + 1, svd_solver=svd_solver, random_state=0)
+        pca.fit(dpcamat)
+        eigen_vectors = pca.components_
+        eigen_values = pca.explained_variance_
+        expl_var = pca.explained_variance_ratio_
+    factor_loadings = eigen_vectors.T*np.sqrt(eigen_values)
     pca_info.eigen_vectors = eigen_vectors
     pca_info.factor_loadings = factor_loadings
     pca_info.eigen_values = eigen_values
-    pca_info.expl_var = pca.explained_variance_ratio_
-
-    # define selected number of  components using profile likelihood
-    pca_info.nComponents = 4
+    pca_info.expl_var = expl_var
 
     # Creates plots
     if debug_mode:
@@ -173,6 +189,7 @@ def PCA_OBS(data, **kwargs):
     ###################################################################################
     window_start_idx = []
     window_end_idx = []
+    pinv_cache = {}  # template pseudo-inverses, computed once per window shape and shared by all heartbeats
     for p in range(0, peak_count):
         # Deals with start portion of data
         if p == 0:
@@ -184,7 +201,7 @@ def PCA_OBS(data, **kwargs):
                 post_idx_nextPeak = []
                 fitted_art, post_idx_nextPeak = fit_ecgTemplate(data, pca_template, peak_idx[p], peak_range,
                                                                 pre_range, post_range, baseline_range, midP,
-                                                                fitted_art, post_idx_nextPeak, n_samples_fit)
+                                                                fitted_art, post_idx_nextPeak, n_samples_fit, pinv_cache)
                 # Appending to list instead of using counter
                 window_start_idx.append(peak_idx[p] - peak_range)
                 window_end_idx.append(peak_idx[p] + peak_range)
@@ -200,7 +217,8 @@ def PCA_OBS(data, **kwargs):
                 if pre_range > peak_range:
                     pre_range = peak_range
                 fitted_art, _ = fit_ecgTemplate(data, pca_template, peak_idx(p), peak_range, pre_range, post_range,
-                                                baseline_range, midP, fitted_art, post_idx_nextPeak, n_samples_fit)
+                                                baseline_range, midP, fitted_art, post_idx_nextPeak, n_samples_fit,
+                                                pinv_cache)
                 window_start_idx.append(peak_idx[p] - peak_range)
                 window_end_idx.append(peak_idx[p] + peak_range)
             except Exception as e:
@@ -221,7 +239,7 @@ def PCA_OBS(data, **kwargs):
                 aTemplate = pca_template[midP - peak_range-1:midP + peak_range+1, :]
                 fitted_art, post_idx_nextPeak = fit_ecgTemplate(data, aTemplate, peak_idx[p], peak_range, pre_range,
                                                                 post_range, baseline_range, midP, fitted_art,
-                                                                post_idx_nextPeak, n_samples_fit)
+                                                                post_idx_nextPeak, n_samples_fit, pinv_cache)
                 window_start_idx.append(peak_idx[p] - peak_range)
                 window_end_idx.append(peak_idx[p] + peak_range)
             except Exception as e:
@@ -0,0 +1,194 @@
+# Multichannel version of PCA_OBS - takes the whole (channels x samples) ESG array and the QRS events once and runs
+# the filtering, epoching, detrending, SVD and fitting as batched numpy operations rather than one process per channel
+# Use with raw.apply_function(PCA_OBS_multichannel, picks=esg_chans, channel_wise=False, **kwargs)
+# Optionally takes geometry=get_heartbeat_geometry(qrs, n_times) so the heartbeat windows are only computed once
+# and tukey_alpha to multiply each fitted window with a Tukey window (as PCA_OBS_tukey)
+# PCA_OBS_variants shares the filtering, decomposition and per-beat fit between several taper variants and returns
+# the cleaned data of each, e.g. tukey_alphas=[None, 0.25] for the plain and the Tukey cleaned data from one run
+# n_components sets the number of components in the template (default 4), n_components='auto' selects it per channel
+# from the eigenvalue spectrum
+# PCA_OBS_sweep reuses one decomposition for every number of components up to max_components
+# model_fname saves the artefact model (save_artefact_model) so the variants can be rebuilt without refitting
+
+import numpy as np
+from scipy.signal import filtfilt
+from fit_ecgTemplate_multichannel import project_ecgTemplate_multichannel, assemble_fitted_art, fit_ecgTemplate_sweep
+from pca_basis import pca_basis
+from get_heartbeat_geometry import get_heartbeat_geometry
+from filtfilt_fft import filtfilt_fft
+from get_ncomponents import get_ncomponents
+from save_artefact_model import save_artefact_model
+
+
+def PCA_OBS_multichannel(data, **kwargs):
+    tukey_alpha = kwargs.get('tukey_alpha', None)  # Optional, None for the plain fitted artefact
+    cleaned = PCA_OBS_variants(data, tukey_alphas=[tukey_alpha], **kwargs)
+
+    return cleaned[tukey_alpha]
+
+
+# Filtering, heartbeat matrix and PCA decomposition shared by PCA_OBS_variants and PCA_OBS_sweep
+# n_components is the number of factor loadings in the template - an int, or 'auto' to choose it for each channel
+# from its eigenvalue spectrum with profile likelihood (get_ncomponents), up to max_components
+def PCA_OBS_decomposition(data, caller, **kwargs):
+
+    # Declare class to hold pca information
+    class PCAInfo():
+        def __init__(self):
+            pass
+
+    # Instantiate class
+    pca_info = PCAInfo()
+
+    # Check all necessary arguments sent in
+    required_kws = ["qrs", "filter_coords", "sr"]
+    assert all([kw in kwargs.keys() for kw in required_kws]), f"Error. Some KWs not passed into {caller}."
+
+    # Extract all kwargs
+    qrs = kwargs['qrs']
+    filter_coords = kwargs['filter_coords']
+    sr = kwargs['sr']
+    svd_solver = kwargs.get('svd_solver', 'full')  # Optional, 'full', 'covariance', 'randomized' or 'arpack'
+    filter_backend = kwargs.get('filter_backend', 'direct')  # Optional, 'direct' or 'fft'
+    n_components = kwargs.get('n_components', 4)  # Optional, number of components or 'auto'
+    max_components = kwargs.get('max_components', 10)  # Optional, upper limit for 'auto'
+
+    # set to baseline - each row is a channel
+    data = np.atleast_2d(data)
+    data = data - np.mean(data, axis=1, keepdims=True)
+    n_times = data.shape[1]
+
+    # Heartbeat geometry - shared between channels and with the annotation step, pass it in if already computed
+    if 'geometry' in kwargs.keys():
+        geometry = kwargs['geometry']
+    else:
+        geometry = get_heartbeat_geometry(qrs, n_times)
+    peak_idx = geometry.peak_idx
+    peak_count = geometry.peak_count
+    peak_range = geometry.peak_range
+
+    print('Pulse artifact subtraction in progress...Please wait!')
+
+    # Filter all channels at once
+    # 'fft' applies the long FIR kernel with overlap-add, 'direct' convolves in the time domain
+    if filter_backend == 'fft':
+        eegchan = filtfilt_fft(filter_coords, data)
+    else:
+        eegchan = filtfilt(filter_coords, 1, data, axis=1)
+
+    # build PCA tensor (channels x heart-beat-epochs x window-length), first beat is skipped as in PCA_OBS
+    # Every window must lie inside the data - PCA_OBS fails on one that doesn't, while indexing with the window would
+    # wrap a negative start around to the end of the recording
+    window = np.arange(-peak_range, peak_range+1)
+    assert peak_count > 1 and peak_idx[1] - peak_range >= 0 and peak_idx[peak_count - 1] + peak_range < n_times, \
+        "Error. The PCA template window of a heartbeat runs over the ends of the data."
+    pcamat = eegchan[:, peak_idx[1:peak_count, np.newaxis] + window]  # [channel x epoch x time]
+    del eegchan
+
+    # detrending matrix
+    pcamat = pcamat - np.mean(pcamat, axis=2, keepdims=True)  # detrended along the epoch
+    mean_effect = np.mean(pcamat, axis=1)  # [channel x time], contains the mean over all epochs
+
+    ###################################################################
+    # Perform PCA via batched SVD - equivalent to sklearn PCA(svd_solver="full") for each channel
+    # svd_solver 'covariance', 'randomized' or 'arpack' only compute the components that can be used
+    ###################################################################
+    if n_components == 'auto':
+        n_computed = max_components + 1  # One more than can be selected, so the trailing group is never empty
+    else:
+        n_computed = n_components
+
+    if svd_solver == 'full':
+        eigen_vectors, eigen_values, expl_var = pca_basis(pcamat, None, svd_solver)  # [channel x component x time]
+    else:
+        eigen_vectors, eigen_values, expl_var = pca_basis(pcamat, n_computed, svd_solver)
+    del pcamat
+    pca_info.eigen_vectors = eigen_vectors
+    pca_info.eigen_values = eigen_values
+    pca_info.expl_var = expl_var
+    pca_info.meanEffect = mean_effect
+
+    # define selected number of  components using profile likelihood
+    if n_components == 'auto':
+        pca_info.nComponents = get_ncomponents(eigen_values, max_components)  # One per channel
+        pca_info.maxComponents = max_components
+    else:
+        pca_info.nComponents = np.full(data.shape[0], n_components)
+        pca_info.maxComponents = n_components
+
+    return data, geometry, pca_info
+
+
+# Template of the ECG artefact [channel x time x (1 + nComponents)] from the mean effect and factor loadings
+# Channels that keep fewer components than the largest have the extra loadings set to zero, which the pseudo-inverse
+# in the fit ignores
+def get_pca_template(pca_info, n_components):
+    factor_loadings = np.transpose(pca_info.eigen_vectors[:, 0:n_components, :], (0, 2, 1)) * \
+        np.sqrt(pca_info.eigen_values[:, np.newaxis, 0:n_components])
+    factor_loadings = factor_loadings * (np.arange(0, n_components) < pca_info.nComponents[:, np.newaxis, np.newaxis])
+
+    return np.concatenate([pca_info.meanEffect[:, :, np.newaxis], factor_loadings], axis=2)
+
+
+# Actually subtract the artefact, return needs to be the same shape as input data
+# One sample shift purely due to the fact the r-peaks are currently detected in MATLAB
+def subtract_fitted_art(data, fitted_art):
+    data_ = np.zeros(data.shape)
+    data_[:, 0] = data[:, 0]
+    data_[:, 1:] = data[:, 1:] - fitted_art[:, :-1]
+
+    return data_
+
+
+def PCA_OBS_variants(data, **kwargs):
+    tukey_alphas = kwargs.get('tukey_alphas', [None])  # Optional, None for plain and/or alpha of each Tukey variant
+    model_fname = kwargs.get('model_fname', None)  # Optional, .h5 file to save the artefact model to
+    model_ch_names = kwargs.get('model_ch_names', None)  # Optional, channel names stored with the artefact model
+
+    channel_mean = np.mean(np.atleast_2d(data), axis=1)
+    data, geometry, pca_info = PCA_OBS_decomposition(data, 'PCA_OBS_variants', **kwargs)
+
+    #######################################################################
+    # Make template of the ECG artefact [channel x time x (1 + nComponents)]
+    #######################################################################
+    pca_template = get_pca_template(pca_info, int(np.max(pca_info.nComponents)))
+
+    ###################################################################################
+    # Data Fitting
+    ###################################################################################
+    coeffs, edge_fit = project_ecgTemplate_multichannel(data, pca_template, geometry)
+    fitted_arts = assemble_fitted_art(data.shape[0], pca_template, coeffs, edge_fit, geometry, tukey_alphas)
+
+    # The template and coefficients are enough to rebuild any variant later (load_artefact_model)
+    if model_fname is not None:
+        save_artefact_model(model_fname, pca_template, coeffs, edge_fit, geometry, channel_mean, kwargs['sr'],
+                            model_ch_names)
+
+    cleaned = {}
+    for alpha, fitted_art in fitted_arts.items():
+        cleaned[alpha] = subtract_fitted_art(data, fitted_art)
+
+    return cleaned
+
+
+# Sweeps the number of components from one decomposition - a generator yielding (k, array) for k = 0 (mean effect
+# only) up to max_components, with the cleaned data (output='cleaned') or the shifted artefact estimate that was
+# subtracted from it (output='artefact') for every k
+# Takes the same kwargs as PCA_OBS_variants, plus a single optional tukey_alpha
+# for k, cleaned in PCA_OBS_sweep(data, max_components=8, **kwargs): ...
+def PCA_OBS_sweep(data, **kwargs):
+    max_components = kwargs.get('max_components', 10)  # Optional, largest number of components in the sweep
+    output = kwargs.get('output', 'cleaned')  # Optional, 'cleaned' or 'artefact'
+    tukey_alpha = kwargs.get('tukey_alpha', None)  # Optional, None for the plain fitted artefact
+    assert output in ['cleaned', 'artefact'], "Error. Unknown output passed into PCA_OBS_sweep."
+    kwargs['n_components'] = max_components
+
+    data, geometry, pca_info = PCA_OBS_decomposition(data, 'PCA_OBS_sweep', **kwargs)
+    pca_template = get_pca_template(pca_info, max_components)
+
+    for k, fitted_art in fit_ecgTemplate_sweep(data, pca_template, geometry, tukey_alpha):
+        cleaned = subtract_fitted_art(data, fitted_art)
+        if output == 'cleaned':
+            yield k, cleaned
+        else:
+            yield k, data - cleaned
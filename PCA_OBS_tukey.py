@@ -171,6 +171,7 @@ def PCA_OBS_tukey(data, **kwargs):
     ###################################################################################
     window_start_idx = []
     window_end_idx = []
+    pinv_cache = {}  # template pseudo-inverses, computed once per window shape and shared by all heartbeats
     for p in range(0, peak_count):
         # Deals with start portion of data
         if p == 0:
@@ -183,7 +184,8 @@ def PCA_OBS_tukey(data, **kwargs):
                 post_idx_nextPeak = []
                 fitted_art, post_idx_nextPeak = fit_ecgTemplate_tukey(data, pca_template, peak_idx[p], peak_range,
                                                                 pre_range, post_range, baseline_range, midP,
-                                                                fitted_art, post_idx_nextPeak, n_samples_fit, plot_tukey)
+                                                                fitted_art, post_idx_nextPeak, n_samples_fit, plot_tukey,
+                                                                pinv_cache)
                 # Appending to list instead of using counter
                 window_start_idx.append(peak_idx[p] - peak_range)
                 window_end_idx.append(peak_idx[p] + peak_range)
@@ -201,7 +203,7 @@ def PCA_OBS_tukey(data, **kwargs):
                     pre_range = peak_range
                 fitted_art, _ = fit_ecgTemplate_tukey(data, pca_template, peak_idx(p), peak_range, pre_range, post_range,
                                                       baseline_range, midP, fitted_art, post_idx_nextPeak, n_samples_fit,
-                                                      plot_tukey)
+                                                      plot_tukey, pinv_cache)
                 window_start_idx.append(peak_idx[p] - peak_range)
                 window_end_idx.append(peak_idx[p] + peak_range)
             except Exception as e:
@@ -223,7 +225,7 @@ def PCA_OBS_tukey(data, **kwargs):
                 aTemplate = pca_template[midP - peak_range-1:midP + peak_range+1, :]
                 fitted_art, post_idx_nextPeak = fit_ecgTemplate_tukey(data, aTemplate, peak_idx[p], peak_range, pre_range,
                                                                 post_range, baseline_range, midP, fitted_art,
-                                                                post_idx_nextPeak, n_samples_fit, plot_tukey)
+                                                                post_idx_nextPeak, n_samples_fit, plot_tukey, pinv_cache)
                 window_start_idx.append(peak_idx[p] - peak_range)
                 window_end_idx.append(peak_idx[p] + peak_range)
             except Exception as e:
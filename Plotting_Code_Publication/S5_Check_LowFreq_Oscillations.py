@@ -11,6 +11,7 @@ from scipy.io import loadmat
 import matplotlib.pyplot as plt
 import seaborn as sns
 from Metrics.inps_yasa import get_harmonics
+from get_ssp_raw import get_ssp_raw
 import matplotlib as mpl
 mpl.rcParams['pdf.fonttype'] = 42
 
@@ -130,8 +131,7 @@ if __name__ == '__main__':
             ##########################################################################
             # SSP6
             ##########################################################################
-            input_path = f"/data/p_02569/SSP/{subject_id}/6 projections/"
-            raw_ssp6 = mne.io.read_raw_fif(f"{input_path}ssp_cleaned_{cond_name}.fif", preload=True)
+            raw_ssp6 = get_ssp_raw(subject_id, cond_name, 6, preload=True)
             # raw_ssp6 = raw_ssp6.pick_channels(channel)
             events, event_ids = mne.events_from_annotations(raw_ssp6)
             event_id_dict = {key: value for key, value in event_ids.items() if key == trigger_name}
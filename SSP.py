@@ -9,6 +9,10 @@ from epoch_data import rereference_data
 from get_conditioninfo import *
 import numpy as np
 import matplotlib.pyplot as plt
+from fif_fmt import get_fif_fmt
+from job_limit import get_n_jobs
+from get_filtered_raw import get_filtered_raw
+from get_ssp_raw import get_ssp_fname
 
 
 def apply_SSP(subject, condition, srmr_nr, sampling_rate):
@@ -37,67 +41,44 @@ def apply_SSP(subject, condition, srmr_nr, sampling_rate):
 
     # load dirty (prepared) ESG data
     fname = f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif'
-
-    # for n in np.arange(5, 21):
-    for n in np.arange(1, 21):
-        raw = mne.io.read_raw_fif(load_path + fname, preload=True)
-
-        ############################################# SSP ##############################################
-        # create_ecg_epochs detects r-peaks and creates epochs around the r-wave peaks, capturing heartbeats
-        # ecg_evoked = mne.preprocessing.create_ecg_epochs(raw, ch_name='ECG').average()
-        # ecg_evoked.plot()
-
-        # ecg_evoked.apply_baseline((None, None))
-        # ecg_evoked.plot()
-
-        # n = 10
-        # Leaving everything default values
-        projs, events = mne.preprocessing.compute_proj_ecg(raw, n_eeg=n, reject=None, n_jobs=len(raw.ch_names),
-                                                           ch_name='ECG')
-
-        # Apply projections (clean data)
-        clean_raw = raw.copy().add_proj(projs)
-        clean_raw = clean_raw.apply_proj()
-
-        ########################### Re - Reference ####################################
-
-        # Fz reference
-        raw_FzRef = rereference_data(clean_raw, 'Fz-TH6')
-
-        # anterior reference
-        # if nerve == 1:
-        #     raw_antRef = rereference_data(clean_raw, 'AC')
-        # elif nerve == 2:
-        #     raw_antRef = rereference_data(clean_raw, 'AL')
-
-        # add reference channel to data - make sure recording reference is included
-        mne.add_reference_channels(clean_raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-
-        ########################### Filtering ############################################
-
-        clean_raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-                         iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-        # raw_FzRef.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw_FzRef.ch_names), method='iir',
-        #                  iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-        # raw_antRef.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw_antRef.ch_names), method='iir',
-        #                   iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-
-        clean_raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
-        # raw_FzRef.notch_filter(freqs=notch_freq, n_jobs=len(raw_FzRef.ch_names), method='fir', phase='zero')
-        # raw_antRef.notch_filter(freqs=notch_freq, n_jobs=len(raw_antRef.ch_names), method='fir', phase='zero')
-
-        ######################################### Plots ##############################################
-        # Epoch around spinal triggers and plot
-        # Need to do this with projections applied aka clean raw object
-        events, event_ids = mne.events_from_annotations(clean_raw)
-        event_id_dict = {key: value for key, value in event_ids.items() if key == trigger_name}
-        epochs = mne.Epochs(clean_raw, events, event_id=event_id_dict, tmin=iv_epoch[0], tmax=iv_epoch[1],
-                            baseline=tuple(iv_baseline))
-
-        savename = save_path + "/" + str(n) + " projections/"
-        os.makedirs(savename, exist_ok=True)
-
-        # Save the SSP cleaned data for future comparison
-        clean_raw.save(f"{savename}ssp_cleaned_{cond_name}.fif", fmt='double', overwrite=True)
-        # raw_antRef.save(f"{savename}ssp_cleaned_{cond_name}_antRef.fif", fmt='double', overwrite=True)
-        # raw_FzRef.save(f"{savename}ssp_cleaned_{cond_name}_FzRef.fif", fmt='double', overwrite=Tr
+    raw = mne.io.read_raw_fif(load_path + fname, preload=True)
+
+    ############################################# SSP ##############################################
+    # create_ecg_epochs detects r-peaks and creates epochs around the r-wave peaks, capturing heartbeats
+    # ecg_evoked = mne.preprocessing.create_ecg_epochs(raw, ch_name='ECG').average()
+    # ecg_evoked.plot()
+
+    # ecg_evoked.apply_baseline((None, None))
+    # ecg_evoked.plot()
+
+    # n_projs = np.arange(5, 21)
+    n_projs = np.arange(1, 21)
+    # Leaving everything default values
+    # The projectors are the first n_eeg left singular vectors of the evoked ECG response, so the R-peaks, epochs and
+    # SVD are computed once for the most projectors and the first n of them kept for each n
+    projs, events = mne.preprocessing.compute_proj_ecg(raw, n_eeg=max(n_projs), reject=None,
+                                                       n_jobs=get_n_jobs(len(raw.ch_names)), ch_name='ECG')
+    n_existing = len(raw.info['projs'])  # Projectors already in raw come first
+
+    ########################### Filtering ############################################
+    # add reference channel to data - make sure recording reference is included - and filter, once for all n
+    # Projection mixes the channels at each sample and filtering acts on each channel over time, both linearly, so
+    # projecting the filtered data equals filtering the projected data
+    raw_filtered = get_filtered_raw(load_path + fname, esg_bp_freq, notch_freq, 'TH6')
+
+    ########################### Re - Reference ####################################
+    # Fz reference
+    # raw_FzRef = rereference_data(clean_raw, 'Fz-TH6')
+
+    # anterior reference
+    # if nerve == 1:
+    #     raw_antRef = rereference_data(clean_raw, 'AC')
+    # elif nerve == 2:
+    #     raw_antRef = rereference_data(clean_raw, 'AL')
+
+    # Save the filtered data once, with the projectors of every n stored inactive - rather than a cleaned copy per n,
+    # get_ssp_raw gives the SSP cleaned data for any n by applying the first n projectors as the data is read
+    raw_filtered.add_proj(projs[n_existing:])
+    raw_filtered.save(get_ssp_fname(subject_id, cond_name), fmt=get_fif_fmt(), overwrite=True)
+    # raw_antRef.save(f"{savename}ssp_cleaned_{cond_name}_antRef.fif", fmt='double', overwrite=True)
+    # raw_FzRef.save(f"{savename}ssp_cleaned_{cond_name}_FzRef.fif", fmt='double', overwrite=True)
@@ -0,0 +1,88 @@
+# Parallel version of raw.apply_function(fun, picks=chans, n_jobs=n_jobs, **kwargs) for per-channel functions
+# raw.apply_function sends the full-length data of each channel and all kwargs (filter coefficients, QRS or trigger
+# indices) to a worker and copies the result back, which for 10kHz imports is gigabytes of pickling per block
+# Here the picked channels are copied once into shared memory and the kwargs are handed to each worker process once
+# when it starts (inherited when forked). Workers are only sent row numbers, run fun on their rows and write the
+# result straight back into the shared buffer, returning nothing
+# apply_function_shared(raw, apply_sos, picks='data', n_jobs=len(raw.ch_names), sos=sos, padlen=padlen)
+
+import numpy as np
+import mne
+import multiprocessing
+from multiprocessing import shared_memory
+from job_limit import get_n_jobs
+
+# State of each worker process, set once by init_worker
+worker_state = {}
+
+
+# The shared buffer is mapped before the fork, so workers write to the same memory as the parent - each worker makes
+# its own view of it, the only view in the parent is the one apply_function_shared drops before closing the buffer
+def init_worker(shm, shape, dtype, fun, kwargs):
+    worker_state['data'] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    worker_state['fun'] = fun
+    worker_state['kwargs'] = kwargs
+
+
+# Runs the function on each row in place
+def run_rows(rows):
+    data = worker_state['data']
+    for row in rows:
+        data[row, :] = worker_state['fun'](data[row, :].copy(), **worker_state['kwargs'])
+
+
+def apply_function_shared(raw, fun, picks, n_jobs=1, **kwargs):
+    # Modifies raw in place, as raw.apply_function with channel_wise=True
+    assert raw.preload, "Error. Data must be preloaded for apply_function_shared."
+    picks = get_picks(raw.info, picks)
+    n_jobs = max(min(get_n_jobs(n_jobs), len(picks), multiprocessing.cpu_count()), 1)  # Within the limit of the task
+
+    # Run in this process if there's nothing to share
+    if n_jobs == 1:
+        for pick in picks:
+            raw._data[pick, :] = fun(raw._data[pick, :].copy(), **kwargs)
+        return raw
+
+    # One copy of the picked channels into shared memory
+    shape = (len(picks), raw.n_times)
+    dtype = raw._data.dtype
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    data = None
+    try:
+        data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        data[:] = raw._data[picks, :]
+
+        # Fork so the function and kwargs are inherited rather than pickled, each worker gets a block of rows
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(n_jobs, initializer=init_worker, initargs=(shm, shape, dtype, fun, kwargs)) as pool:
+            pool.map(run_rows, np.array_split(np.arange(0, len(picks)), n_jobs))
+
+        raw._data[picks, :] = data
+    finally:
+        # Closing the buffer raises BufferError while a view of it is left, which would hide any error raised above
+        del data
+        shm.close()
+        shm.unlink()
+
+    return raw
+
+
+# Indices of picks given as channel names, indices, channel types, 'data' (the data channels) or 'all', as
+# raw.apply_function takes them
+def get_picks(info, picks):
+    if isinstance(picks, str):
+        picks = [picks]
+    picks = list(picks)
+    if picks == ['all']:
+        return np.arange(len(info['ch_names']))
+    if picks == ['data']:
+        return mne.pick_types(info, meg=True, eeg=True, seeg=True, ecog=True, dbs=True, fnirs=True, csd=True,
+                              ref_meg=False, exclude=())
+    if all(isinstance(pick, str) for pick in picks):
+        if all(pick in info['ch_names'] for pick in picks):
+            return mne.pick_channels(info['ch_names'], include=picks, ordered=True)
+        idx = np.flatnonzero(np.isin(info.get_channel_types(), picks))  # Channel types
+        assert len(idx) > 0, f"Error. No channels of types {picks}."
+        return idx
+
+    return np.asarray(picks, dtype=int)
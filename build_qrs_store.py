@@ -0,0 +1,37 @@
+# One-time build of the QRS event store from the MATLAB files in QRS_Timing/sub-XXX/raw_{sr}_spinal_{cond}.mat
+# All QRS indices are packed into one int32 array (qrs_store.npy) with an index of where each subject and condition
+# starts and stops (qrs_store_index.npy), so get_qrs can memory map the store and return views into it rather than
+# loading a .mat file every time
+# Run once (and again if QRS_Timing changes): python build_qrs_store.py
+
+import os
+import glob
+import numpy as np
+from scipy.io import loadmat
+
+qrs_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'QRS_Timing')
+store_fname = os.path.join(qrs_path, 'qrs_store.npy')
+index_fname = os.path.join(qrs_path, 'qrs_store_index.npy')
+
+
+def build_qrs_store():
+    index = []
+    events = []
+    start = 0
+    for fname in sorted(glob.glob(os.path.join(qrs_path, 'sub-*', 'raw_*_spinal_*.mat'))):
+        subject_id = os.path.basename(os.path.dirname(fname))
+        _, sampling_rate, _, cond_name = os.path.splitext(os.path.basename(fname))[0].split('_')
+        QRSevents = loadmat(fname)['QRSevents'].reshape(-1).astype(np.int32)
+        index.append((subject_id, cond_name, int(sampling_rate), start, start + len(QRSevents)))
+        events.append(QRSevents)
+        start += len(QRSevents)
+
+    index = np.array(index, dtype=[('subject_id', 'U8'), ('cond_name', 'U16'), ('sampling_rate', 'i4'),
+                                   ('start', 'i8'), ('stop', 'i8')])
+    np.save(store_fname, np.concatenate(events))
+    np.save(index_fname, index)
+    print(f'Packed {len(index)} QRS event files into {store_fname}')
+
+
+if __name__ == '__main__':
+    build_qrs_store()
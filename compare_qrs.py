@@ -0,0 +1,44 @@
+# Cross-checks detected R peaks against reference QRS events (e.g. detect_qrs against QRS_Timing via get_qrs)
+# Each reference beat is matched to the nearest detected peak within tolerance_sec, and the detection is summarised
+# by the sensitivity (matched / reference beats), positive predictive value (matched / detected peaks) and the offset
+# of the matched peaks in samples
+
+import numpy as np
+
+
+def compare_qrs(detected, reference, sr, tolerance_sec=0.05):
+    # Declare class to hold the comparison
+    class QRSComparison():
+        def __init__(self):
+            pass
+
+    detected = np.sort(np.asarray(detected).reshape(-1))
+    reference = np.sort(np.asarray(reference).reshape(-1))
+    tolerance = int(round(tolerance_sec * sr))
+
+    # Nearest detected peak of each reference beat
+    pos = np.clip(np.searchsorted(detected, reference), 1, max(len(detected) - 1, 1))
+    if len(detected) > 1:
+        nearest = np.where(np.abs(detected[pos - 1] - reference) <= np.abs(detected[pos] - reference),
+                           detected[pos - 1], detected[pos])
+    elif len(detected) == 1:
+        nearest = np.repeat(detected, len(reference))
+    else:
+        nearest = np.full(len(reference), np.iinfo(np.int64).max // 2)
+    offset = nearest - reference
+    matched = np.abs(offset) <= tolerance
+
+    comparison = QRSComparison()
+    comparison.n_reference = len(reference)
+    comparison.n_detected = len(detected)
+    comparison.n_matched = len(np.unique(nearest[matched]))
+    comparison.sensitivity = comparison.n_matched / max(len(reference), 1)
+    comparison.ppv = comparison.n_matched / max(len(detected), 1)
+    comparison.offset = offset[matched]
+    comparison.median_offset = np.median(offset[matched]) if np.any(matched) else np.nan
+
+    print(f'QRS detection: {comparison.n_detected} detected, {comparison.n_reference} reference, '
+          f'sensitivity {comparison.sensitivity:.3f}, PPV {comparison.ppv:.3f}, '
+          f'median offset {comparison.median_offset} samples')
+
+    return comparison
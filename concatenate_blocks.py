@@ -0,0 +1,69 @@
+# Concatenates the processed blocks of a condition into one preallocated array
+# mne.concatenate_raws([raw_concat, raw]) reallocates and copies everything concatenated so far for every block, here
+# the final array is allocated once from the block lengths (read from the headers) and each block is written to its
+# slice as soon as it has been processed
+# Annotations of each block are shifted to where the block starts and the joins are marked with 'BAD boundary' and
+# 'EDGE boundary' annotations, as mne.concatenate_raws does
+# blocks = allocate_blocks(block_lengths)
+# add_block(blocks, iblock, raw)  # For each block
+# raw_concat = get_concatenated(blocks)
+
+import numpy as np
+import mne
+
+
+def allocate_blocks(block_lengths):
+    # Declare class to hold the blocks
+    class Blocks():
+        def __init__(self):
+            pass
+
+    blocks = Blocks()
+    blocks.lengths = np.asarray(block_lengths, dtype=int)
+    blocks.offsets = np.concatenate([[0], np.cumsum(blocks.lengths)])
+    blocks.data = None  # Allocated with the first block, once the number of channels is known
+    blocks.info = None
+    blocks.onset = []
+    blocks.duration = []
+    blocks.description = []
+    blocks.ch_names = []
+
+    return blocks
+
+
+def add_block(blocks, iblock, raw):
+    assert raw.n_times == blocks.lengths[iblock], f"Error. Block {iblock} has {raw.n_times} samples, " \
+                                                  f"{blocks.lengths[iblock]} were allocated."
+    assert raw.first_samp == 0, "Error. Blocks must start at sample 0."
+    if blocks.data is None:
+        blocks.data = np.zeros((len(raw.ch_names), blocks.offsets[-1]))
+        blocks.info = raw.info.copy()
+    assert raw.ch_names == blocks.info['ch_names'], "Error. All blocks must have the same channels."
+
+    # Write the block to its slice
+    blocks.data[:, blocks.offsets[iblock]:blocks.offsets[iblock + 1]] = raw.get_data()
+
+    # With the block starting at sample 0 the onsets are relative to the start of the block
+    start = blocks.offsets[iblock] / raw.info['sfreq']
+    if iblock > 0:
+        for description in ['BAD boundary', 'EDGE boundary']:
+            blocks.onset.append(start)
+            blocks.duration.append(0.0)
+            blocks.description.append(description)
+            blocks.ch_names.append(())
+    blocks.onset += list(raw.annotations.onset + start)
+    blocks.duration += list(raw.annotations.duration)
+    blocks.description += list(raw.annotations.description)
+    blocks.ch_names += list(raw.annotations.ch_names)
+
+
+def get_concatenated(blocks):
+    # Raw structure of all blocks, with the channel info of the first one
+    raw_concat = mne.io.RawArray(blocks.data, blocks.info)
+    order = np.argsort(blocks.onset, kind='stable')
+    annotations = mne.Annotations(onset=np.array(blocks.onset)[order], duration=np.array(blocks.duration)[order],
+                                  description=np.array(blocks.description)[order],
+                                  ch_names=[blocks.ch_names[i] for i in order], orig_time=blocks.info['meas_date'])
+    raw_concat.set_annotations(annotations)
+
+    return raw_concat
@@ -0,0 +1,152 @@
+# R-peak detection in the style of Pan & Tompkins (1985), run chunk by chunk on the ECG channel
+# Each chunk is band-passed (5-15Hz), differentiated, squared and integrated over a 150ms moving window, with the
+# filter states carried from one chunk to the next so the chunks join up seamlessly
+# Local maxima of the integrated signal are classed as QRS or noise with adaptive signal/noise levels, a 200ms
+# refractory period, a T wave check and a search back with the lower threshold when no beat was found for 1.66 x the
+# mean RR
+# The R peak of each beat is the largest deflection of the ECG (after removing slow drifts) around the largest
+# band-passed deflection in the window leading up to the integrated peak
+# Only the last 5s of the signals, and of the noise peaks, are kept between chunks
+# qrs = detect_qrs(raw.get_data(picks='ECG')[0], raw.info['sfreq'])
+
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi, lfilter
+
+
+def detect_qrs(ecg, sr, chunk_sec=60):
+    # Declare class to hold the state carried between chunks
+    class QRSState():
+        def __init__(self):
+            pass
+
+    ecg = np.asarray(ecg, dtype=float).reshape(-1)
+    n_times = len(ecg)
+
+    # Processing chain
+    sos_bp = butter(2, [5, 15], btype='bandpass', fs=sr, output='sos')
+    sos_hp = butter(2, 1, btype='highpass', fs=sr, output='sos')  # Only used to place the R peak
+    b_diff = np.array([1, 2, 0, -2, -1]) * sr / 8  # Five point derivative
+    n_mwi = int(round(0.15 * sr))  # 150ms moving window integration
+
+    state = QRSState()
+    state.sr = sr
+    state.refractory = int(round(0.2 * sr))
+    state.t_wave = int(round(0.36 * sr))  # Peaks closer than this to the last beat might be T waves
+    state.search_len = n_mwi + int(round(0.05 * sr))  # Integrated peak lags the R peak by the window + filter delay
+    lookback = int(round(5 * sr))  # Enough for beats found by search back up to 1.66 x RR ago
+    # Search back only takes noise peaks whose R peak window is still in the buffers, so after a beat-free stretch
+    # longer than that (lead-off, flat segment) the result does not depend on where the chunks start
+    state.search_back = lookback - state.search_len - int(round(0.05 * sr))
+    state.zi_hp = sosfilt_zi(sos_hp) * ecg[0]
+    state.zi_bp = np.zeros((sos_bp.shape[0], 2))
+    state.zi_diff = np.zeros(len(b_diff) - 1)
+    state.zi_mwi = np.zeros(n_mwi - 1)
+    state.tail_start = 0  # Sample index of the first sample kept in the buffers below
+    state.ecg_hp = np.zeros(0)
+    state.ecg_bp = np.zeros(0)
+    state.mwi = np.zeros(0)
+    state.next_candidate = 1  # First sample of the integrated signal not yet checked for a local maximum
+    state.spki = None  # Signal level, initialised from the first 2s
+    state.npki = 0.
+    state.qrs = []  # Integrated peaks of the beats
+    state.qrs_amp = []
+    state.noise = []  # Noise peaks since the last beat, for search back [(index, amplitude)]
+    state.rr = []
+    state.r_peaks = []
+
+    chunk = int(chunk_sec * sr)
+    for start in np.arange(0, n_times, chunk):
+        x = ecg[start:min(start + chunk, n_times)]
+
+        # Vectorised over the chunk, filter states carried over from the previous one
+        x_hp, state.zi_hp = sosfilt(sos_hp, x, zi=state.zi_hp)
+        x_bp, state.zi_bp = sosfilt(sos_bp, x, zi=state.zi_bp)
+        x_diff, state.zi_diff = lfilter(b_diff, 1, x_bp, zi=state.zi_diff)
+        x_mwi, state.zi_mwi = lfilter(np.ones(n_mwi) / n_mwi, 1, x_diff**2, zi=state.zi_mwi)
+
+        state.ecg_hp = np.concatenate([state.ecg_hp, x_hp])
+        state.ecg_bp = np.concatenate([state.ecg_bp, x_bp])
+        state.mwi = np.concatenate([state.mwi, x_mwi])
+        if state.spki is None:
+            n_init = min(int(2 * sr), len(state.mwi))
+            state.spki = 0.25 * np.max(state.mwi[:n_init])
+            state.npki = 0.5 * np.mean(state.mwi[:n_init])
+
+        # Local maxima of the integrated signal - the last sample needs the next chunk to be checked
+        mwi = state.mwi
+        idx = np.arange(state.next_candidate - state.tail_start, len(mwi) - 1)
+        idx = idx[(mwi[idx] > mwi[idx - 1]) & (mwi[idx] >= mwi[idx + 1])]
+        state.next_candidate = state.tail_start + len(mwi) - 1
+
+        # Adaptive thresholds are sequential, one decision per peak
+        for i in idx:
+            classify_peak(state, i + state.tail_start, mwi[i])
+
+        # Place the R peaks of the beats that can no longer be replaced
+        while len(state.r_peaks) < len(state.qrs) and \
+                state.next_candidate - state.qrs[len(state.r_peaks)] > state.refractory:
+            state.r_peaks.append(locate_r_peak(state, state.qrs[len(state.r_peaks)]))
+
+        # Keep only the last 5s
+        keep = max(len(mwi) - lookback, 0)
+        state.ecg_hp = state.ecg_hp[keep:]
+        state.ecg_bp = state.ecg_bp[keep:]
+        state.mwi = state.mwi[keep:]
+        state.tail_start += keep
+        state.noise = [(i, a) for i, a in state.noise if i >= state.tail_start]
+
+    while len(state.r_peaks) < len(state.qrs):
+        state.r_peaks.append(locate_r_peak(state, state.qrs[len(state.r_peaks)]))
+
+    return np.unique(state.r_peaks).astype(int)
+
+
+# Classifies one local maximum of the integrated signal as QRS or noise and updates the levels
+def classify_peak(state, idx, amp):
+    threshold1 = state.npki + 0.25 * (state.spki - state.npki)
+    threshold2 = 0.5 * threshold1
+
+    if len(state.qrs) > 0 and idx - state.qrs[-1] < state.refractory:
+        # Same complex as the last beat - keep the larger peak
+        if amp > state.qrs_amp[-1]:
+            state.qrs[-1] = idx
+            state.qrs_amp[-1] = amp
+        return
+
+    # No beat for 1.66 x the mean RR, take the largest noise peak above the lower threshold as a missed beat
+    if len(state.rr) > 0 and idx - state.qrs[-1] > 1.66 * np.mean(state.rr[-8:]):
+        missed = [(i, a) for i, a in state.noise if a > threshold2 and idx - i <= state.search_back]
+        if len(missed) > 0:
+            i, a = max(missed, key=lambda m: m[1])
+            add_qrs(state, i, a, 0.25)
+
+    # Peaks shortly after a beat and much smaller than it are T waves
+    t_wave = len(state.qrs) > 0 and idx - state.qrs[-1] < state.t_wave and amp < 0.5 * state.qrs_amp[-1]
+    if amp > threshold1 and not t_wave:
+        add_qrs(state, idx, amp, 0.125)
+    else:
+        state.npki = 0.125 * amp + 0.875 * state.npki
+        state.noise.append((idx, amp))
+
+
+def add_qrs(state, idx, amp, weight):
+    if len(state.qrs) > 0:
+        state.rr.append(idx - state.qrs[-1])
+    state.qrs.append(idx)
+    state.qrs_amp.append(amp)
+    state.spki = weight * amp + (1 - weight) * state.spki
+    state.noise = []
+
+
+# Sample of the R peak of the beat with its integrated peak at qrs
+def locate_r_peak(state, qrs):
+    q = qrs - state.tail_start
+    assert q >= 0, f"Error. Beat at sample {qrs} is no longer in the buffers (from sample {state.tail_start})."
+    lo = max(q - state.search_len, 0)
+    bp_peak = lo + np.argmax(np.abs(state.ecg_bp[lo:q + 1]))
+
+    # Largest deflection of the drift-free ECG within 50ms, whichever the polarity of the lead
+    lo = max(bp_peak - int(round(0.05 * state.sr)), 0)
+    hi = min(bp_peak + int(round(0.05 * state.sr)) + 1, len(state.ecg_hp))
+
+    return lo + np.argmax(np.abs(state.ecg_hp[lo:hi])) + state.tail_start
@@ -2,6 +2,8 @@ import mne
 from get_conditioninfo import *
 from scipy.io import loadmat
 import os
+from fif_fmt import get_fif_fmt
+from get_filtered_raw import get_filtered_raw
 
 def rereference_data(raw, ch_name):
     if ch_name in raw.ch_names:
@@ -26,14 +28,21 @@ def epoch_data(subject, condition, srmr_nr, sampling_rate):
     trigger_name = cond_info.trigger_name
     nerve = cond_info.nerve
 
-    # load cleaned ESG data
+    cfg = loadmat(cfg_path + 'cfg.mat')
+    notch_freq = cfg['notch_freq'][0]
+    esg_bp_freq = cfg['esg_bp_freq'][0]
+    # Both in ms - MNE works with seconds
+    iv_epoch = cfg['iv_epoch'][0] / 1000
+    iv_baseline = cfg['iv_baseline'][0] / 1000
+
+    ########################### Filtering ############################################################
+    # load cleaned ESG data, filtered and with the reference channel added - shared with the other stages filtering
+    # this recording
+    # Filtering is linear and per channel, so re-referencing the filtered data equals filtering the re-referenced data
     fname = f'data_clean_ecg_spinal_{cond_name}_withqrs.fif'
-    raw = mne.io.read_raw_fif(load_path + fname, preload=True)
+    raw = get_filtered_raw(load_path + fname, esg_bp_freq, notch_freq, 'TH6')
 
     ########################### Re - Reference ####################################
-    # add reference channel to data
-    mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-
     # Fz reference
     raw_FzRef = rereference_data(raw, 'Fz-TH6')
 
@@ -43,21 +52,8 @@ def epoch_data(subject, condition, srmr_nr, sampling_rate):
     elif nerve == 2:
         raw_antRef = rereference_data(raw, 'AL')
 
-    cfg = loadmat(cfg_path + 'cfg.mat')
-    notch_freq = cfg['notch_freq'][0]
-    esg_bp_freq = cfg['esg_bp_freq'][0]
-    # Both in ms - MNE works with seconds
-    iv_epoch = cfg['iv_epoch'][0] / 1000
-    iv_baseline = cfg['iv_baseline'][0] / 1000
-
     for raw_data, fname in zip([raw, raw_antRef, raw_FzRef], [f'epo_clean_{cond_name}.fif', f'epo_antRef_clean_{cond_name}.fif',
                                                               f'epo_FzRef_clean_{cond_name}.fif']):
-        ########################### Filtering ############################################################
-        raw_data.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-                   iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-
-        raw_data.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
-
         ############################################# Epoch ##############################################
         # events contains timestamps with corresponding event_id (number)
         # event_ids returns the event/trigger names with their corresponding event_id (number)
@@ -71,7 +67,7 @@ def epoch_data(subject, condition, srmr_nr, sampling_rate):
                             baseline=tuple(iv_baseline))
 
         # Save the epochs
-        epochs.save(os.path.join(save_path, fname), fmt='double', overwrite=True)
+        epochs.save(os.path.join(save_path, fname), fmt=get_fif_fmt(), overwrite=True)
 
 
 
@@ -0,0 +1,16 @@
+# Precision the stages of the pipeline store their .fif outputs with - set once from main.py with set_fif_fmt
+# 'double' stores float64, 'single' stores float32 and halves the size on disk and the time to read/write it
+# Data is read back into float64 by mne either way, so all computation stays in float64
+# The deviation each metric sees between the two is reported by Metrics/validate_fif_fmt.py
+# raw.save(fname, fmt=get_fif_fmt(), overwrite=True)
+
+fif_storage = {'fmt': 'double'}
+
+
+def set_fif_fmt(fmt):
+    assert fmt in ['single', 'double'], "Error. fmt must be 'single' or 'double'."
+    fif_storage['fmt'] = fmt
+
+
+def get_fif_fmt():
+    return fif_storage['fmt']
@@ -0,0 +1,100 @@
+# Band-pass and notch filtering of the ESG data in a single pass over each channel
+# Replaces raw.filter(method='iir', order 2 butter, phase='zero') followed by raw.notch_filter(method='fir',
+# phase='zero') - two forward-backward passes, the second with a long FIR kernel
+# method 'fir': the impulse response of those two calls as one zero-phase FIR kernel, applied by one overlap-add
+# convolution - reproduces their output away from the edges of the recording
+# method 'sos': the band-pass cascaded with an IIR notch per notch frequency (-6 dB width matched to the FIR notch) as
+# one set of second order sections, applied by one forward-backward sosfiltfilt - the fastest, but the notch is IIR
+# validate_filter_esg compares both to the two calls
+# The method is set once for the whole pipeline from main.py, as the .fif storage format in fif_fmt
+# filter_esg(raw, esg_bp_freq, notch_freq)
+
+import numpy as np
+import mne
+from scipy.signal import sosfiltfilt, oaconvolve, iirnotch, tf2sos
+from apply_function_shared import apply_function_shared
+
+filter_setting = {'method': 'fir'}
+
+
+def set_filter_method(method):
+    assert method in ['fir', 'sos'], f"Error. Filter method must be 'fir' or 'sos', got {method}."
+    filter_setting['method'] = method
+
+
+def get_filter_method():
+    return filter_setting['method']
+
+
+# Modifies raw in place, as raw.filter and raw.notch_filter
+def filter_esg(raw, esg_bp_freq, notch_freq, method=None):
+    # Channels are filtered in parallel on one shared copy of the data, rather than each sent to a worker and back
+    esg_filter = get_esg_filter(raw.info['sfreq'], esg_bp_freq, notch_freq, method)
+    if 'sos' in esg_filter:
+        apply_function_shared(raw, apply_sos, picks='data', n_jobs=len(raw.ch_names), **esg_filter)
+    else:
+        apply_function_shared(raw, apply_kernel, picks='data', n_jobs=len(raw.ch_names), **esg_filter)
+
+    # Record the band-pass, as raw.filter does
+    with raw.info._unlock():
+        if raw.info['highpass'] is None or esg_bp_freq[0] > raw.info['highpass']:
+            raw.info['highpass'] = float(esg_bp_freq[0])
+        if raw.info['lowpass'] is None or esg_bp_freq[1] < raw.info['lowpass']:
+            raw.info['lowpass'] = float(esg_bp_freq[1])
+
+    return raw
+
+
+# {'kernel': zero-phase FIR} for method 'fir', {'sos': second order sections, 'padlen': samples} for method 'sos'
+def get_esg_filter(sfreq, esg_bp_freq, notch_freq, method=None):
+    if method is None:
+        method = get_filter_method()
+    assert method in ['fir', 'sos'], f"Error. Filter method must be 'fir' or 'sos', got {method}."
+    notch_freq = np.ravel(notch_freq).astype(float)
+
+    # Impulse response of the FIR notch as applied now - 10s holds the kernel of the default 1Hz transition band
+    impulse = np.zeros(int(10 * sfreq) + 1)
+    impulse[len(impulse) // 2] = 1
+    notch_kernel = mne.filter.notch_filter(impulse, sfreq, notch_freq, method='fir', phase='zero', verbose=False)
+
+    if method == 'fir':
+        # Impulse response of both calls, cut where it has decayed below 1e-10 of its peak
+        bp_impulse = mne.filter.filter_data(impulse, sfreq, esg_bp_freq[0], esg_bp_freq[1], method='iir',
+                                            iir_params={'order': 2, 'ftype': 'butter'}, phase='zero', verbose=False)
+        kernel = mne.filter.notch_filter(bp_impulse, sfreq, notch_freq, method='fir', phase='zero', verbose=False)
+        half = np.max(np.abs(np.flatnonzero(np.abs(kernel) > 1e-10 * np.max(np.abs(kernel))) - len(kernel) // 2))
+        return {'kernel': kernel[len(kernel) // 2 - half:len(kernel) // 2 + half + 1]}
+
+    # Band-pass as designed by raw.filter
+    bp_params = mne.filter.create_filter(None, sfreq, esg_bp_freq[0], esg_bp_freq[1], method='iir',
+                                         iir_params={'order': 2, 'ftype': 'butter'}, phase='zero', verbose=False)
+
+    # IIR notch per frequency with the -6 dB width of the FIR notch - forward-backward, the -3 dB width of iirnotch
+    # becomes its -6 dB width
+    n_fft = 2 ** int(np.ceil(np.log2(100 * sfreq)))  # 0.01 Hz resolution
+    response = np.abs(np.fft.rfft(np.fft.ifftshift(notch_kernel), n_fft))
+    freqs = np.fft.rfftfreq(n_fft, 1 / sfreq)
+    sos = [bp_params['sos']]
+    for freq in notch_freq:
+        near = np.abs(freqs - freq) < 5
+        stop = freqs[near][response[near] < 0.5]
+        b, a = iirnotch(freq, freq / (stop.max() - stop.min()), sfreq)
+        sos.append(tf2sos(b, a))
+    sos = np.vstack(sos)
+
+    return {'sos': sos, 'padlen': mne.filter.estimate_ringing_samples(sos)}
+
+
+# Forward-backward over the padded channel, padded as raw.filter pads (odd reflection)
+def apply_sos(x, sos, padlen):
+    return sosfiltfilt(sos, x, padtype='odd', padlen=min(padlen, len(x) - 1))
+
+
+# Zero-phase convolution with the kernel, odd reflection of the channel at both ends
+def apply_kernel(x, kernel):
+    half = len(kernel) // 2
+    n_pad = min(half, len(x) - 1)
+    x_ext = np.concatenate([2 * x[0] - x[n_pad:0:-1], x, 2 * x[-1] - x[-2:-n_pad - 2:-1]])
+    x_ext = np.pad(x_ext, half - n_pad)  # Zeros beyond the reflection for channels shorter than the kernel
+
+    return oaconvolve(x_ext, kernel, mode='valid')
@@ -0,0 +1,68 @@
+# Zero-phase FIR filtering with FFT overlap-add - same output as scipy.signal.filtfilt(filter_coords, 1, data)
+# (odd extension of 3*len(filter_coords) samples at each edge and initial conditions from the first sample), but the
+# long kernels used by PCA_OBS (6001 taps at 1kHz) are applied in the frequency domain and to all channels at once
+# The FFT of the kernel is cached, so it is only computed once per kernel and block size rather than once per channel
+
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+
+kernel_fft_cache = {}
+
+
+# FFT of the kernel, computed once per (kernel, fft length)
+def get_kernel_fft(filter_coords, nfft):
+    key = (len(filter_coords), nfft, hash(filter_coords.tobytes()))
+    if key not in kernel_fft_cache:
+        kernel_fft_cache[key] = rfft(filter_coords, nfft)
+    return kernel_fft_cache[key]
+
+
+# Full linear convolution of each row of data with the kernel via overlap-add
+def convolve_oa(filter_coords, data):
+    n_taps = len(filter_coords)
+    n_times = data.shape[-1]
+    nfft = next_fast_len(4 * n_taps)
+    block = nfft - n_taps + 1  # New samples per block, the rest of each block is the convolution tail
+    n_blocks = int(np.ceil(n_times / block))
+
+    padded = np.zeros(data.shape[:-1] + (n_blocks * block,))
+    padded[..., :n_times] = data
+    blocks = padded.reshape(data.shape[:-1] + (n_blocks, block))
+    conv = irfft(rfft(blocks, nfft, axis=-1) * get_kernel_fft(filter_coords, nfft), nfft, axis=-1)
+
+    # Add the tail of each block onto the start of the next one
+    out = np.zeros(data.shape[:-1] + (n_blocks * block + n_taps - 1,))
+    out[..., :n_blocks * block] = conv[..., :block].reshape(data.shape[:-1] + (n_blocks * block,))
+    tails = np.zeros(data.shape[:-1] + (n_blocks, block))
+    tails[..., :n_taps - 1] = conv[..., block:]
+    out[..., block:block + n_blocks * block] += tails.reshape(data.shape[:-1] + (n_blocks * block,))[
+        ..., :n_blocks * block + n_taps - 1 - block]
+
+    return out[..., :n_times + n_taps - 1]
+
+
+# Causal FIR filtering with the initial state set as if the first sample had been constant beforehand
+# This is what lfilter does with zi = lfilter_zi(filter_coords, 1) * data[0]
+def lfilter_fft(filter_coords, data):
+    n_taps = len(filter_coords)
+    pre = np.repeat(data[..., :1], n_taps - 1, axis=-1)
+    conv = convolve_oa(filter_coords, np.concatenate([pre, data], axis=-1))
+    return conv[..., n_taps - 1: n_taps - 1 + data.shape[-1]]
+
+
+# Forward-backward filtering along the last axis
+def filtfilt_fft(filter_coords, data):
+    filter_coords = np.asarray(filter_coords, dtype=float).reshape(-1)
+    data = np.asarray(data, dtype=float)
+    padlen = 3 * len(filter_coords)
+    assert data.shape[-1] > padlen, "Error. Data must be longer than 3 x filter length in filtfilt_fft."
+
+    # Odd extension at both edges, as filtfilt's default padtype
+    left = 2 * data[..., :1] - data[..., padlen:0:-1]
+    right = 2 * data[..., -1:] - data[..., -2:-padlen - 2:-1]
+    ext = np.concatenate([left, data, right], axis=-1)
+
+    y = lfilter_fft(filter_coords, ext)
+    y = lfilter_fft(filter_coords, y[..., ::-1])[..., ::-1]
+
+    return y[..., padlen:-padlen]
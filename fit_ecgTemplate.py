@@ -4,7 +4,7 @@ from scipy.interpolate import PchipInterpolator as pchip
 import h5py
 
 
-def fit_ecgTemplate(data, pca_template, aPeak_idx, peak_range, pre_range, post_range, baseline_range, midP, fitted_art, post_idx_previousPeak, n_samples_fit):
+def fit_ecgTemplate(data, pca_template, aPeak_idx, peak_range, pre_range, post_range, baseline_range, midP, fitted_art, post_idx_previousPeak, n_samples_fit, pinv_cache=None):
     # Declare class to hold ecg fit information
     class fitECG():
         def __init__(self):
@@ -18,16 +18,19 @@ def fit_ecgTemplate(data, pca_template, aPeak_idx, peak_range, pre_range, post_r
     # select window of template
     template = pca_template[midP - peak_range-1: midP + peak_range+1, :]
 
-    # select window of data and detrend it
-    slice = data[0, aPeak_idx[0] - peak_range:aPeak_idx[0] + peak_range+1]
-    detrended_data = detrend(slice.reshape(-1), type='constant')
+    # select window of data, detrend it and map it on the template - the template pseudo-inverse is cached
+    # per window shape so the template is only factorised once per channel rather than once per heartbeat
+    if pinv_cache is None:
+        pinv_cache = {}
+    detrended_data, pad_fit = project_ecgTemplate(data[0, :], template, aPeak_idx[0], peak_range, pinv_cache)
 
-    # maps data on template and then maps it again back to the sensor space
-    least_square = np.linalg.lstsq(template, detrended_data, rcond=None)
-    pad_fit = np.dot(template, least_square[0])
+    # Windows cut short by the start of the data only fill the part of fitted_art that exists
+    fit_start = aPeak_idx[0] - pre_range - 1
+    fit_cut = max(-fit_start, 0)
 
     # fit artifact, I already loop through externally channel to channel
-    fitted_art[0, aPeak_idx[0] - pre_range-1: aPeak_idx[0] + post_range] = pad_fit[midP - pre_range-1: midP + post_range].T
+    fitted_art[0, fit_start + fit_cut: aPeak_idx[0] + post_range] = \
+        pad_fit[midP - pre_range - 1 + fit_cut: midP + post_range].T
 
     fitecg.fitted_art = fitted_art
     fitecg.template = template
@@ -76,3 +79,25 @@ def fit_ecgTemplate(data, pca_template, aPeak_idx, peak_range, pre_range, post_r
     #         outfile.create_dataset(keyword, data=getattr(fitecg, keyword))
 
     return fitted_art, post_idx_nextPeak
+
+
+# Least squares fit of the template to the window of data around a peak, then mapped back to the sensor space
+# Works for a single channel (data [time], template [time x coeff]) or a stack of channels (data [channel x time],
+# template [channel x time x coeff])
+# The pseudo-inverse of the template rows in use is computed once per window shape and kept in pinv_cache
+# Windows truncated by the start or end of the data are fitted on the matching rows of the template
+def project_ecgTemplate(data, template, aPeak_idx, peak_range, pinv_cache):
+    n_times = data.shape[-1]
+    window_start = aPeak_idx - peak_range
+    start = max(window_start, 0)
+    end = min(aPeak_idx + peak_range + 1, n_times)
+    rows = (start - window_start, end - window_start)
+
+    if rows not in pinv_cache:
+        pinv_cache[rows] = np.linalg.pinv(template[..., rows[0]:rows[1], :])
+
+    detrended_data = detrend(data[..., start:end], type='constant', axis=-1)
+    coeffs = np.matmul(pinv_cache[rows], detrended_data[..., np.newaxis])
+    pad_fit = np.matmul(template, coeffs)[..., 0]
+
+    return detrended_data, pad_fit
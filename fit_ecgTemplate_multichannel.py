@@ -0,0 +1,137 @@
+# Multichannel version of fit_ecgTemplate - fits the PCA template of every channel to every heartbeat in one go
+# Reproduces the per-beat logic of PCA_OBS + fit_ecgTemplate: the first beat uses the full pre range, beats without
+# a following peak are not fitted, and the gap between neighbouring fitted windows is filled with PCHIP
+# The heartbeat windows and gaps come from get_heartbeat_geometry
+# Several taper variants can be produced from one fit - tukey_alphas holds None for the plain fitted artefact and/or
+# the alpha of each Tukey window the fitted window of every beat is multiplied with (as fit_ecgTemplate_tukey)
+# fit_ecgTemplate_sweep gives the fitted artefact for every number of components up to the size of the template
+
+import numpy as np
+from functools import lru_cache
+from scipy.signal.windows import tukey
+from pchip_interpolation import pchip_batch
+from fit_ecgTemplate import project_ecgTemplate
+
+
+# Tukey windows only depend on the window length and alpha - memoised so each is only computed once
+@lru_cache(maxsize=None)
+def get_tukey_window(M, alpha):
+    return tukey(M=M, alpha=alpha, sym=True)
+
+
+# Window of data for every channel and interior beat, detrended [channel x epoch x time]
+def get_detrended_windows(data, geometry):
+    # Only beats with a following peak can be fitted
+    for p in geometry.unfitted_beats:
+        print(f'Cannot fit ECG epoch {p} - there is no following peak')
+
+    window = np.arange(-geometry.peak_range, geometry.peak_range+1)
+    detrended_data = data[:, geometry.fit_peaks[geometry.interior, np.newaxis] + window]
+    detrended_data -= np.mean(detrended_data, axis=2, keepdims=True)
+
+    return detrended_data
+
+
+# Fitted template of the edge beats, whose windows are truncated by the start or end of the data
+# Pseudo-inverses of the truncated templates are cached by window shape
+def get_edge_fit(data, pca_template, geometry, pinv_cache):
+    edge_fit = {}
+    for b in np.flatnonzero(~geometry.interior):
+        _, edge_fit[b] = project_ecgTemplate(data, pca_template, geometry.fit_peaks[b], geometry.peak_range,
+                                             pinv_cache)
+    return edge_fit
+
+
+# Places the fitted window of every beat in the fitted artefact of each variant and fills the gaps between them
+# The fit of interior beat b is basis @ coeffs[:, b, :], edge beats take theirs from edge_fit
+def assemble_fitted_art(n_chans, basis, coeffs, edge_fit, geometry, tukey_alphas):
+    fitted_arts = {alpha: np.zeros((n_chans, geometry.n_times)) for alpha in tukey_alphas}
+    peak_range = geometry.peak_range
+    n_samples_fit = geometry.n_samples_fit
+    peaks = geometry.fit_peaks
+    pre_range = geometry.pre_range
+    post_range = geometry.post_range
+
+    for b in np.arange(0, len(peaks)):
+        aPeak_idx = peaks[b]
+
+        # maps it again back to the sensor space and fit artifact
+        if b in edge_fit:
+            pad_fit = edge_fit[b]
+        else:
+            pad_fit = np.einsum('ctk,ck->ct', basis, coeffs[:, b, :])
+        fit_start = aPeak_idx - pre_range[b] - 1
+        fit_cut = max(-fit_start, 0)  # Windows cut short by the start of the data
+        fit_window = pad_fit[:, peak_range - pre_range[b] + fit_cut: peak_range + post_range[b] + 1]
+        for alpha in tukey_alphas:
+            if alpha is None:
+                fitted_arts[alpha][:, fit_start + fit_cut: aPeak_idx + post_range[b]] = fit_window
+            else:
+                tukey_window = get_tukey_window(int(pre_range[b] + post_range[b] + 1), alpha)
+                fitted_arts[alpha][:, fit_start + fit_cut: aPeak_idx + post_range[b]] = \
+                    tukey_window[fit_cut:] * fit_window
+
+    # interpolate time between peaks - every gap between consecutive fitted windows of all channels in one pass
+    # Gaps only read fitted values within n_samples_fit of their own edges, so filling them after all windows are
+    # placed gives the same result as filling each one straight after its following window
+    intpol_start = geometry.intpol_start
+    intpol_end = geometry.intpol_end
+
+    if len(intpol_start) > 0:
+        # x_fit is two slices on either side of each interpolation window, x_interpol is every point in the windows
+        x_fit = np.concatenate([intpol_start[:, np.newaxis] + np.arange(-n_samples_fit, 1),
+                                intpol_end[:, np.newaxis] + np.arange(0, n_samples_fit + 1)], axis=1)
+        intpol_length = intpol_end - intpol_start + 1
+        gap_idx = np.repeat(np.arange(len(intpol_start)), intpol_length)
+        x_interpol = intpol_start[gap_idx] + np.arange(len(gap_idx)) - np.repeat(np.cumsum(intpol_length) -
+                                                                                   intpol_length, intpol_length)
+        # Piecewise Cubic Hermite Interpolating Polynomial(PCHIP) + replace fitted artefact
+        for fitted_art in fitted_arts.values():
+            fitted_art[:, x_interpol] = pchip_batch(x_fit, fitted_art[:, x_fit], x_interpol, gap_idx)
+
+    return fitted_arts
+
+
+# Coefficients of the template for every channel and interior beat [channel x beat x coeff] and the fitted template
+# of the edge beats - together with the template this is everything needed to rebuild the fitted artefact
+def project_ecgTemplate_multichannel(data, pca_template, geometry):
+    peak_range = geometry.peak_range
+    detrended_data = get_detrended_windows(data, geometry)
+
+    # maps data on template - the template of each channel is factorised once and all interior beats are projected
+    # with one matrix multiply [channel x epoch x coeff]
+    pinv_cache = {(0, 2*peak_range + 1): np.linalg.pinv(pca_template)}
+    coeffs = np.zeros((data.shape[0], len(geometry.fit_peaks), pca_template.shape[2]))
+    coeffs[:, geometry.interior, :] = np.einsum('cbt,ckt->cbk', detrended_data, pinv_cache[(0, 2*peak_range + 1)])
+    del detrended_data
+    edge_fit = get_edge_fit(data, pca_template, geometry, pinv_cache)
+
+    return coeffs, edge_fit
+
+
+def fit_ecgTemplate_multichannel(data, pca_template, geometry, tukey_alphas=(None,)):
+    # data is [channel x time], pca_template is [channel x window-length x (1 + nComponents)]
+    # returns a dictionary with the fitted artefact [channel x time] of each variant in tukey_alphas
+    coeffs, edge_fit = project_ecgTemplate_multichannel(data, pca_template, geometry)
+
+    return assemble_fitted_art(data.shape[0], pca_template, coeffs, edge_fit, geometry, tukey_alphas)
+
+
+def fit_ecgTemplate_sweep(data, pca_template, geometry, tukey_alpha=None):
+    # Generator yielding (k, fitted artefact [channel x time]) for k = 0 (mean effect only) up to every component in
+    # pca_template, i.e. the fit with the template truncated to its first 1 + k columns
+    # The least squares fit on the first 1 + k columns is the projection on their span, so with the columns
+    # orthonormalised (QR) the interior beats are projected once and each k only adds one more direction
+    detrended_data = get_detrended_windows(data, geometry)
+
+    Q, _ = np.linalg.qr(pca_template)  # [channel x time x (1 + K)], first 1 + k columns span the first 1 + k columns
+    coeffs = np.zeros((data.shape[0], len(geometry.fit_peaks), pca_template.shape[2]))
+    coeffs[:, geometry.interior, :] = np.einsum('cbt,ctk->cbk', detrended_data, Q)
+    del detrended_data
+
+    for k in np.arange(0, pca_template.shape[2]):
+        # Edge beats are fitted on the truncated template directly
+        edge_fit = get_edge_fit(data, pca_template[:, :, 0:k+1], geometry, {})
+        fitted_arts = assemble_fitted_art(data.shape[0], Q[:, :, 0:k+1], coeffs[:, :, 0:k+1], edge_fit, geometry,
+                                          [tukey_alpha])
+        yield k, fitted_arts[tukey_alpha]
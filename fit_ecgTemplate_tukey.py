@@ -2,11 +2,12 @@ import numpy as np
 from scipy.signal import detrend
 from scipy.interpolate import PchipInterpolator as pchip
 from scipy.signal.windows import tukey
+from fit_ecgTemplate import project_ecgTemplate
 import matplotlib.pyplot as plt
 import h5py
 
 
-def fit_ecgTemplate_tukey(data, pca_template, aPeak_idx, peak_range, pre_range, post_range, baseline_range, midP, fitted_art, post_idx_previousPeak, n_samples_fit, plot_tukey):
+def fit_ecgTemplate_tukey(data, pca_template, aPeak_idx, peak_range, pre_range, post_range, baseline_range, midP, fitted_art, post_idx_previousPeak, n_samples_fit, plot_tukey, pinv_cache=None):
     # Declare class to hold ecg fit information
     class fitECG():
         def __init__(self):
@@ -20,22 +21,25 @@ def fit_ecgTemplate_tukey(data, pca_template, aPeak_idx, peak_range, pre_range,
     # select window of template
     template = pca_template[midP - peak_range-1: midP + peak_range+1, :]
 
-    # select window of data and detrend it
-    slice = data[0, aPeak_idx[0] - peak_range:aPeak_idx[0] + peak_range+1]
-    detrended_data = detrend(slice.reshape(-1), type='constant')
+    # select window of data, detrend it and map it on the template - the template pseudo-inverse is cached
+    # per window shape so the template is only factorised once per channel rather than once per heartbeat
+    if pinv_cache is None:
+        pinv_cache = {}
+    detrended_data, pad_fit = project_ecgTemplate(data[0, :], template, aPeak_idx[0], peak_range, pinv_cache)
 
-    # maps data on template and then maps it again back to the sensor space
-    least_square = np.linalg.lstsq(template, detrended_data, rcond=None)
-    pad_fit = np.dot(template, least_square[0])
+    # Windows cut short by the start of the data only fill the part of fitted_art that exists
+    fit_start = aPeak_idx[0] - pre_range - 1
+    fit_cut = max(-fit_start, 0)
 
     # fit artifact, I already loop through externally channel to channel to no need to include it here
-    fitted_art[0, aPeak_idx[0] - pre_range-1: aPeak_idx[0] + post_range] = pad_fit[midP - pre_range-1: midP + post_range].T
+    fitted_art[0, fit_start + fit_cut: aPeak_idx[0] + post_range] = \
+        pad_fit[midP - pre_range - 1 + fit_cut: midP + post_range].T
 
     # Mods for Tukey
     # tukey_window = tukey(M=len(pad_fit[midP - pre_range-1: midP + post_range].T), alpha=0.5, sym=True)
     tukey_window = tukey(M=len(pad_fit[midP - pre_range-1: midP + post_range].T), alpha=0.25, sym=True)
-    fitted_art[0, aPeak_idx[0] - pre_range - 1: aPeak_idx[0] + post_range] = \
-        tukey_window*pad_fit[midP - pre_range-1: midP + post_range].T
+    fitted_art[0, fit_start + fit_cut: aPeak_idx[0] + post_range] = \
+        tukey_window[fit_cut:]*pad_fit[midP - pre_range - 1 + fit_cut: midP + post_range].T
 
     if plot_tukey:
         plt.figure()
@@ -45,7 +49,7 @@ def fit_ecgTemplate_tukey(data, pca_template, aPeak_idx, peak_range, pre_range,
         plt.plot(tukey_window, label='Window')
         plt.legend()
         plt.figure()
-        plt.plot(fitted_art[0, aPeak_idx[0] - pre_range-1: aPeak_idx[0] + post_range], label='After')
+        plt.plot(fitted_art[0, fit_start + fit_cut: aPeak_idx[0] + post_range], label='After')
         plt.legend()
         plt.show()
 
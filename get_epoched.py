@@ -5,6 +5,8 @@ import os
 import numpy as np
 from scipy.io import loadmat
 from Metrics.SNR_functions import evoked_from_raw
+from get_filtered_raw import get_filtered_raw
+from get_ssp_raw import get_ssp_raw
 import matplotlib.pyplot as plt
 
 if __name__ == '__main__':
@@ -56,13 +58,8 @@ if __name__ == '__main__':
 
                     if method == 'Prep':
                         input_path = "/data/pt_02569/tmp_data/prepared_py/" + subject_id + "/esg/prepro/"
-                        raw = mne.io.read_raw_fif(f"{input_path}noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif"
-                                                  , preload=True)
-                        mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-                        raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names),
-                                   method='iir',
-                                   iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-                        raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+                        raw = get_filtered_raw(f"{input_path}noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif",
+                                               esg_bp_freq, notch_freq, 'TH6')
                         events, event_ids = mne.events_from_annotations(raw)
                         event_id_dict = {key: value for key, value in event_ids.items() if key == trigger_name}
                         epochs = mne.Epochs(raw, events, event_id=event_id_dict, tmin=iv_epoch[0], tmax=iv_epoch[1],
@@ -72,12 +69,7 @@ if __name__ == '__main__':
                     elif method == 'PCA':
                         input_path = "/data/pt_02569/tmp_data/ecg_rm_py/" + subject_id + "/esg/prepro/"
                         fname = f"data_clean_ecg_spinal_{cond_name}_withqrs.fif"
-                        raw = mne.io.read_raw_fif(input_path + fname, preload=True)
-                        mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-                        raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names),
-                                   method='iir',
-                                   iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-                        raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+                        raw = get_filtered_raw(input_path + fname, esg_bp_freq, notch_freq, 'TH6')
                         events, event_ids = mne.events_from_annotations(raw)
                         event_id_dict = {key: value for key, value in event_ids.items() if key == trigger_name}
                         epochs = mne.Epochs(raw, events, event_id=event_id_dict, tmin=iv_epoch[0], tmax=iv_epoch[1],
@@ -112,7 +104,8 @@ if __name__ == '__main__':
                     subject_id = f'sub-{str(subject).zfill(3)}'
 
                     input_path = f"/data/p_02569/SSP/{subject_id}/{n} projections/"
-                    raw = mne.io.read_raw_fif(f"{input_path}ssp_cleaned_{cond_name}.fif", preload=True)
+                    os.makedirs(input_path, exist_ok=True)
+                    raw = get_ssp_raw(subject_id, cond_name, n)  # Epochs read only their windows, projected
                     events, event_ids = mne.events_from_annotations(raw)
                     event_id_dict = {key: value for key, value in event_ids.items() if key == trigger_name}
                     epochs = mne.Epochs(raw, events, event_id=event_id_dict, tmin=iv_epoch[0], tmax=iv_epoch[1],
@@ -0,0 +1,105 @@
+# Band-pass (2nd order Butterworth, esg_bp_freq) and notch (notch_freq) filtered copy of a recording, as computed in
+# ICA, run_CCA, epoch_data, get_epoched and the metrics scripts
+# The first caller filters the recording (filter_esg) and stores it in filtered_cache, keyed by the content hash of the
+# .fif and the filter parameters and method - later callers memory map the stored array rather than filtering again
+# The reference is applied after reading from the cache: reference='TH6' adds the TH6 reference channel (zeros, as
+# mne.add_reference_channels), any other channel name or 'average' re-references as rereference_data
+# Filtering is linear and per channel, so this equals re-referencing before filtering
+# Each entry is a full float64 copy of a recording - once the cache is larger than max_cache_gb the least recently used
+# entries are removed, e.g. those left by earlier filter parameters or methods. clean_filtered_cache() empties it
+# raw = get_filtered_raw(input_path + fname, esg_bp_freq, notch_freq, reference='TH6')
+
+import os
+import json
+import hashlib
+import mne
+import numpy as np
+from numpy.lib.format import open_memmap
+from stage_cache import hash_files
+from filter_esg import filter_esg, get_filter_method
+
+cache_path = "/data/pt_02569/tmp_data/filtered_cache/"
+max_cache_gb = 100
+
+
+def get_filtered_raw(fname, esg_bp_freq, notch_freq, reference=None):
+    # Key of the filtered data - the content hash of the file is reused while its size and modification time match
+    os.makedirs(cache_path, exist_ok=True)
+    source_fname = os.path.join(cache_path, hashlib.sha256(os.path.abspath(fname).encode()).hexdigest()[:16] + '.json')
+    known = {}
+    if os.path.isfile(source_fname):
+        with open(source_fname, 'r') as infile:
+            known = json.load(infile)
+    hashes = hash_files([fname], known)
+    if hashes != known:
+        with open(source_fname + f'.{os.getpid()}.tmp', 'w') as outfile:
+            json.dump(hashes, outfile)
+        os.replace(source_fname + f'.{os.getpid()}.tmp', source_fname)
+    filter_params = {'esg_bp_freq': [float(f) for f in np.ravel(esg_bp_freq)],
+                     'notch_freq': [float(f) for f in np.ravel(notch_freq)], 'method': get_filter_method()}
+    key = hashlib.sha256(json.dumps([hashes[fname][2], filter_params]).encode()).hexdigest()[:24]
+    data_fname = os.path.join(cache_path, key + '.npy')
+    info_fname = os.path.join(cache_path, key + '-info.fif')
+    annot_fname = os.path.join(cache_path, key + '-annot.fif')
+
+    if not all(os.path.isfile(f) for f in [data_fname, info_fname, annot_fname]):
+        raw = mne.io.read_raw_fif(fname, preload=True)
+        filter_esg(raw, esg_bp_freq, notch_freq)
+
+        # Written under a temporary name of this process and moved, so a parallel caller never reads a partly written
+        # file
+        tmp_fname = data_fname + f'.{os.getpid()}.tmp.npy'
+        data = open_memmap(tmp_fname, mode='w+', dtype=np.float64, shape=raw._data.shape)
+        data[:] = raw._data
+        data.flush()
+        del data
+        mne.io.write_info(info_fname, raw.info)
+        raw.annotations.save(annot_fname, overwrite=True)
+        os.replace(tmp_fname, data_fname)
+        del raw
+        clean_filtered_cache(max_cache_gb, keep=key)
+    else:
+        os.utime(data_fname)  # Marks the entry as used
+
+    # Copy on write - changes made in place by the caller stay in its own memory, the cache is never modified
+    first_samp = mne.io.read_raw_fif(fname, preload=False, verbose=False).first_samp  # Only reads the header
+    raw = mne.io.RawArray(np.load(data_fname, mmap_mode='c'), mne.io.read_info(info_fname), first_samp=first_samp,
+                          verbose=False)
+    raw.set_annotations(mne.read_annotations(annot_fname))
+
+    if reference == 'TH6':
+        mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
+    elif reference is not None:
+        if reference in raw.ch_names:
+            raw.set_eeg_reference(ref_channels=[reference])
+        else:
+            raw.set_eeg_reference(ref_channels='average')
+
+    return raw
+
+
+# Removes the least recently used entries until the cache holds at most max_gb, other than the entry keep
+# Callers that already have an entry memory mapped keep reading it after it is removed
+def clean_filtered_cache(max_gb=0, keep=None):
+    entries = []
+    for fname in os.listdir(cache_path):
+        if not fname.endswith('.npy') or '.tmp' in fname:
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_path, fname))
+        except FileNotFoundError:  # Removed by a parallel caller
+            continue
+        entries.append((stat.st_mtime, stat.st_size, fname[:-len('.npy')]))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= max_gb * 1e9:
+            break
+        if key == keep:
+            continue
+        for suffix in ['.npy', '-info.fif', '-annot.fif']:
+            try:
+                os.remove(os.path.join(cache_path, key + suffix))
+            except FileNotFoundError:
+                pass
+        total -= size
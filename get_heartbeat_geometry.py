@@ -0,0 +1,83 @@
+# Heartbeat geometry used by PCA_OBS - depends only on the QRS events and the length of the recording, so it is
+# computed once per recording and shared by the annotation step and the fit of every channel
+# Holds the peak indices, peak range, the pre/post range and fit window of each fitted heartbeat and the
+# interpolation gaps between consecutive fitted windows
+# The geometry of the last few recordings is kept, and shared by every caller - its arrays are read only
+
+import numpy as np
+
+geometry_cache = {}  # Least recently used first
+max_cached = 4  # Each stage works on one recording at a time
+
+
+def get_heartbeat_geometry(qrs, n_times):
+    # return geometry of the heartbeats, cached per set of QRS events and recording length
+    class HeartbeatGeometry():
+        def __init__(self):
+            pass
+
+    qrs = np.asarray(qrs).reshape(-1)
+    key = (qrs.dtype.str, qrs.tobytes(), n_times)  # The events themselves, so no two sets of events share a geometry
+    if key in geometry_cache:
+        geometry_cache[key] = geometry_cache.pop(key)
+        return geometry_cache[key]
+
+    # Extract QRS events - logical indexed locations of qrs events inside the data
+    peak_idx = np.unique(qrs[qrs < n_times]).astype(int)
+    peak_count = len(peak_idx)
+
+    # define peak range based on RR
+    RR = np.diff(peak_idx)
+    mRR = np.median(RR)
+    peak_range = round(mRR/2)  # Rounds to an integer
+    n_samples_fit = round(peak_range/8)  # sample fit for interpolation between fitted artifact windows
+
+    # make sure array is long enough for PArange (if not cut off  last ECG peak)
+    pa = peak_count  # Number of QRS complexes detected
+    while peak_idx[pa-1] + peak_range > n_times:
+        pa = pa - 1
+    peak_count = pa
+
+    # Pre and post range of each heartbeat - half the distance to the neighbouring peaks, capped at peak_range
+    # The first beat always uses the full pre range, beats without a following peak can't be fitted
+    beats = np.arange(0, peak_count)
+    has_next = beats + 1 < len(peak_idx)
+    pre_range = np.full(peak_count, peak_range)
+    pre_range[1:] = np.minimum(np.floor(np.diff(peak_idx[0:peak_count]) / 2), peak_range)
+    post_range = np.zeros(peak_count, dtype=int)
+    post_range[has_next] = np.minimum(np.floor((peak_idx[beats[has_next] + 1] - peak_idx[beats[has_next]]) / 2),
+                                      peak_range)
+    fit_peaks = peak_idx[0:peak_count][has_next]
+
+    # Interpolation gaps between the end of one fitted window and the start of the next
+    intpol_start = fit_peaks[:-1] + post_range[has_next][:-1]
+    intpol_end = fit_peaks[1:] - pre_range[has_next][1:]
+    gaps = intpol_start < intpol_end
+
+    geometry = HeartbeatGeometry()
+    geometry.n_times = n_times
+    geometry.peak_idx = peak_idx
+    geometry.peak_count = peak_count
+    geometry.peak_range = peak_range
+    geometry.n_samples_fit = n_samples_fit
+    geometry.unfitted_beats = beats[~has_next]
+    geometry.fit_peaks = fit_peaks
+    geometry.pre_range = pre_range[has_next].astype(int)
+    geometry.post_range = post_range[has_next].astype(int)
+    # Interior beats have the whole window inside the data, edge beats are truncated by the start or end
+    geometry.interior = (fit_peaks - peak_range >= 0) & (fit_peaks + peak_range + 1 <= n_times)
+    # Fit window of each beat for the fit_start and fit_end annotations, clipped to the data for the edge beats
+    geometry.window_start_idx = np.maximum(fit_peaks - peak_range, 0)
+    geometry.window_end_idx = np.minimum(fit_peaks + peak_range, n_times - 1)
+    geometry.intpol_start = intpol_start[gaps]
+    geometry.intpol_end = intpol_end[gaps]
+
+    for value in vars(geometry).values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+
+    geometry_cache[key] = geometry
+    while len(geometry_cache) > max_cached:
+        del geometry_cache[next(iter(geometry_cache))]
+
+    return geometry
@@ -0,0 +1,30 @@
+# Selects the number of PCA components to keep from the eigenvalue spectrum using profile likelihood
+# Zhu & Ghodsi (2006) - the eigenvalues are split into a leading and a trailing group, each modelled as normal with
+# its own mean and a common variance, and the split with the largest profile likelihood is chosen
+# With a common variance the log likelihood of a split is -p/2 * (log(2*pi*SS/p) + 1), SS being the pooled within
+# group sum of squares, so the best split is the one with the smallest SS
+# Works on a single spectrum or a stack of them [channel x component], returning one number per spectrum
+
+import numpy as np
+
+
+def get_ncomponents(eigen_values, max_components=None):
+    eigen_values = np.asarray(eigen_values, dtype=float)
+    p = eigen_values.shape[-1]
+    if max_components is None:
+        max_components = p - 1
+    q = np.arange(1, min(max_components, p - 1) + 1)  # candidate number of leading components
+
+    # Group sums and sums of squares for every split at once
+    S1 = np.cumsum(eigen_values, axis=-1)
+    S2 = np.cumsum(eigen_values**2, axis=-1)
+    S1_lead = S1[..., q - 1]
+    S2_lead = S2[..., q - 1]
+    S1_trail = S1[..., -1:] - S1_lead
+    S2_trail = S2[..., -1:] - S2_lead
+
+    SS = (S2_lead - S1_lead**2 / q) + (S2_trail - S1_trail**2 / (p - q))
+    # Guard against a perfect fit (all eigenvalues equal within each group)
+    loglik = -p / 2 * (np.log(2 * np.pi * np.maximum(SS, np.finfo(float).tiny) / p) + 1)
+
+    return q[np.argmax(loglik, axis=-1)]
@@ -0,0 +1,49 @@
+# Returns the QRS events of a subject and condition from the store written by build_qrs_store
+# The store is memory mapped once per process and each call returns a read-only view into it [n_events]
+# Same values as loadmat(f'raw_{sampling_rate}_spinal_{cond_name}.mat')['QRSevents'][0]
+# source='python' instead returns the R peaks found by detect_qrs, as saved to the .h5 file by import_data
+# has_qrs tells whether the store holds the events of a subject and condition
+
+import os
+import numpy as np
+import h5py
+from get_conditioninfo import get_conditioninfo
+from build_qrs_store import store_fname, index_fname
+
+qrs_store = {}
+
+
+def get_qrs(subject, condition, srmr_nr=1, sampling_rate=1000, source='matlab'):
+    assert source in ['matlab', 'python'], "Error. source must be 'matlab' or 'python'."
+    subject_id = f'sub-{str(subject).zfill(3)}'
+    cond_name = get_conditioninfo(condition, srmr_nr).cond_name
+
+    if source == 'python':
+        input_path = "/data/pt_02569/tmp_data/prepared_py/" + subject_id + "/esg/prepro/"
+        with h5py.File(input_path + f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.h5', "r") as infile:
+            return infile["QRS"][()]
+
+    load_qrs_store()
+    key = (subject_id, cond_name, sampling_rate)
+    assert key in qrs_store['index'], f"Error. No QRS events stored for {subject_id} {cond_name} at {sampling_rate}Hz."
+    start, stop = qrs_store['index'][key]
+
+    return qrs_store['events'][start:stop]
+
+
+def has_qrs(subject, condition, srmr_nr=1, sampling_rate=1000):
+    if not (os.path.isfile(store_fname) and os.path.isfile(index_fname)):
+        return False
+    load_qrs_store()
+    subject_id = f'sub-{str(subject).zfill(3)}'
+    cond_name = get_conditioninfo(condition, srmr_nr).cond_name
+
+    return (subject_id, cond_name, sampling_rate) in qrs_store['index']
+
+
+# Memory maps the store, once per process
+def load_qrs_store():
+    if 'events' not in qrs_store:
+        qrs_store['events'] = np.load(store_fname, mmap_mode='r')
+        qrs_store['index'] = {(row['subject_id'], row['cond_name'], row['sampling_rate']): (row['start'], row['stop'])
+                              for row in np.load(index_fname)}
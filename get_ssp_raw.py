@@ -0,0 +1,32 @@
+# SSP cleaned data for any number of projectors, from the one recording apply_SSP saves per subject and condition
+# apply_SSP saves the filtered data (TH6 added) with the ECG projectors of every n stored in its info, inactive -
+# get_ssp_raw keeps the first n and activates them, so without preload each segment read is projected as it is read,
+# as are the epochs of mne.Epochs on the returned raw
+# apply_ssp_projs does the same for anything holding the stored projectors, e.g. the evoked response from an
+# epoch_store of the saved recording - averaging and baseline correction are linear, so projecting the evoked response
+# equals averaging the projected data
+# raw = get_ssp_raw(subject_id, cond_name, 6)
+
+import mne
+
+ssp_path = "/data/p_02569/SSP/"
+
+
+def get_ssp_fname(subject_id, cond_name):
+    return f"{ssp_path}{subject_id}/ssp_filtered_{cond_name}.fif"
+
+
+def get_ssp_raw(subject_id, cond_name, n, preload=False):
+    raw = mne.io.read_raw_fif(get_ssp_fname(subject_id, cond_name), preload=preload)
+
+    return apply_ssp_projs(raw, n)
+
+
+# Modifies inst in place - keeps the first n stored ECG projectors and applies them with any other projectors
+def apply_ssp_projs(inst, n):
+    ecg_idx = [i for i, proj in enumerate(inst.info['projs']) if proj['desc'].startswith('ECG-') and not proj['active']]
+    assert 1 <= n <= len(ecg_idx), f"Error. {len(ecg_idx)} SSP projectors stored, {n} requested."
+    if n < len(ecg_idx):
+        inst.del_proj(ecg_idx[n:])
+
+    return inst.apply_proj()
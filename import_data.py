@@ -12,18 +12,30 @@
 import mne
 from get_conditioninfo import *
 from get_channels import *
-from scipy.io import loadmat
 import h5py
 import os
 import glob
 from pchip_interpolation import PCHIP_interpolation
+from stream_import_block import stream_import_block, get_stream_length
+from concatenate_blocks import allocate_blocks, add_block, get_concatenated
+from get_qrs import get_qrs, has_qrs
+from detect_qrs import detect_qrs
+from compare_qrs import compare_qrs
 import numpy as np
+from fif_fmt import get_fif_fmt
 
+prepared_path = "/data/pt_02569/tmp_data/prepared_py/"  # Output of import_data, also used by stage_files
 
-def import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation):
+
+def import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation, streaming=False, qrs_source='matlab'):
+    # streaming repairs the stimulus artefact and decimates each block chunk by chunk (stream_import_block) rather
+    # than loading it fully and resampling with FFT - memory is bounded by the chunk length
+    # qrs_source sets which QRS events are added as annotations: 'matlab' for QRS_Timing, 'python' for those found by
+    # detect_qrs - the detected ones are always saved to the .h5, and compared to QRS_Timing where it has the subject
+    assert qrs_source in ['matlab', 'python'], "Error. qrs_source must be 'matlab' or 'python'."
     # Set paths
     subject_id = f'sub-{str(subject).zfill(3)}'
-    save_path = "../tmp_data/prepared_py/" + subject_id + "/esg/prepro/"  # Saving to prepared_py
+    save_path = prepared_path + subject_id + "/esg/prepro/"  # Saving to prepared_py
     input_path = "/data/p_02068/SRMR1_experiment/bids/" + subject_id + "/eeg/"  # Taking data from the bids folder
     # cfg_path = "/data/pt_02569/"  # Contains important info about experiment
     montage_path = '/data/pt_02068/cfg/'
@@ -39,46 +51,101 @@ def import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation)
         pchip_interpolation = False
         linear_interpolation = True
 
-    # Process ESG channels and then EEG channels separately
-    for esg_flag in [True, False]:  # True for esg, false for eeg
-        # Get the condition information based on the condition read in
-        cond_info = get_conditioninfo(condition, srmr_nr)
-        cond_name = cond_info.cond_name
-        stimulation = condition - 1
-
-        # Set interpolation window (different for eeg and esg data, both in seconds)
-        tstart_esg = -0.007
-        tmax_esg = 0.007
-
-        tstart_eeg = -0.0015
-        tmax_eeg = 0.006
-
-        # Get file names that match pattern
-        search = input_path + subject_id + '*' + cond_name + '*.set'
-        cond_files = glob.glob(search)
-        cond_files = sorted(cond_files)  # Arrange in order from lowest to highest value
-        nblocks = len(cond_files)
-
-        # Find out which channels are which, include ECG, exclude EOG
-        eeg_chans, esg_chans, bipolar_chans = get_channels(subject_nr=subject, includesEcg=True, includesEog=False,
-                                                           study_nr=srmr_nr)
-
-        ####################################################################
-        # Extract the raw data for each block, remove stimulus artefact, down-sample, concatenate, detect ecg,
-        # and then save
-        ####################################################################
-        # Looping through each condition and each subject in main.py
-        # Only dealing with one condition at a time, loop through however many blocks of said condition
-        for iblock in np.arange(0, nblocks):
-            # load data - need to read in files from EEGLAB format in bids folder
-            fname = cond_files[iblock]
-            raw = mne.io.read_raw_eeglab(fname, eog=(), preload=True, uint16_codec=None, verbose=None)
-
-            # If you only want to look at esg channels, drop the rest
+    # Get the condition information based on the condition read in
+    cond_info = get_conditioninfo(condition, srmr_nr)
+    cond_name = cond_info.cond_name
+    stimulation = condition - 1
+
+    # Set interpolation window (different for eeg and esg data, both in seconds)
+    tstart_esg = -0.007
+    tmax_esg = 0.007
+
+    tstart_eeg = -0.0015
+    tmax_eeg = 0.006
+
+    # Get file names that match pattern
+    search = input_path + subject_id + '*' + cond_name + '*.set'
+    cond_files = glob.glob(search)
+    cond_files = sorted(cond_files)  # Arrange in order from lowest to highest value
+    nblocks = len(cond_files)
+
+    # Find out which channels are which, include ECG, exclude EOG
+    eeg_chans, esg_chans, bipolar_chans = get_channels(subject_nr=subject, includesEcg=True, includesEog=False,
+                                                       study_nr=srmr_nr)
+
+    # Read in the array of electrodes from file
+    montage = mne.channels.read_custom_montage(montage_path + montage_name)
+
+    ####################################################################
+    # Extract the raw data for each block, remove stimulus artefact, down-sample, concatenate, detect ecg,
+    # and then save
+    ####################################################################
+    # Looping through each condition and each subject in main.py
+    # Only dealing with one condition at a time, loop through however many blocks of said condition
+    # Each block is read once and split into the ESG and EEG channels, which are then processed separately
+    # The blocks of each channel group are written into one array allocated from the lengths in the block headers
+    srate_basic = 1000  # Perform all analysis at 1000Hz
+    block_lengths = []
+    for fname in cond_files:
+        raw_header = mne.io.read_raw_eeglab(fname, eog=(), preload=False, uint16_codec=None, verbose=None)
+        n_times, sfreq = raw_header.n_times, raw_header.info['sfreq']
+        if streaming:
+            block_lengths.append(get_stream_length(n_times, sfreq, srate_basic))  # As stream_import_block decimates
+        else:
+            block_lengths.append(max(int(round(n_times * srate_basic / sfreq)), 1))  # As raw.resample
+    raw_concat = {True: allocate_blocks(block_lengths), False: allocate_blocks(block_lengths)}  # Keyed by esg_flag
+    for iblock in np.arange(0, nblocks):
+        # load data - need to read in files from EEGLAB format in bids folder
+        fname = cond_files[iblock]
+        raw_block = mne.io.read_raw_eeglab(fname, eog=(), preload=not streaming, uint16_codec=None, verbose=None)
+
+        # events contains timestamps with corresponding event_id
+        # event_dict returns the event/trigger names with their corresponding event_id
+        # Same for both channel groups, so only computed once per block
+        events, event_dict = mne.events_from_annotations(raw_block)
+
+        # Fetch the event_id based on whether it was tibial/medial stimulation (trigger name)
+        trigger_name = set(raw_block.annotations.description)
+
+        if streaming:
+            # Both channel groups are repaired and decimated in one chunked pass over the block, keeping the channel
+            # order of the block as pick_channels does
+            srate_basic = 1000  # Perform all analysis at 1000Hz
+            group_chans = {True: [ch for ch in raw_block.ch_names if ch in esg_chans],
+                           False: [ch for ch in raw_block.ch_names if ch in eeg_chans]}
+            # Only interpolate tibial, medial and alternating (conditions 2, 3, 4 ; stimulation 1, 2, 3)
+            if stimulation != 0:
+                trigger_points = events[:, 0]
+            else:
+                trigger_points = np.array([], dtype=int)
+            group_data = stream_import_block(raw_block, [(group_chans[True], [tstart_esg, tmax_esg]),
+                                                         (group_chans[False], [tstart_eeg, tmax_eeg])],
+                                             trigger_points, srate_basic, pchip_interpolation)
+            group_data = {True: group_data[0], False: group_data[1]}
+
+        for esg_flag in [True, False]:  # True for esg, false for eeg
+            if streaming:
+                # New raw at srate_basic with the channel info and annotations of the block
+                raw_group = raw_block.copy().pick_channels(group_chans[esg_flag])
+                if not esg_flag:
+                    raw_group.set_montage(montage, on_missing="ignore")
+                info = raw_group.info.copy()
+                with info._unlock():
+                    info['sfreq'] = srate_basic
+                    info['lowpass'] = min(info['lowpass'], srate_basic / 2)
+                raw = mne.io.RawArray(group_data[esg_flag], info)
+                raw.set_annotations(raw_block.annotations)
+
+                # Append blocks of the same condition
+                add_block(raw_concat[esg_flag], iblock, raw)
+                continue
+
+            # Split the channel group out of the block read in - ECG is in both groups so ESG gets a copy, the EEG
+            # channels are picked from the block itself
             if esg_flag:
-                raw.pick_channels(esg_chans)
+                raw = raw_block.copy().pick_channels(esg_chans)
             else:
-                raw.pick_channels(eeg_chans)
+                raw = raw_block.pick_channels(eeg_chans)
 
             # Interpolate required channels
             # Only interpolate tibial, medial and alternating (conditions 2, 3, 4 ; stimulation 1, 2, 3)
@@ -86,20 +153,10 @@ def import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation)
                 srate_basic = 1000  # Perform all analysis at 1000Hz
 
                 if not esg_flag:
-                    # Read in the array of electrodes from file
-                    montage = mne.channels.read_custom_montage(montage_path + montage_name)
-
                     # fits channel locations to data
                     raw.set_montage(montage, on_missing="ignore")
                     # Have to use ignore as the montage only includes EEG head channels (can't work with esg)
 
-                # events contains timestamps with corresponding event_id
-                # event_dict returns the event/trigger names with their corresponding event_id
-                events, event_dict = mne.events_from_annotations(raw)
-
-                # Fetch the event_id based on whether it was tibial/medial stimulation (trigger name)
-                trigger_name = set(raw.annotations.description)
-
                 # Acts in place to edit raw via linear interpolation to remove stimulus artefact
                 # Need to loop as for alternating, there are 2 trigger names and event_ids at play
                 for j in trigger_name:
@@ -109,12 +166,14 @@ def import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation)
 
                     if linear_interpolation:
                         if esg_flag:
-                            mne.preprocessing.fix_stim_artifact(raw, events=events, event_id=event_dict[j], tmin=tstart_esg,
-                                                                tmax=tmax_esg, mode='linear', stim_channel=None)
+                            mne.preprocessing.fix_stim_artifact(raw, events=events, event_id=event_dict[j],
+                                                                tmin=tstart_esg, tmax=tmax_esg, mode='linear',
+                                                                stim_channel=None)
 
                         elif not esg_flag:
-                            mne.preprocessing.fix_stim_artifact(raw, events=events, event_id=event_dict[j], tmin=tstart_eeg,
-                                                                tmax=tmax_eeg, mode='linear', stim_channel=None)
+                            mne.preprocessing.fix_stim_artifact(raw, events=events, event_id=event_dict[j],
+                                                                tmin=tstart_eeg, tmax=tmax_eeg, mode='linear',
+                                                                stim_channel=None)
 
                         else:
                             print('Flag has not been set - indicate if you are working with eeg or esg channels')
@@ -127,8 +186,9 @@ def import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation)
                                 debug_mode=False, interpol_window_sec=interpol_window,
                                 trigger_indices=trigger_points, fs=sampling_rate_og
                             )
-                            raw.apply_function(PCHIP_interpolation, picks=esg_chans, **PCHIP_kwargs,
-                                               n_jobs=len(esg_chans))
+                            # All channels and events in one batched pass
+                            raw.apply_function(PCHIP_interpolation, picks=esg_chans, channel_wise=False,
+                                               **PCHIP_kwargs)
 
                         elif not esg_flag:
                             interpol_window = [tstart_eeg, tmax_eeg]
@@ -136,58 +196,67 @@ def import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation)
                                 debug_mode=False, interpol_window_sec=interpol_window,
                                 trigger_indices=trigger_points, fs=sampling_rate_og
                             )
-                            raw.apply_function(PCHIP_interpolation, picks=eeg_chans, **PCHIP_kwargs,
-                                               n_jobs=len(eeg_chans))
+                            # All channels and events in one batched pass
+                            raw.apply_function(PCHIP_interpolation, picks=eeg_chans, channel_wise=False,
+                                               **PCHIP_kwargs)
 
             # Downsample the data
             raw.resample(srate_basic)  # resamples to srate_basic
 
             # Append blocks of the same condition
-            if iblock == 0:
-                raw_concat = raw
-            else:
-                mne.concatenate_raws([raw_concat, raw])
+            add_block(raw_concat[esg_flag], iblock, raw)
 
-        # Detect ECG events
-        ecg_events, ch_ecg, average_pulse = mne.preprocessing.find_ecg_events(raw_concat, event_id=999, ch_name='ECG',
-                                                                              tstart=0, l_freq=5,
-                                                                              h_freq=35, qrs_threshold='auto',
-                                                                              filter_length='5s')
+        del raw_block, raw
+        if streaming:
+            del group_data
 
-        # Read .mat file with QRS events
-        input_path_m = "/data/pt_02569/tmp_data/prepared/"+subject_id+"/esg/prepro/"
-        fname_m = f"raw_{sampling_rate}_spinal_{cond_name}"
-        matdata = loadmat(input_path_m + fname_m + '.mat')
-        QRSevents_m = matdata['QRSevents'][0]
+    raw_concat = {esg_flag: get_concatenated(raw_concat[esg_flag]) for esg_flag in [True, False]}
+
+    # Detect R peaks on the ECG channel - only saved for the spinal data, so only detected there
+    qrs_detected = detect_qrs(raw_concat[True].get_data(picks=['ECG'])[0], srate_basic)
+
+    # QRS events from the store built from QRS_Timing (build_qrs_store), cross-checked against the detected ones
+    # The detected ones don't need the store, subjects without QRS_Timing are only run with qrs_source='python'
+    if qrs_source == 'python':
+        QRSevents_m = qrs_detected
+    else:
+        QRSevents_m = get_qrs(subject, condition, srmr_nr, sampling_rate)
+    if has_qrs(subject, condition, srmr_nr, sampling_rate):
+        compare_qrs(qrs_detected, get_qrs(subject, condition, srmr_nr, sampling_rate), srate_basic)
 
-        # Add qrs events as annotations
-        qrs_event = [x / sampling_rate for x in QRSevents_m]  # Divide by sampling rate to make times
-        duration = np.repeat(0.0, len(QRSevents_m))
-        description = ['qrs'] * len(QRSevents_m)
+    # Add qrs events as annotations
+    qrs_event = [x / sampling_rate for x in QRSevents_m]  # Divide by sampling rate to make times
+    duration = np.repeat(0.0, len(QRSevents_m))
+    description = ['qrs'] * len(QRSevents_m)
 
+    for esg_flag in [True, False]:
         # Set filenames and append QRS annotations
         if linear_interpolation:
             if esg_flag:
-                raw_concat.annotations.append(qrs_event, duration, description, ch_names=[esg_chans] * len(QRSevents_m))
+                raw_concat[esg_flag].annotations.append(qrs_event, duration, description,
+                                                        ch_names=[esg_chans] * len(QRSevents_m))
                 fname_save = f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif'
             else:
-                raw_concat.annotations.append(qrs_event, duration, description, ch_names=[eeg_chans] * len(QRSevents_m))
+                raw_concat[esg_flag].annotations.append(qrs_event, duration, description,
+                                                        ch_names=[eeg_chans] * len(QRSevents_m))
                 fname_save = f'noStimart_sr{sampling_rate}_{cond_name}_withqrs_eeg.fif'
 
         elif pchip_interpolation:
             if esg_flag:
-                raw_concat.annotations.append(qrs_event, duration, description, ch_names=[esg_chans] * len(QRSevents_m))
+                raw_concat[esg_flag].annotations.append(qrs_event, duration, description,
+                                                        ch_names=[esg_chans] * len(QRSevents_m))
                 fname_save = f'noStimart_sr{sampling_rate}_{cond_name}_withqrs_pchip.fif'
             else:
-                raw_concat.annotations.append(qrs_event, duration, description, ch_names=[eeg_chans] * len(QRSevents_m))
+                raw_concat[esg_flag].annotations.append(qrs_event, duration, description,
+                                                        ch_names=[eeg_chans] * len(QRSevents_m))
                 fname_save = f'noStimart_sr{sampling_rate}_{cond_name}_withqrs_eeg_pchip.fif'
 
         # Save data without stim artefact and downsampled to 1000
-        raw_concat.save(os.path.join(save_path, fname_save), fmt='double', overwrite=True)
+        raw_concat[esg_flag].save(os.path.join(save_path, fname_save), fmt=get_fif_fmt(), overwrite=True)
 
         # Save detected QRS events if we're looking at correcting spinal data
         if esg_flag:
             dataset_keyword = 'QRS'
             fn = save_path + 'noStimart_sr%s_%s_withqrs.h5' % (srate_basic, cond_name)
             with h5py.File(fn, "w") as outfile:
-                outfile.create_dataset(dataset_keyword, data=ecg_events[:, 0])
+                outfile.create_dataset(dataset_keyword, data=qrs_detected)
@@ -0,0 +1,18 @@
+# Worker processes each stage may start for its parallel calls (apply_function_shared, the n_jobs of mne calls)
+# stage_scheduler sets it to threads_per_task in each task it runs, so cpu_budget // threads_per_task stages at a time
+# with at most threads_per_task workers each stay within cpu_budget - outside the scheduler there is no limit
+# apply_function_shared(raw, fun, picks, n_jobs=get_n_jobs(len(raw.ch_names)))
+
+job_setting = {'max_jobs': None}
+
+
+def set_max_jobs(max_jobs):
+    assert max_jobs is None or max_jobs >= 1, "Error. max_jobs must be None or at least 1."
+    job_setting['max_jobs'] = max_jobs
+
+
+def get_n_jobs(n_jobs):
+    if job_setting['max_jobs'] is None:
+        return n_jobs
+
+    return min(n_jobs, job_setting['max_jobs'])
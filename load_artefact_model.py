@@ -0,0 +1,137 @@
+# Lazy loader for the PCA_OBS artefact model written by save_artefact_model
+# load_artefact_model only reads the geometry - the template, coefficients and edge fits are read from the file when
+# the fitted artefact of a channel subset and time range is asked for
+# get_fitted_art rebuilds the fitted artefact, get_cleaned subtracts it (with the one sample shift of PCA_OBS) from
+# the data PCA_OBS was run on and get_cleaned_raw does the same for a whole mne raw structure
+# Any Tukey taper can be rebuilt from the same model, tukey_alpha=None gives plain PCA_OBS
+# model = load_artefact_model(fname)
+# fitted_art = get_fitted_art(model, picks=[0, 3], start=10000, stop=20000, tukey_alpha=0.25)
+
+import numpy as np
+import h5py
+import mne
+from get_heartbeat_geometry import get_heartbeat_geometry
+from fit_ecgTemplate_multichannel import assemble_fitted_art
+
+
+def load_artefact_model(fname):
+    # Declare class to hold the artefact model
+    class ArtefactModel():
+        def __init__(self):
+            pass
+
+    model = ArtefactModel()
+    model.file = h5py.File(fname, "r")  # Stays open, datasets are only read when needed
+    model.n_times = int(model.file.attrs['n_times'])
+    model.sr = model.file.attrs['sr']
+    model.channel_mean = model.file['channel_mean'][()]
+    model.n_chans = len(model.channel_mean)
+    if 'ch_names' in model.file.keys():
+        model.ch_names = [ch.decode() for ch in model.file['ch_names'][()]]
+    else:
+        model.ch_names = None
+    model.edge_beats = model.file['edge_beats'][()]
+    model.geometry = get_heartbeat_geometry(model.file['QRS'][()], model.n_times)
+
+    return model
+
+
+# Geometry of the consecutive beats b0 to b1 (not included), with sample indices relative to offset
+def get_beat_subset(geometry, b0, b1, offset, n_times):
+    class HeartbeatGeometry():
+        def __init__(self):
+            pass
+
+    subset = HeartbeatGeometry()
+    subset.n_times = n_times
+    subset.peak_range = geometry.peak_range
+    subset.n_samples_fit = geometry.n_samples_fit
+    subset.fit_peaks = geometry.fit_peaks[b0:b1] - offset
+    subset.pre_range = geometry.pre_range[b0:b1]
+    subset.post_range = geometry.post_range[b0:b1]
+
+    # Interpolation gaps between consecutive fitted windows, as in get_heartbeat_geometry
+    intpol_start = subset.fit_peaks[:-1] + subset.post_range[:-1]
+    intpol_end = subset.fit_peaks[1:] - subset.pre_range[1:]
+    gaps = intpol_start < intpol_end
+    subset.intpol_start = intpol_start[gaps]
+    subset.intpol_end = intpol_end[gaps]
+
+    return subset
+
+
+def get_fitted_art(model, picks=None, start=0, stop=None, tukey_alpha=None):
+    # Fitted artefact [len(picks) x (stop - start)] of the channels in picks (indices into the model channels)
+    if picks is None:
+        picks = np.arange(0, model.n_chans)
+    if stop is None:
+        stop = model.n_times
+    picks = np.asarray(picks)
+    geometry = model.geometry
+    peak_range = geometry.peak_range
+    fitted_art = np.zeros((len(picks), stop - start))
+
+    # A sample is either in the fitted window of a beat within peak_range + 1 of it or in the gap between two
+    # consecutive beats - so only beats near the range plus one either side are needed
+    b0 = max(np.searchsorted(geometry.fit_peaks, start - peak_range - 1) - 1, 0)
+    b1 = min(np.searchsorted(geometry.fit_peaks, stop + peak_range + 1) + 1, len(geometry.fit_peaks))
+    if b0 >= b1:
+        return fitted_art
+
+    # h5py reads need increasing indices
+    order = np.argsort(picks)
+    read_picks = picks[order]
+    template = model.file['template'][read_picks, :, :]
+    coeffs = model.file['coeffs'][read_picks, b0:b1, :]
+    edge_fit = {}
+    for e, b in enumerate(model.edge_beats):
+        if b0 <= b < b1:
+            edge_fit[b - b0] = model.file['edge_fit'][e, read_picks, :]
+
+    # Rebuild only the stretch of data covered by these beats
+    offset = max(geometry.fit_peaks[b0] - peak_range - 1, 0)
+    end = min(geometry.fit_peaks[b1 - 1] + peak_range + 1, model.n_times)
+    subset = get_beat_subset(geometry, b0, b1, offset, end - offset)
+    local_art = assemble_fitted_art(len(picks), template, coeffs, edge_fit, subset, [tukey_alpha])[tukey_alpha]
+
+    # Copy the overlap with the requested range, back in the order of picks
+    lo = max(start, offset)
+    hi = min(stop, end)
+    if lo < hi:
+        fitted_art[order, lo - start:hi - start] = local_art[:, lo - offset:hi - offset]
+
+    return fitted_art
+
+
+def get_cleaned(model, data, picks=None, start=0, tukey_alpha=None):
+    # data is the data PCA_OBS was run on [len(picks) x time] for the samples from start onwards
+    # returns the cleaned data, the same as PCA_OBS_variants for these channels and samples
+    if picks is None:
+        picks = np.arange(0, model.n_chans)
+    stop = start + data.shape[1]
+    cleaned = data - model.channel_mean[np.asarray(picks), np.newaxis]
+
+    # One sample shift purely due to the fact the r-peaks are currently detected in MATLAB
+    if start == 0:
+        cleaned[:, 1:] -= get_fitted_art(model, picks, 0, stop - 1, tukey_alpha)
+    else:
+        cleaned -= get_fitted_art(model, picks, start - 1, stop - 1, tukey_alpha)
+
+    return cleaned
+
+
+def get_cleaned_raw(model, raw, tukey_alpha=None):
+    # raw is the mne structure PCA_OBS was run on (import_data output), returns a copy with the cleaned data and the
+    # fit_start/fit_end annotations, as saved by rm_heart_artefact
+    assert model.ch_names is not None, "Error. Artefact model was saved without channel names."
+    raw_clean = raw.copy().load_data()
+    picks = mne.pick_channels(raw_clean.ch_names, model.ch_names, ordered=True)
+    raw_clean._data[picks, :] = get_cleaned(model, raw_clean._data[picks, :], tukey_alpha=tukey_alpha)
+
+    for name, idx in zip(['fit_start', 'fit_end'], [model.geometry.window_start_idx, model.geometry.window_end_idx]):
+        onset = [x/model.sr for x in idx]
+        duration = np.repeat(0.0, len(idx))
+        description = [name] * len(idx)
+        raw_clean.annotations.append(onset, duration, description, ch_names=[model.ch_names] * len(idx))
+
+    return raw_clean
@@ -13,16 +13,23 @@ from ICA import run_ica
 from ICA_anterior import run_ica_anterior
 from ICA_separated import run_ica_separatepatches
 from run_CCA import run_CCA
+from fif_fmt import set_fif_fmt
+from filter_esg import set_filter_method
+from stage_scheduler import run_tasks
 
 if __name__ == '__main__':
     ######## Want to import the data? ############
     import_d = False  # Prep work
     pchip_interpolation = False  # If true import with pchip, otherwise use linear interpolation
+    streaming_import = False  # If true repair and downsample each block in chunks rather than loading it fully
+    qrs_source = 'matlab'  # 'matlab' for the QRS events of QRS_Timing, 'python' for those found by detect_qrs
 
     ######## Want to use PCA_OBS to remove the heart artefact? #########
     heart_removal = False  # Heart artefact removal
     pchip = False  # Whether to use pchip prepared data or not
     heart_removal_tukey = False  # Fitted artefact multiplied by tukey window
+    save_model = False  # Also save the artefact model, cleaned data of any variant can be rebuilt from it
+    save_fif = True  # Save the cleaned data of each variant
 
     ######## Want to cut epochs from the PCA_OBS corrected data? ########
     cut_epochs = False  # Epoch the data according to relevant event
@@ -46,6 +53,16 @@ if __name__ == '__main__':
     srmr_nr = 1  # Experiment Number
     conditions = [2, 3]  # Conditions of interest
     sampling_rate = 1000
+    fif_fmt = 'double'  # 'single' stores the .fif output of every stage as float32 (see Metrics/validate_fif_fmt.py)
+    set_fif_fmt(fif_fmt)
+    # 'fir' filters with the band-pass and FIR notch fused into one kernel, 'sos' with the band-pass and an IIR notch as
+    # one cascade (see validate_filter_esg.py)
+    filter_method = 'fir'
+    set_filter_method(filter_method)
+    skip_up_to_date = True  # Skip stages whose inputs, parameters and code are unchanged since their last run
+    cpu_budget = 1  # CPUs for the whole pipeline - independent subjects and conditions run at the same time
+    threads_per_task = 1  # BLAS threads and worker processes per stage, cpu_budget // threads_per_task stages at once
+    tasks = []  # (stage, arguments) in pipeline order, run by run_tasks once all are collected
 
     ############################################
     # Import Data from BIDS directory
@@ -58,49 +75,51 @@ if __name__ == '__main__':
     if import_d:
         for subject in subjects:
             for condition in conditions:
-                import_data(subject, condition, srmr_nr, sampling_rate, pchip_interpolation)
-
-    ## To remove heart artifact via PCA_OBS ##
-    if heart_removal:
+                tasks.append((import_data, (subject, condition, srmr_nr, sampling_rate, pchip_interpolation,
+                                            streaming_import, qrs_source)))
+
+    ## To remove heart artifact via PCA_OBS, with and/or without the fitted artefact multiplied by a tukey window ##
+    ## Both variants come from one PCA_OBS run ##
+    if heart_removal or heart_removal_tukey:
+        tukey_alphas = []
+        if heart_removal:
+            tukey_alphas.append(None)
+        if heart_removal_tukey:
+            tukey_alphas.append(0.25)
         for subject in subjects:
             for condition in conditions:
-                rm_heart_artefact(subject, condition, srmr_nr, sampling_rate, pchip)
+                tasks.append((rm_heart_artefact, (subject, condition, srmr_nr, sampling_rate, pchip, tukey_alphas,
+                                                  save_model, save_fif, qrs_source)))
                 # If pchip is true, uses data where stim artefact was removed by pchip
 
-    ## To remove heart artifact via PCA_OBS and tukey window ##
-    if heart_removal_tukey:
-        for subject in subjects:
-            for condition in conditions:
-                rm_heart_artefact_tukey(subject, condition, srmr_nr, sampling_rate, pchip)
-
     ## To cut epochs around triggers - only for PCA_OBS cleaned data here ##
     ## To cut epochs for all data types use get_epoched  ##
     if cut_epochs:
         for subject in subjects:
             for condition in conditions:
-                epoch_data(subject, condition, srmr_nr, sampling_rate)
+                tasks.append((epoch_data, (subject, condition, srmr_nr, sampling_rate)))
 
     ## Run ICA on data ##
     if ica:
         for subject in subjects:
             for condition in conditions:
-                run_ica(subject, condition, srmr_nr, sampling_rate, choose_limited)
+                tasks.append((run_ica, (subject, condition, srmr_nr, sampling_rate, choose_limited)))
 
     if ica_anterior:
         for subject in subjects:
             for condition in conditions:
-                run_ica_anterior(subject, condition, srmr_nr, sampling_rate)
+                tasks.append((run_ica_anterior, (subject, condition, srmr_nr, sampling_rate)))
 
     if ica_separate_patches:
         for subject in subjects:
             for condition in conditions:
-                run_ica_separatepatches(subject, condition, srmr_nr, sampling_rate)
+                tasks.append((run_ica_separatepatches, (subject, condition, srmr_nr, sampling_rate)))
 
     ## To remove heart artifact using SSP method in MNE ##
     if SSP_flag:
         for subject in subjects:
             for condition in conditions:
-                apply_SSP(subject, condition, srmr_nr, sampling_rate)
+                tasks.append((apply_SSP, (subject, condition, srmr_nr, sampling_rate)))
 
     ## Run CCA on the data ##
     data_strings = ['Prep', 'PCA']  # ' Post-ICA' no longer used, 'ICA' not used due to how decimated the signal is
@@ -109,11 +128,14 @@ if __name__ == '__main__':
         for data_string in data_strings:
             for subject in subjects:
                 for condition in conditions:
-                    run_CCA(subject, condition, srmr_nr, data_string, n)
+                    tasks.append((run_CCA, (subject, condition, srmr_nr, data_string, n)))
 
         # Treat SSP separately
         data_string = 'SSP'
         for n in np.arange(5, 7):  # 21
             for subject in subjects:
                 for condition in conditions:
-                    run_CCA(subject, condition, srmr_nr, data_string, n)
+                    tasks.append((run_CCA, (subject, condition, srmr_nr, data_string, n)))
+
+    ## Run all stages collected above - each waits for the stages writing its inputs, up to date ones are skipped ##
+    run_tasks(tasks, cpu_budget, threads_per_task, skip_up_to_date)
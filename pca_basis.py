@@ -0,0 +1,72 @@
+# Computes the PCA basis of the heartbeat matrix used by PCA_OBS
+# Works on a single [epoch x time] matrix or a stack of them [channel x epoch x time]
+# svd_solver:
+#   'full' - complete SVD, all components (as sklearn PCA(svd_solver="full"))
+#   'covariance' - eigendecomposition of the small [time x time] covariance, top n_components only
+#   'randomized' - randomized SVD with power iterations, top n_components only
+#   'arpack' - scipy svds, top n_components only
+# The explained variance ratio is always relative to the total variance (trace of the covariance), so it is the same
+# for the first components whichever solver is used
+
+import numpy as np
+from scipy.linalg import eigh
+from scipy.sparse.linalg import svds
+
+
+def pca_basis(dpcamat, n_components=None, svd_solver='full'):
+    assert svd_solver in ['full', 'covariance', 'randomized', 'arpack'], "Error. Unknown svd_solver passed into pca_basis."
+    assert svd_solver == 'full' or n_components is not None, "Error. Truncated svd_solver needs n_components."
+
+    # PCA centres each time point
+    dpcamat = dpcamat - np.mean(dpcamat, axis=-2, keepdims=True)
+    n_epochs, n_times = dpcamat.shape[-2:]
+    total_var = np.sum(dpcamat**2, axis=(-2, -1)) / (n_epochs - 1)
+
+    if svd_solver == 'full':
+        _, s, eigen_vectors = np.linalg.svd(dpcamat, full_matrices=False)
+        eigen_values = s**2 / (n_epochs - 1)
+        if n_components is not None:
+            eigen_vectors = eigen_vectors[..., 0:n_components, :]
+            eigen_values = eigen_values[..., 0:n_components]
+
+    elif svd_solver == 'covariance':
+        stack = dpcamat.reshape(-1, n_epochs, n_times)
+        eigen_vectors = np.zeros((len(stack), n_components, n_times))
+        eigen_values = np.zeros((len(stack), n_components))
+        for i, mat in enumerate(stack):
+            cov = np.dot(mat.T, mat) / (n_epochs - 1)
+            evals, evecs = eigh(cov, subset_by_index=[n_times - n_components, n_times - 1])
+            eigen_values[i] = evals[::-1]  # Largest first
+            eigen_vectors[i] = evecs[:, ::-1].T
+        eigen_vectors = eigen_vectors.reshape(dpcamat.shape[:-2] + (n_components, n_times))
+        eigen_values = eigen_values.reshape(dpcamat.shape[:-2] + (n_components,))
+
+    elif svd_solver == 'randomized':
+        # Range finder on all stacked matrices at once, oversampled and with power iterations for accuracy
+        rng = np.random.default_rng(0)
+        n_random = min(n_components + 10, n_epochs, n_times)
+        Q = np.matmul(dpcamat, rng.standard_normal((n_times, n_random)))
+        for _ in range(7):
+            Q, _ = np.linalg.qr(Q)
+            Q, _ = np.linalg.qr(np.matmul(np.swapaxes(dpcamat, -2, -1), Q))
+            Q = np.matmul(dpcamat, Q)
+        Q, _ = np.linalg.qr(Q)
+        _, s, eigen_vectors = np.linalg.svd(np.matmul(np.swapaxes(Q, -2, -1), dpcamat), full_matrices=False)
+        eigen_vectors = eigen_vectors[..., 0:n_components, :]
+        eigen_values = s[..., 0:n_components]**2 / (n_epochs - 1)
+
+    elif svd_solver == 'arpack':
+        stack = dpcamat.reshape(-1, n_epochs, n_times)
+        eigen_vectors = np.zeros((len(stack), n_components, n_times))
+        eigen_values = np.zeros((len(stack), n_components))
+        for i, mat in enumerate(stack):
+            _, s, vt = svds(mat, k=n_components, random_state=0)
+            order = np.argsort(s)[::-1]  # Largest first
+            eigen_values[i] = s[order]**2 / (n_epochs - 1)
+            eigen_vectors[i] = vt[order]
+        eigen_vectors = eigen_vectors.reshape(dpcamat.shape[:-2] + (n_components, n_times))
+        eigen_values = eigen_values.reshape(dpcamat.shape[:-2] + (n_components,))
+
+    expl_var = eigen_values / np.asarray(total_var)[..., np.newaxis]
+
+    return eigen_vectors, eigen_values, expl_var
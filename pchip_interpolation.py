@@ -1,4 +1,5 @@
 # Function to interpolate based on PCHIP rather than MNE inbuilt linear option
+# data is a single channel or [channel x time], so all channels can be interpolated in one call
 
 import mne
 import numpy as np
@@ -23,7 +24,8 @@ def PCHIP_interpolation(data, **kwargs):
         plot_range = [-50, 100]
         test_trial = 100
         xx = (np.arange(plot_range[0], plot_range[1])) / fs * 1000
-        plt.plot(xx, data[trigger_indices[test_trial] + plot_range[0]:trigger_indices[test_trial] + plot_range[1]])
+        plot_idx = np.arange(plot_range[0], plot_range[1]) + trigger_indices[test_trial]
+        plt.plot(xx, data[..., plot_idx].T)
 
     # Convert intpol window to msec then convert to samples
     pre_window = round((interpol_window_sec[0]*1000) * fs / 1000)  # in samples
@@ -36,24 +38,105 @@ def PCHIP_interpolation(data, **kwargs):
                                 np.arange(intpol_window[1]+1, intpol_window[1]+n_samples_fit+2, 1)])
     x_interpol_raw = np.arange(intpol_window[0], intpol_window[1]+1, 1)  # points to be interpolated; in pt
 
-    for ii in np.arange(0, len(trigger_indices)):  # loop through all stimulation events
-        x_fit = trigger_indices[ii] + x_fit_raw  # fit point latencies for this event
-        x_interpol = trigger_indices[ii] + x_interpol_raw  # latencies for to-be-interpolated data points
+    trigger_indices = np.asarray(trigger_indices).reshape(-1)
+    sorted_triggers = np.sort(trigger_indices)
 
-        # Data is just a string of values
-        y_fit = data[x_fit]  # y values to be fitted
-        y_interpol = pchip(x_fit, y_fit)(x_interpol)  # perform interpolation
-        data[x_interpol] = y_interpol  # replace in data
+    # Events are independent unless a fit window reaches into the interpolated samples of a neighbouring event
+    if np.all(np.diff(sorted_triggers) > x_fit_raw[-1] - x_fit_raw[0]):
+        # All events and channels at once - gather the fit points of every event [... x event x point], evaluate
+        # the PCHIP of each event in closed form and put all interpolated samples back with one assignment
+        x_fit = trigger_indices[:, np.newaxis] + x_fit_raw
+        x_interpol = (trigger_indices[:, np.newaxis] + x_interpol_raw).reshape(-1)
+        event_idx = np.repeat(np.arange(0, len(trigger_indices)), len(x_interpol_raw))
+        data[..., x_interpol] = pchip_batch(x_fit, data[..., x_fit], x_interpol, event_idx)
+        print(f'{len(trigger_indices)} stimulation events interpolated \n')
 
-        if np.mod(ii, 100) == 0:  # talk to the operator every 100th trial
-            print(f'stimulation event {ii} \n')
+    else:
+        # Overlapping events - each one has to see the result of the ones before
+        for ii in np.arange(0, len(trigger_indices)):  # loop through all stimulation events
+            x_fit = trigger_indices[ii] + x_fit_raw  # fit point latencies for this event
+            x_interpol = trigger_indices[ii] + x_interpol_raw  # latencies for to-be-interpolated data points
+
+            y_fit = data[..., x_fit]  # y values to be fitted
+            y_interpol = pchip(x_fit, y_fit, axis=-1)(x_interpol)  # perform interpolation
+            data[..., x_interpol] = y_interpol  # replace in data
+
+            if np.mod(ii, 100) == 0:  # talk to the operator every 100th trial
+                print(f'stimulation event {ii} \n')
 
     if debug_mode:
         # plot signal with interpolated artifact
         plt.figure()
-        plt.plot(xx, data[trigger_indices[test_trial] + plot_range[0]: trigger_indices[test_trial] + plot_range[1]])
+        plt.plot(xx, data[..., plot_idx].T)
         plt.title('After Correction')
 
     plt.show()
 
     return data
+
+
+# Slopes of the Piecewise Cubic Hermite Interpolating Polynomial at each fit point along the last axis
+# Same as the derivatives scipy's PchipInterpolator uses, computed for many sets of fit points at once
+def pchip_slopes(x_fit, y_fit):
+    hk = np.diff(x_fit, axis=-1)
+    mk = np.diff(y_fit, axis=-1) / hk
+
+    # Only two points - straight line
+    if x_fit.shape[-1] == 2:
+        return np.concatenate([mk, mk], axis=-1)
+
+    # Interior points - weighted harmonic mean of the neighbouring secants, zero at local extrema
+    smk = np.sign(mk)
+    condition = (smk[..., 1:] != smk[..., :-1]) | (mk[..., 1:] == 0) | (mk[..., :-1] == 0)
+    w1 = 2 * hk[..., 1:] + hk[..., :-1]
+    w2 = hk[..., 1:] + 2 * hk[..., :-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        whmean = (w1 / mk[..., :-1] + w2 / mk[..., 1:]) / (w1 + w2)
+        dk_inner = np.where(condition, 0., 1. / whmean)
+
+    # End points - one sided three point estimate, kept shape preserving
+    def edge_case(h0, h1, m0, m1):
+        d = ((2 * h0 + h1) * m0 - h0 * m1) / (h0 + h1)
+        mask = np.sign(d) != np.sign(m0)
+        mask2 = (np.sign(m0) != np.sign(m1)) & (np.abs(d) > 3. * np.abs(m0))
+        d = np.where(~mask & mask2, 3. * m0, d)
+        return np.where(mask, 0., d)
+
+    d_first = edge_case(hk[..., 0], hk[..., 1], mk[..., 0], mk[..., 1])
+    d_last = edge_case(hk[..., -1], hk[..., -2], mk[..., -1], mk[..., -2])
+
+    return np.concatenate([d_first[..., np.newaxis], dk_inner, d_last[..., np.newaxis]], axis=-1)
+
+
+# PCHIP interpolation for many independent sets of fit points in one array pass
+# x_fit is [event x point] and strictly increasing along each row, y_fit is [... x event x point]
+# x_interpol are the points to interpolate and event_idx the event (row of x_fit) each one belongs to
+# Returns [... x len(x_interpol)], matching PchipInterpolator(x_fit[e], y_fit[..., e, :], axis=-1) for every event e
+def pchip_batch(x_fit, y_fit, x_interpol, event_idx):
+    x_fit = np.asarray(x_fit, dtype=float)
+    y_fit = np.asarray(y_fit, dtype=float)
+    x_interpol = np.asarray(x_interpol, dtype=float)
+    n_points = x_fit.shape[-1]
+    dk = pchip_slopes(np.broadcast_to(x_fit, y_fit.shape), y_fit)
+
+    # Locate the interval of each point to interpolate - rows are offset so one sorted search covers all events
+    rel_fit = x_fit - x_fit[:, :1]
+    rel_interpol = x_interpol - x_fit[event_idx, 0]
+    span = max(rel_fit.max(), rel_interpol.max()) + 1
+    offsets = np.arange(len(x_fit)) * span
+    k = np.searchsorted((rel_fit + offsets[:, np.newaxis]).ravel(), rel_interpol + offsets[event_idx], side='right')
+    k = np.clip(k - 1 - event_idx * n_points, 0, n_points - 2)
+
+    # Cubic Hermite polynomial on each interval
+    x0 = x_fit[event_idx, k]
+    h = x_fit[event_idx, k + 1] - x0
+    t = x_interpol - x0
+    y0 = y_fit[..., event_idx, k]
+    y1 = y_fit[..., event_idx, k + 1]
+    d0 = dk[..., event_idx, k]
+    d1 = dk[..., event_idx, k + 1]
+    m = (y1 - y0) / h
+    c2 = (3 * m - 2 * d0 - d1) / h
+    c3 = (d0 + d1 - 2 * m) / h**2
+
+    return y0 + t * (d0 + t * (c2 + t * c3))
@@ -2,16 +2,25 @@
 # Analysis, Optimal Basis Sets)
 
 import os
-from scipy.io import loadmat
 from scipy.signal import firls
 from PCA_OBS import *
+from PCA_OBS_multichannel import PCA_OBS_variants
 from get_conditioninfo import *
 from get_channels import *
-
-
-def rm_heart_artefact(subject, condition, srmr_nr, sampling_rate, pchip):
+from get_heartbeat_geometry import get_heartbeat_geometry
+from get_qrs import get_qrs
+from fif_fmt import get_fif_fmt
+
+
+def rm_heart_artefact(subject, condition, srmr_nr, sampling_rate, pchip, tukey_alphas=(None,), save_model=False,
+                      save_fif=True, qrs_source='matlab'):
+    # tukey_alphas sets the variants produced from the one PCA_OBS run: None for plain PCA_OBS and/or the alpha of
+    # each Tukey window (0.25 is the variant of rm_heart_artefact_tukey)
+    # save_model stores the artefact model to ecg_rm_py_model, from which every variant can be rebuilt with
+    # load_artefact_model and the import_data output - save_fif=False then skips saving the cleaned data itself
+    # qrs_source='python' uses the R peaks found by detect_qrs in import_data rather than those from QRS_Timing
     matlab = False  # If this is true, use the data 'prepared' by matlab - testing to see where hump at 0 comes from
-    # Incredibly slow without parallelization
+    # Incredibly slow without parallelization - all ESG channels are now cleaned together by PCA_OBS_multichannel
     # Set variables
     subject_id = f'sub-{str(subject).zfill(3)}'
     cond_info = get_conditioninfo(condition, srmr_nr)
@@ -30,6 +39,7 @@ def rm_heart_artefact(subject, condition, srmr_nr, sampling_rate, pchip):
 
     # For debugging just test one channel of each
     debug_channel = ['S35']
+    debug_plots = False  # Save the PCA_OBS debugging plots for the debug channel
     _, esg_chans, _ = get_channels(subject, False, False, srmr_nr)  # Ignoring ECG and EOG channels
 
     # Dyanmically set filename
@@ -44,11 +54,9 @@ def rm_heart_artefact(subject, condition, srmr_nr, sampling_rate, pchip):
         # Read .fif file from the previous step (import_data)
         raw = mne.io.read_raw_fif(input_path + fname + '.fif', preload=True)
 
-    # Read .mat file with QRS events
-    fname_m = f"raw_{sampling_rate}_spinal_{cond_name}"
-    matdata = loadmat(input_path_m+fname_m+'.mat')
-    QRSevents_m = matdata['QRSevents']
-    fwts = matdata['fwts']
+    # QRS events from the store built from QRS_Timing (build_qrs_store) or detected in import_data (detect_qrs),
+    # [1 x n_events] as read from the .mat file
+    QRSevents_m = get_qrs(subject, condition, srmr_nr, sampling_rate, qrs_source)[np.newaxis, :]
 
     # Read .h5 file with alternative QRS events
     # with h5py.File(input_path+fname+'.h5', "r") as infile:
@@ -62,69 +70,89 @@ def rm_heart_artefact(subject, condition, srmr_nr, sampling_rate, pchip):
     ord = round(3*fs/0.5)
     fwts = firls(ord+1, f, a)
 
-    # Run once with a single channel and debug_mode = True to get window information
-    for ch in debug_channel:
-        # set PCA_OBS input variables
-        channelNames = ['S35', 'Iz', 'SC1', 'S3', 'SC6', 'S20', 'L1', 'L4']
-        # these channels will be plotted(only for debugging / testing)
+    # The heartbeat windows depend only on the QRS events and the recording length - computed once here and used
+    # for the annotations and shared with the fit of every channel
+    geometry = get_heartbeat_geometry(QRSevents_m, raw.n_times)
+    window_start = geometry.window_start_idx
+    window_end = geometry.window_end_idx
+
+    onset = [x/sampling_rate for x in window_start]  # Divide by sampling rate to make times
+    duration = np.repeat(0.0, len(window_start))
+    description = ['fit_start'] * len(window_start)
+    raw.annotations.append(onset, duration, description, ch_names=[esg_chans] * len(window_start))
+
+    onset = [x/sampling_rate for x in window_end]
+    duration = np.repeat(0.0, len(window_end))
+    description = ['fit_end'] * len(window_end)
+    raw.annotations.append(onset, duration, description, ch_names=[esg_chans]*len(window_end))
+
+    # Only if the debugging plots are wanted, run once with a single channel and debug_mode = True
+    if debug_plots:
+        for ch in debug_channel:
+            # set PCA_OBS input variables
+            channelNames = ['S35', 'Iz', 'SC1', 'S3', 'SC6', 'S20', 'L1', 'L4']
+            # these channels will be plotted(only for debugging / testing)
+
+            # run PCA_OBS
+            if pchip:
+                name = 'pca_chan_' + ch + '_pchip'
+            else:
+                name = 'pca_chan_'+ch
+            PCA_OBS_kwargs = dict(
+                debug_mode=True, qrs=QRSevents_m, filter_coords=fwts, sr=sampling_rate,
+                savename=save_path+name,
+                ch_names=channelNames, sub_nr=subject_id,
+                condition=cond_name, current_channel=ch
+            )
+            # Apply function modifies the data in raw in place
+            raw.copy().apply_function(PCA_OBS, picks=[ch], **PCA_OBS_kwargs)
+
+    # Then run for all channels at once with debug_mode = False
+    # The QRS events and filter are only passed once and the whole [channel x time] array is cleaned in one pass
+    # svd_solver 'full' computes all components, 'covariance', 'randomized' or 'arpack' only the ones used
+    # filter_backend 'fft' applies the high pass with FFT overlap-add, same output as 'direct' filtfilt
+    PCA_OBS_kwargs = dict(
+        qrs=QRSevents_m, filter_coords=fwts, sr=sampling_rate, svd_solver='full', filter_backend='fft',
+        geometry=geometry
+    )
 
-        # run PCA_OBS
+    # Filtering, decomposition and per-beat fit are shared, each variant only differs in the taper of the fit
+    picks = mne.pick_channels(raw.ch_names, esg_chans)
+    if save_model:
+        model_path = "/data/pt_02569/tmp_data/ecg_rm_py_model/"+subject_id+"/esg/prepro/"
+        os.makedirs(model_path, exist_ok=True)
         if pchip:
-            name = 'pca_chan_' + ch + '_pchip'
+            model_fname = f'artefact_model_spinal_{cond_name}_withqrs_pchip.h5'
         else:
-            name = 'pca_chan_'+ch
-        PCA_OBS_kwargs = dict(
-            debug_mode=True, qrs=QRSevents_m, filter_coords=fwts, sr=sampling_rate,
-            savename=save_path+name,
-            ch_names=channelNames, sub_nr=subject_id,
-            condition=cond_name, current_channel=ch
-        )
-        # Apply function modifies the data in raw in place
-        raw.copy().apply_function(PCA_OBS, picks=[ch], **PCA_OBS_kwargs)
-
-        # This information is the same for each channel - run through fitting once to get vals, add to all channels
-        keywords = ['window_start_idx', 'window_end_idx']
-        fn = f"{save_path}pca_chan_{ch}_{cond_name}_pca_info.h5"
-        with h5py.File(fn, "r") as infile:
-            # Get the data
-            window_start = infile[keywords[0]][()].reshape(-1)
-            window_end = infile[keywords[1]][()].reshape(-1)
-
-        onset = [x/sampling_rate for x in window_start] # Divide by sampling rate to make times
-        duration = np.repeat(0.0, len(window_start))
-        description = ['fit_start'] * len(window_start)
-        raw.annotations.append(onset, duration, description, ch_names=[esg_chans] * len(window_start))
-
-        onset = [x/sampling_rate for x in window_end]
-        duration = np.repeat(0.0, len(window_end))
-        description = ['fit_end'] * len(window_end)
-        raw.annotations.append(onset, duration, description, ch_names=[esg_chans]*len(window_end))
-
-    # Then run parallel for all channels with n_jobs set and debug_mode = False
-    # set PCA_OBS input variables
-    channelNames = ['S35', 'Iz', 'SC1', 'S3', 'SC6', 'S20', 'L1', 'L4']
-    # these channels will be plotted(only for debugging / testing)
-
-    # run PCA_OBS
-    # In this case ch_names, current_channel and savename are dummy vars - not necessary really
-    PCA_OBS_kwargs = dict(
-        debug_mode=False, qrs=QRSevents_m, filter_coords=fwts, sr=sampling_rate,
-        savename=save_path + 'pca_chan',
-        ch_names=channelNames, sub_nr=subject_id,
-        condition=cond_name, current_channel=ch
-    )
+            model_fname = f'artefact_model_spinal_{cond_name}_withqrs.h5'
+        PCA_OBS_kwargs['model_fname'] = os.path.join(model_path, model_fname)
+        PCA_OBS_kwargs['model_ch_names'] = [raw.ch_names[p] for p in picks]
+    cleaned = PCA_OBS_variants(raw.get_data(picks=picks), tukey_alphas=tukey_alphas, **PCA_OBS_kwargs)
+
+    if not save_fif:
+        return
+
+    for alpha in tukey_alphas:
+        # Plain PCA_OBS to ecg_rm_py, alpha = 0.25 to ecg_rm_py_tukey as before, other windows get their own folder
+        if alpha is None:
+            variant_path = save_path
+        elif alpha == 0.25:
+            variant_path = "/data/pt_02569/tmp_data/ecg_rm_py_tukey/"+subject_id+"/esg/prepro/"
+        else:
+            variant_path = f"/data/pt_02569/tmp_data/ecg_rm_py_tukey_{alpha}/"+subject_id+"/esg/prepro/"
+        os.makedirs(variant_path, exist_ok=True)
 
-    # Apply function should modifies the data in raw in place
-    raw.apply_function(PCA_OBS, picks=esg_chans, **PCA_OBS_kwargs, n_jobs=len(esg_chans))
+        raw_clean = raw.copy()
+        raw_clean._data[picks, :] = cleaned[alpha]
 
-    # Save the new mne structure with the cleaned data
-    if matlab:
-        raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_mat.fif'), fmt='double',
-                 overwrite=True)
-    else:
-        if pchip:
-            raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_pchip.fif'), fmt='double',
-                     overwrite=True)
+        # Save the new mne structure with the cleaned data
+        if matlab:
+            raw_clean.save(os.path.join(variant_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_mat.fif'),
+                           fmt=get_fif_fmt(), overwrite=True)
         else:
-            raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs.fif'), fmt='double',
-                     overwrite=True)
+            if pchip:
+                raw_clean.save(os.path.join(variant_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_pchip.fif'),
+                               fmt=get_fif_fmt(), overwrite=True)
+            else:
+                raw_clean.save(os.path.join(variant_path, f'data_clean_ecg_spinal_{cond_name}_withqrs.fif'),
+                               fmt=get_fif_fmt(), overwrite=True)
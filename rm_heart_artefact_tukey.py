@@ -1,14 +1,18 @@
 # The same as rm_heart_artefact except the fitted artefact is multiplied by a Tukey window to avoid edge effects
 
 import os
-from scipy.io import loadmat
 from scipy.signal import firls
 from PCA_OBS_tukey import *
 from get_conditioninfo import *
 from get_channels import *
+from get_heartbeat_geometry import get_heartbeat_geometry
+from get_qrs import get_qrs
+from apply_function_shared import apply_function_shared
+from fif_fmt import get_fif_fmt
 
 
-def rm_heart_artefact_tukey(subject, condition, srmr_nr, sampling_rate, pchip):
+def rm_heart_artefact_tukey(subject, condition, srmr_nr, sampling_rate, pchip, qrs_source='matlab'):
+    # qrs_source='python' uses the R peaks found by detect_qrs in import_data rather than those from QRS_Timing
     matlab = False  # If this is true, use the data 'prepared' by matlab - testing
 
     # Set variables
@@ -29,6 +33,7 @@ def rm_heart_artefact_tukey(subject, condition, srmr_nr, sampling_rate, pchip):
 
     # For debugging just test one channel of each
     debug_channel = ['S35']
+    debug_plots = False  # Save the PCA_OBS debugging plots for the debug channel
     _, esg_chans, _ = get_channels(subject, False, False, srmr_nr)  # Ignoring ECG and EOG channels
 
     # Dyanmically set filename
@@ -44,11 +49,9 @@ def rm_heart_artefact_tukey(subject, condition, srmr_nr, sampling_rate, pchip):
             # Read .fif file from the previous step (import_data)
         raw = mne.io.read_raw_fif(input_path + fname + '.fif', preload=True)
 
-    # Read .mat file with QRS events
-    fname_m = f"raw_{sampling_rate}_spinal_{cond_name}"
-    matdata = loadmat(input_path_m+fname_m+'.mat')
-    QRSevents_m = matdata['QRSevents']
-    fwts = matdata['fwts']
+    # QRS events from the store built from QRS_Timing (build_qrs_store) or detected in import_data (detect_qrs),
+    # [1 x n_events] as read from the .mat file
+    QRSevents_m = get_qrs(subject, condition, srmr_nr, sampling_rate, qrs_source)[np.newaxis, :]
 
     # Read .h5 file with alternative QRS events
     # with h5py.File(input_path+fname+'.h5', "r") as infile:
@@ -61,44 +64,42 @@ def rm_heart_artefact_tukey(subject, condition, srmr_nr, sampling_rate, pchip):
     ord = round(3*fs/0.5)
     fwts = firls(ord+1, f, a)
 
-    # Run once with a single channel and debug_mode = True to get window information
-    for ch in debug_channel:
-        # set PCA_OBS input variables
-        channelNames = ['S35', 'Iz', 'SC1', 'S3', 'SC6', 'S20', 'L1', 'L4']
-        # these channels will be plotted(only for debugging / testing)
-
-        if pchip:
-            name = 'pca_chan_' + ch + '_pchip'
-        else:
-            name = 'pca_chan_'+ch
-        # run PCA_OBS
-        PCA_OBS_kwargs = dict(
-            debug_mode=True, qrs=QRSevents_m, filter_coords=fwts, sr=sampling_rate,
-            savename=save_path+name,
-            ch_names=channelNames, sub_nr=subject_id,
-            condition=cond_name, current_channel=ch
-        )
-        # Apply function modifies the data in raw in place
-        raw.copy().apply_function(PCA_OBS_tukey, picks=[ch], **PCA_OBS_kwargs)
-
-        # This information is the same for each channel - run through fitting once to get vals, add to all channels
-        # Add annotations to each channel
-        keywords = ['window_start_idx', 'window_end_idx']
-        fn = f"{save_path}pca_chan_{ch}_{cond_name}_pca_info.h5"
-        with h5py.File(fn, "r") as infile:
-            # Get the data
-            window_start = infile[keywords[0]][()].reshape(-1)
-            window_end = infile[keywords[1]][()].reshape(-1)
-
-        onset = [x/sampling_rate for x in window_start]  # Divide by sampling rate to make times
-        duration = np.repeat(0.0, len(window_start))
-        description = ['fit_start'] * len(window_start)
-        raw.annotations.append(onset, duration, description, ch_names=[esg_chans] * len(window_start))
-
-        onset = [x/sampling_rate for x in window_end]
-        duration = np.repeat(0.0, len(window_end))
-        description = ['fit_end'] * len(window_end)
-        raw.annotations.append(onset, duration, description, ch_names=[esg_chans]*len(window_end))
+    # The heartbeat windows depend only on the QRS events and the recording length - computed once here and used
+    # for the annotations instead of an extra PCA_OBS run
+    geometry = get_heartbeat_geometry(QRSevents_m, raw.n_times)
+    window_start = geometry.window_start_idx
+    window_end = geometry.window_end_idx
+
+    onset = [x/sampling_rate for x in window_start]  # Divide by sampling rate to make times
+    duration = np.repeat(0.0, len(window_start))
+    description = ['fit_start'] * len(window_start)
+    raw.annotations.append(onset, duration, description, ch_names=[esg_chans] * len(window_start))
+
+    onset = [x/sampling_rate for x in window_end]
+    duration = np.repeat(0.0, len(window_end))
+    description = ['fit_end'] * len(window_end)
+    raw.annotations.append(onset, duration, description, ch_names=[esg_chans]*len(window_end))
+
+    # Only if the debugging plots are wanted, run once with a single channel and debug_mode = True
+    if debug_plots:
+        for ch in debug_channel:
+            # set PCA_OBS input variables
+            channelNames = ['S35', 'Iz', 'SC1', 'S3', 'SC6', 'S20', 'L1', 'L4']
+            # these channels will be plotted(only for debugging / testing)
+
+            if pchip:
+                name = 'pca_chan_' + ch + '_pchip'
+            else:
+                name = 'pca_chan_'+ch
+            # run PCA_OBS
+            PCA_OBS_kwargs = dict(
+                debug_mode=True, qrs=QRSevents_m, filter_coords=fwts, sr=sampling_rate,
+                savename=save_path+name,
+                ch_names=channelNames, sub_nr=subject_id,
+                condition=cond_name, current_channel=ch
+            )
+            # Apply function modifies the data in raw in place
+            raw.copy().apply_function(PCA_OBS_tukey, picks=[ch], **PCA_OBS_kwargs)
 
     # Then run parallel for all channels with n_jobs set and debug_mode = False
     # set PCA_OBS input variables
@@ -111,21 +112,21 @@ def rm_heart_artefact_tukey(subject, condition, srmr_nr, sampling_rate, pchip):
         debug_mode=False, qrs=QRSevents_m, filter_coords=fwts, sr=sampling_rate,
         savename=save_path + 'pca_chan',
         ch_names=channelNames, sub_nr=subject_id,
-        condition=cond_name, current_channel=ch
+        condition=cond_name, current_channel=debug_channel[0]
     )
 
-    # Apply function modifies the data in raw in place
-    raw.apply_function(PCA_OBS_tukey, picks=esg_chans, **PCA_OBS_kwargs, n_jobs=len(esg_chans))
+    # Modifies the data in raw in place - channels are shared with the workers rather than copied to each
+    apply_function_shared(raw, PCA_OBS_tukey, picks=esg_chans, **PCA_OBS_kwargs, n_jobs=len(esg_chans))
 
     # Save the new mne structure with the cleaned data
     # Save data without stim artefact and downsampled to 1000
     if matlab:
-        raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_mat.fif'), fmt='double',
+        raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_mat.fif'), fmt=get_fif_fmt(),
                  overwrite=True)
     else:
         if pchip:
-            raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_pchip.fif'), fmt='double',
+            raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs_pchip.fif'), fmt=get_fif_fmt(),
                      overwrite=True)
         else:
-            raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs.fif'), fmt='double',
+            raw.save(os.path.join(save_path, f'data_clean_ecg_spinal_{cond_name}_withqrs.fif'), fmt=get_fif_fmt(),
                      overwrite=True)
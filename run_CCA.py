@@ -12,6 +12,9 @@ from get_esg_channels import get_esg_channels
 from Archive.Plotting_Code.IsopotentialFunctions import mrmr_esg_isopotentialplot
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+from fif_fmt import get_fif_fmt
+from get_filtered_raw import get_filtered_raw
+from get_ssp_raw import get_ssp_raw
 
 
 def run_CCA(subject, condition, srmr_nr, data_string, n):
@@ -53,8 +56,7 @@ def run_CCA(subject, condition, srmr_nr, data_string, n):
         os.makedirs(save_path, exist_ok=True)
 
     elif data_string == 'SSP':
-        input_path = "/data/p_02569/SSP/" + subject_id + "/" + str(n) + " projections/"
-        fname = f"ssp_cleaned_{cond_name}.fif"
+        fname = f"ssp_cleaned_{cond_name}.fif"  # Read through get_ssp_raw, name of the saved CCA epochs
         save_path = "/data/p_02569/SSP_cca/" + subject_id + "/" + str(n) + " projections/"
         os.makedirs(save_path, exist_ok=True)
 
@@ -70,14 +72,13 @@ def run_CCA(subject, condition, srmr_nr, data_string, n):
 
     brainstem_chans, cervical_chans, lumbar_chans, ref_chan = get_esg_channels()
 
-    raw = mne.io.read_raw_fif(input_path + fname, preload=True)
-
     # PCA and Prep data has to be filtered before running CCA, all others have been filtered previously
     if data_string == 'PCA' or data_string == 'Prep':
-        mne.add_reference_channels(raw, ref_channels=['TH6'], copy=False)  # Modifying in place
-        raw.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
-                   iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
-        raw.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+        raw = get_filtered_raw(input_path + fname, esg_bp_freq, notch_freq, 'TH6')
+    elif data_string == 'SSP':
+        raw = get_ssp_raw(subject_id, cond_name, n, preload=True)
+    else:
+        raw = mne.io.read_raw_fif(input_path + fname, preload=True)
 
     # now create epochs based on the trigger names
     events, event_ids = mne.events_from_annotations(raw)
@@ -205,7 +206,7 @@ def run_CCA(subject, condition, srmr_nr, data_string, n):
     # Create and save
     cca_epochs = mne.EpochsArray(data, info, events, tmin, event_id)
     cca_epochs = cca_epochs.apply_baseline(baseline=tuple(iv_baseline))
-    cca_epochs.save(os.path.join(save_path, fname), fmt='double', overwrite=True)
+    cca_epochs.save(os.path.join(save_path, fname), fmt=get_fif_fmt(), overwrite=True)
 
     ################################ Plotting Graphs #######################################
     figure_path_spatial = f'/data/p_02569/ComponentIsopotentialPlots_Dataset1/{subject_id}/'
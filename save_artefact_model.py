@@ -0,0 +1,31 @@
+# Saves the PCA_OBS artefact model to HDF5 instead of the cleaned data
+# The model is the template of each channel (mean effect + factor loadings), the template coefficients of every
+# interior heartbeat, the fitted template of the edge beats (truncated by the start or end of the data), the QRS
+# events the heartbeat geometry is rebuilt from and the mean removed from each channel before fitting
+# This is a small fraction of the size of the cleaned data, and the fitted artefact or cleaned data of any taper
+# variant, channel subset or time range can be rebuilt from it with load_artefact_model
+
+import numpy as np
+import h5py
+
+
+def save_artefact_model(fname, pca_template, coeffs, edge_fit, geometry, channel_mean, sr, ch_names=None):
+    # pca_template is [channel x window-length x (1 + nComponents)], coeffs [channel x beat x (1 + nComponents)],
+    # edge_fit a dictionary of the fitted template [channel x window-length] of each edge beat
+    n_chans, n_beats, n_coeffs = coeffs.shape
+    edge_beats = np.array(sorted(edge_fit.keys()), dtype=int)
+
+    with h5py.File(fname, "w") as outfile:
+        outfile.attrs['n_times'] = geometry.n_times
+        outfile.attrs['peak_range'] = geometry.peak_range
+        outfile.attrs['sr'] = sr
+        outfile.create_dataset('QRS', data=geometry.peak_idx)
+        outfile.create_dataset('channel_mean', data=channel_mean)
+        outfile.create_dataset('template', data=pca_template, chunks=(1,) + pca_template.shape[1:])
+        # Chunked by channel and blocks of beats, so a channel subset or time range only reads what it needs
+        outfile.create_dataset('coeffs', data=coeffs, chunks=(1, min(n_beats, 256), n_coeffs))
+        outfile.create_dataset('edge_beats', data=edge_beats)
+        outfile.create_dataset('edge_fit', data=np.array([edge_fit[b] for b in edge_beats]).reshape(
+            len(edge_beats), n_chans, pca_template.shape[1]))
+        if ch_names is not None:
+            outfile.create_dataset('ch_names', data=np.array(ch_names, dtype='S'))
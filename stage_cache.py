@@ -0,0 +1,108 @@
+# Skips pipeline stages whose outputs are up to date
+# Each run of a stage records a manifest with the hash of its input files, its parameters (the arguments of the call,
+# the .fif storage format and the filter method), the hash of its code (the module of the stage and every module of
+# this repository it uses) and the hash of its output files
+# A stage is skipped when all of these still match - inputs and outputs are only rehashed when their size or
+# modification time changed, so checking a stage costs a few stat calls
+# As the manifests record content hashes, a rerun upstream stage that writes different outputs makes the stages
+# reading them rerun too, while one that writes the same outputs leaves them skipped
+# run_stage(import_data, (subject, condition, srmr_nr, sampling_rate, pchip_interpolation, streaming, qrs_source))
+
+import os
+import sys
+import json
+import hashlib
+import inspect
+from stage_files import get_stage_files
+from fif_fmt import get_fif_fmt
+from filter_esg import get_filter_method
+
+manifest_path = "/data/pt_02569/tmp_data/stage_manifests/"
+repo_path = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_stage(fun, args, skip_up_to_date=True):
+    stage = fun.__name__
+    inputs, outputs = get_stage_files(stage, *args)
+    params = {'args': [str(a) for a in args], 'fif_fmt': get_fif_fmt(), 'filter_method': get_filter_method()}
+
+    # One manifest per stage and set of arguments
+    key = hashlib.sha256(json.dumps([stage] + params['args']).encode()).hexdigest()[:16]
+    manifest_fname = os.path.join(manifest_path, stage, key + '.json')
+    code = get_code_version(fun)
+
+    if skip_up_to_date and os.path.isfile(manifest_fname):
+        with open(manifest_fname, 'r') as infile:
+            manifest = json.load(infile)
+        input_hashes = hash_files(inputs, manifest['inputs'])
+        output_hashes = hash_files(outputs, manifest['outputs'])
+        if manifest['params'] == params and manifest['code'] == code and \
+                get_contents(manifest['inputs']) == get_contents(input_hashes) and \
+                get_contents(manifest['outputs']) == get_contents(output_hashes):
+            # Same contents - keep the new sizes and modification times so the files are not hashed again
+            write_manifest(manifest_fname, params, code, input_hashes, output_hashes)
+            print(f'{stage}{tuple(args)} is up to date, skipped')
+            return
+
+    # Hash the inputs before running, so a manifest is never written for inputs changed during the run
+    input_hashes = hash_files(inputs, {})
+    fun(*args)
+    write_manifest(manifest_fname, params, code, input_hashes, hash_files(outputs, {}))
+
+
+def write_manifest(manifest_fname, params, code, input_hashes, output_hashes):
+    manifest = {'params': params, 'code': code, 'inputs': input_hashes, 'outputs': output_hashes}
+    os.makedirs(os.path.dirname(manifest_fname), exist_ok=True)
+    with open(manifest_fname + '.tmp', 'w') as outfile:
+        json.dump(manifest, outfile, indent=1)
+    os.replace(manifest_fname + '.tmp', manifest_fname)  # Never leaves a partly written manifest
+
+
+# Hash of each file as {path: [size, mtime, hash]}, a missing file as {path: None}
+# The hash in known is reused when the size and modification time of the file have not changed
+def hash_files(fnames, known):
+    hashes = {}
+    for fname in fnames:
+        if not os.path.isfile(fname):
+            hashes[fname] = None
+            continue
+        stat = os.stat(fname)
+        if known.get(fname) is not None and known[fname][:2] == [stat.st_size, stat.st_mtime_ns]:
+            hashes[fname] = known[fname]
+            continue
+        sha = hashlib.sha256()
+        with open(fname, 'rb') as infile:
+            for block in iter(lambda: infile.read(2**24), b''):
+                sha.update(block)
+        hashes[fname] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+
+    return hashes
+
+
+# Content hash of each file, None if missing
+def get_contents(hashes):
+    return {fname: None if h is None else h[2] for fname, h in hashes.items()}
+
+
+# Hash of the source of the module of fun and of every module of this repository it uses, directly or not
+def get_code_version(fun):
+    sources = {}
+    todo = [sys.modules[fun.__module__]]
+    while len(todo) > 0:
+        module = todo.pop()
+        fname = getattr(module, '__file__', None)
+        if fname is None or not os.path.abspath(fname).startswith(repo_path + os.sep) or fname in sources:
+            continue
+        sources[fname] = inspect.getsource(module)
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                todo.append(value)
+            elif isinstance(getattr(value, '__module__', None), str) and value.__module__ in sys.modules:
+                todo.append(sys.modules[value.__module__])
+
+    sha = hashlib.sha256()
+    for fname in sorted(sources):
+        sha.update(os.path.relpath(fname, repo_path).encode())
+        sha.update(sources[fname].encode())
+
+    return sha.hexdigest()
@@ -0,0 +1,104 @@
+# Input and output files of each pipeline stage called from main.py, for the stage cache (stage_cache)
+# Paths mirror those the stages read and write - figures and plots are not tracked
+# inputs, outputs = get_stage_files('import_data', subject, condition, srmr_nr, sampling_rate, pchip_interpolation,
+#                                   streaming, qrs_source)
+
+import glob
+from get_conditioninfo import get_conditioninfo
+from build_qrs_store import store_fname, index_fname
+from get_ssp_raw import get_ssp_fname
+from import_data import prepared_path
+
+
+def get_stage_files(stage, subject, condition, srmr_nr, *args):
+    assert stage in ['import_data', 'rm_heart_artefact', 'epoch_data', 'run_ica', 'run_ica_anterior',
+                     'run_ica_separatepatches', 'apply_SSP', 'run_CCA'], \
+        f"Error. No input and output files known for stage {stage}."
+    subject_id = f'sub-{str(subject).zfill(3)}'
+    cond_name = get_conditioninfo(condition, srmr_nr).cond_name
+    cfg_fname = "/data/pt_02569/cfg.mat"
+    prep_path = prepared_path + subject_id + "/esg/prepro/"
+    ica_path = "/data/pt_02569/tmp_data/baseline_ica_py/" + subject_id + "/esg/prepro/"
+
+    if stage == 'import_data':
+        sampling_rate, pchip_interpolation, streaming, qrs_source = args
+        suffix = '_pchip' if pchip_interpolation else ''
+        inputs = sorted(glob.glob("/data/p_02068/SRMR1_experiment/bids/" + subject_id + "/eeg/" + subject_id + '*'
+                                  + cond_name + '*'))  # .set and .fdt of each block
+        inputs += ['/data/pt_02068/cfg/standard-10-5-cap385_added_mastoids.elp', store_fname, index_fname]
+        outputs = [prep_path + f'noStimart_sr{sampling_rate}_{cond_name}_withqrs{suffix}.fif',
+                   prep_path + f'noStimart_sr{sampling_rate}_{cond_name}_withqrs_eeg{suffix}.fif',
+                   prep_path + f'noStimart_sr1000_{cond_name}_withqrs.h5']
+
+    elif stage == 'rm_heart_artefact':
+        sampling_rate, pchip, tukey_alphas, save_model, save_fif, qrs_source = args
+        suffix = '_pchip' if pchip else ''
+        inputs = [prep_path + f'noStimart_sr{sampling_rate}_{cond_name}_withqrs{suffix}.fif']
+        if qrs_source == 'python':
+            inputs.append(prep_path + f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.h5')
+        else:
+            inputs += [store_fname, index_fname]
+        outputs = []
+        if save_model:
+            outputs.append("/data/pt_02569/tmp_data/ecg_rm_py_model/" + subject_id +
+                           f"/esg/prepro/artefact_model_spinal_{cond_name}_withqrs{suffix}.h5")
+        if save_fif:
+            for alpha in tukey_alphas:
+                if alpha is None:
+                    variant_path = "/data/pt_02569/tmp_data/ecg_rm_py/"
+                elif alpha == 0.25:
+                    variant_path = "/data/pt_02569/tmp_data/ecg_rm_py_tukey/"
+                else:
+                    variant_path = f"/data/pt_02569/tmp_data/ecg_rm_py_tukey_{alpha}/"
+                outputs.append(variant_path + subject_id + f"/esg/prepro/data_clean_ecg_spinal_{cond_name}_withqrs"
+                                                           f"{suffix}.fif")
+
+    elif stage == 'epoch_data':
+        inputs = ["/data/pt_02569/tmp_data/ecg_rm_py/" + subject_id +
+                  f"/esg/prepro/data_clean_ecg_spinal_{cond_name}_withqrs.fif", cfg_fname]
+        save_path = "/data/pt_02569/tmp_data/epoched_py/" + subject_id + "/esg/prepro/"
+        outputs = [save_path + f'epo_clean_{cond_name}.fif', save_path + f'epo_antRef_clean_{cond_name}.fif',
+                   save_path + f'epo_FzRef_clean_{cond_name}.fif']
+
+    elif stage in ['run_ica', 'run_ica_anterior', 'run_ica_separatepatches']:
+        sampling_rate = args[0]
+        inputs = [prep_path + f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif', cfg_fname]
+        if stage == 'run_ica':
+            choose_limited = args[1]
+            if choose_limited:
+                outputs = [ica_path + f'clean_baseline_ica_auto_{cond_name}_lim.fif']
+            else:
+                outputs = [ica_path + f'clean_baseline_ica_auto_{cond_name}.fif']
+        elif stage == 'run_ica_anterior':
+            outputs = [ica_path + f'anterior_clean_baseline_ica_auto_{cond_name}.fif']
+        else:
+            outputs = [ica_path + f'separated_clean_baseline_ica_auto_{cond_name}.fif']
+
+    elif stage == 'apply_SSP':
+        sampling_rate = args[0]
+        inputs = [prep_path + f'noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif', cfg_fname]
+        outputs = [get_ssp_fname(subject_id, cond_name)]
+
+    elif stage == 'run_CCA':
+        data_string, n = args
+        if data_string == 'PCA':
+            input_fname = "/data/pt_02569/tmp_data/ecg_rm_py/" + subject_id + \
+                          f"/esg/prepro/data_clean_ecg_spinal_{cond_name}_withqrs.fif"
+            save_path = "/data/pt_02569/tmp_data/ecg_rm_py_cca/" + subject_id + "/esg/prepro/"
+        elif data_string == 'Prep':
+            input_fname = prep_path + f'noStimart_sr1000_{cond_name}_withqrs.fif'
+            save_path = "/data/pt_02569/tmp_data/prepared_py_cca/" + subject_id + "/esg/prepro/"
+        elif data_string == 'ICA':
+            input_fname = ica_path + f'clean_baseline_ica_auto_{cond_name}.fif'
+            save_path = "/data/pt_02569/tmp_data/baseline_ica_py_cca/" + subject_id + "/esg/prepro/"
+        elif data_string == 'SSP':
+            input_fname = get_ssp_fname(subject_id, cond_name)
+            save_path = "/data/p_02569/SSP_cca/" + subject_id + "/" + str(n) + " projections/"
+        inputs = [input_fname, cfg_fname,
+                  f"/data/p_02068/SRMR1_experiment/analyzed_data/esg/{subject_id}/potential_latency.mat"]
+        if data_string == 'SSP':
+            outputs = [save_path + f"ssp_cleaned_{cond_name}.fif"]
+        else:
+            outputs = [save_path + input_fname.split('/')[-1]]
+
+    return inputs, outputs
@@ -0,0 +1,94 @@
+# Runs the pipeline stages collected by main.py as a task graph on a pool of processes
+# Each task is one stage call (fun, args) - it depends on the earlier tasks that write any of its input files, or
+# the same output files, as declared in stage_files, so e.g. CCA of PCA data waits for PCA_OBS of that subject and
+# condition while other subjects run
+# Tasks run through run_stage, so up-to-date ones are skipped and a run interrupted part way resumes where it stopped
+# The output of each task goes to its own log file, a failed task only stops the tasks depending on it
+# cpu_budget CPUs are shared out as cpu_budget // threads_per_task tasks at a time, each limited to threads_per_task
+# BLAS/OpenMP threads and threads_per_task worker processes for its parallel calls (job_limit)
+# run_tasks([(import_data, (1, 2, 1, 1000, False, False, 'matlab')), ...], cpu_budget=8)
+
+import os
+import re
+import sys
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from threadpoolctl import threadpool_limits
+from stage_files import get_stage_files
+from stage_cache import run_stage
+from job_limit import set_max_jobs
+
+log_path = "/data/pt_02569/tmp_data/stage_logs/"
+
+
+def run_tasks(tasks, cpu_budget=1, threads_per_task=1, skip_up_to_date=True):
+    n_workers = max(cpu_budget // threads_per_task, 1)
+    names = [f'{fun.__name__}{tuple(args)}' for fun, args in tasks]
+    log_fnames = [os.path.join(log_path, fun.__name__ + '_' + re.sub(r'[^\w.-]+', '-', '_'.join(str(a) for a in args))
+                               + '.log') for fun, args in tasks]
+
+    # Dependencies on earlier tasks - main.py adds the tasks in pipeline order
+    files = [get_stage_files(fun.__name__, *args) for fun, args in tasks]
+    depends = [[j for j in range(i) if set(files[j][1]) & (set(files[i][0]) | set(files[i][1]))]
+               for i in range(len(tasks))]
+
+    status = ['pending'] * len(tasks)
+    running = {}
+    os.makedirs(log_path, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context('fork')) as pool:
+        while 'pending' in status or len(running) > 0:
+            for i in range(len(tasks)):
+                if status[i] != 'pending':
+                    continue
+                if any(status[j] in ['failed', 'not run'] for j in depends[i]):
+                    # Failure is isolated to the tasks depending on the failed one
+                    status[i] = 'not run'
+                    n_finished = sum(s in ['done', 'failed', 'not run'] for s in status)
+                    print(f'[{n_finished}/{len(tasks)}] {names[i]} not run, a task it depends on failed')
+                elif all(status[j] == 'done' for j in depends[i]) and len(running) < n_workers:
+                    status[i] = 'running'
+                    fun, args = tasks[i]
+                    running[pool.submit(run_task, fun, args, skip_up_to_date, log_fnames[i], threads_per_task)] = i
+
+            if len(running) == 0:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                status[i] = 'done' if future.result() else 'failed'
+                n_finished = sum(s in ['done', 'failed', 'not run'] for s in status)
+                print(f'[{n_finished}/{len(tasks)}] {names[i]} {status[i]}, log in {log_fnames[i]}')
+
+    failed = [names[i] for i in range(len(tasks)) if status[i] != 'done']
+    if len(failed) > 0:
+        print(f'{len(failed)} of {len(tasks)} tasks failed or were not run: {failed}')
+
+    return status
+
+
+# Runs one task in a worker, with everything it prints (including from C code and child processes) going to its log
+def run_task(fun, args, skip_up_to_date, log_fname, threads_per_task):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    stdout, stderr = os.dup(1), os.dup(2)
+    with open(log_fname, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            set_max_jobs(threads_per_task)  # This worker process only
+            with threadpool_limits(limits=threads_per_task):
+                run_stage(fun, args, skip_up_to_date)
+            success = True
+        except Exception:
+            traceback.print_exc()
+            success = False
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(stdout, 1)
+            os.dup2(stderr, 2)
+            os.close(stdout)
+            os.close(stderr)
+
+    return success
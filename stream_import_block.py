@@ -0,0 +1,96 @@
+# Streaming import of one block - reads the block in chunks, removes the stimulus artefact of the triggers in each
+# chunk and decimates with a polyphase anti-alias filter (scipy resample_poly) straight into the down-sampled buffer
+# Peak memory is set by the chunk length rather than the length of the recording, and the data is passed over once
+# Several channel groups with their own interpolation windows are read together - groups is a list of
+# (channel names, [tmin, tmax] interpolation window in seconds)
+# Each chunk is read with a margin either side, wide enough for the filter and for the whole repair (the samples read
+# and written) of every trigger whose repaired samples reach the filter, so the output is the same as repairing and
+# decimating the whole block at once
+
+import numpy as np
+import mne
+from scipy.signal import resample_poly
+from pchip_interpolation import PCHIP_interpolation
+
+
+# Linear interpolation over the stimulus artefact, as mne.preprocessing.fix_stim_artifact(mode='linear')
+def fix_stim_linear(data, trigger_indices, interpol_window_sec, fs):
+    s_start = int(np.ceil(fs * interpol_window_sec[0]))
+    s_end = int(np.ceil(fs * interpol_window_sec[1]))
+    for trigger in trigger_indices:
+        first_samp = trigger + s_start
+        last_samp = trigger + s_end
+        weight = (np.arange(first_samp, last_samp) - first_samp) / (last_samp - first_samp)
+        data[:, first_samp:last_samp] = data[:, first_samp, np.newaxis] * (1 - weight) + \
+            data[:, last_samp, np.newaxis] * weight
+
+    return data
+
+
+# Decimation factor from fs to sampling_rate_new
+def get_down_factor(fs, sampling_rate_new):
+    down = int(round(fs / sampling_rate_new))
+    assert down * sampling_rate_new == fs, "Error. Sampling rate must divide the original sampling rate."
+
+    return down
+
+
+# Number of samples stream_import_block returns for a block of n_times samples at fs
+def get_stream_length(n_times, fs, sampling_rate_new):
+    down = get_down_factor(fs, sampling_rate_new)
+
+    return n_times // down + bool(n_times % down)
+
+
+def stream_import_block(raw, groups, trigger_indices, sampling_rate_new, pchip, chunk_sec=10):
+    # raw can be read with preload=False, trigger_indices are sample indices of the stimulation events in raw
+    # returns the down-sampled data [channel x time] of each group
+    fs = raw.info['sfreq']
+    down = get_down_factor(fs, sampling_rate_new)
+    trigger_indices = np.sort(np.asarray(trigger_indices).reshape(-1)) - raw.first_samp
+
+    # Samples either side of a trigger that the repair reads or writes (PCHIP uses 6 fit samples outside the window)
+    reach = max([int(np.ceil(fs * np.max(np.abs(window)))) + 7 for _, window in groups])
+    half_len = 10 * down  # Half length of the resample_poly anti-alias filter
+    # The outputs of a chunk use the samples up to half_len beyond it, which a trigger up to half_len + reach beyond it
+    # repairs - the repair of that trigger reads and writes up to reach further out again
+    margin = int(np.ceil((half_len + 2 * reach) / down)) * down
+
+    # Channels of all groups are read together, each group then takes its own rows
+    all_chans = []
+    for chans, _ in groups:
+        all_chans += [ch for ch in chans if ch not in all_chans]
+    picks = mne.pick_channels(raw.ch_names, all_chans, ordered=True)
+    rows = [[all_chans.index(ch) for ch in chans] for chans, _ in groups]
+
+    n_times = raw.n_times
+    n_out = get_stream_length(n_times, fs, sampling_rate_new)
+    outputs = [np.zeros((len(chans), n_out)) for chans, _ in groups]
+    chunk = int(chunk_sec * fs) // down * down  # Chunks start on multiples of down so the outputs line up
+
+    for start in np.arange(0, n_times, chunk):
+        stop = min(start + chunk, n_times)
+        read_start = max(start - margin, 0)
+        read_stop = min(stop + margin, n_times)
+        data = raw.get_data(picks=picks, start=read_start, stop=read_stop)
+
+        # Triggers with their whole repair inside what was read, relative to the read start
+        chunk_triggers = trigger_indices[(trigger_indices - reach >= read_start) &
+                                         (trigger_indices + reach < read_stop)] - read_start
+
+        for g, (_, window) in enumerate(groups):
+            group_data = data[rows[g], :]
+            if len(chunk_triggers) > 0:
+                if pchip:
+                    group_data = PCHIP_interpolation(group_data, debug_mode=False, interpol_window_sec=window,
+                                                     trigger_indices=chunk_triggers, fs=fs)
+                else:
+                    group_data = fix_stim_linear(group_data, chunk_triggers, window, fs)
+
+            # Polyphase decimation, keeping only the output samples of this chunk
+            decimated = resample_poly(group_data, 1, down, axis=1)
+            first = (start - read_start) // down
+            outputs[g][:, start // down: start // down + (stop - start + down - 1) // down] = \
+                decimated[:, first: first + (stop - start + down - 1) // down]
+
+    return outputs
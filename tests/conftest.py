@@ -0,0 +1,64 @@
+# The pipeline modules are flat scripts in the repository root (and Metrics), imported by name as main.py does
+
+import os
+import sys
+import numpy as np
+import pytest
+import mne
+from scipy.signal import firls
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [root, os.path.join(root, 'Metrics')]
+
+
+# ESG-like data [channel x time] at 1kHz with a heartbeat artefact of varying shape at each QRS event, the QRS events
+# [1 x n_events] and the 0.9Hz high pass of rm_heart_artefact
+@pytest.fixture
+def heartbeat_data():
+    sr = 1000
+    rng = np.random.default_rng(0)
+    n_chans, n_times = 4, 40 * sr
+    qrs = np.cumsum(np.concatenate([[150], rng.integers(700, 1100, 60)]))
+    qrs = qrs[qrs < n_times - 200]
+
+    t = np.arange(-300, 500)
+    shapes = np.stack([np.exp(-0.5 * (t / 10) ** 2), np.exp(-0.5 * ((t - 250) / 40) ** 2), np.sin(t / 50) * (t > 0) *
+                       np.exp(-t / 200)])
+    data = 1e-6 * np.cumsum(rng.standard_normal((n_chans, n_times)), axis=1) / 30
+    for q in qrs:
+        idx = q + t
+        ok = (idx >= 0) & (idx < n_times)
+        weights = rng.standard_normal((n_chans, 3)) * [5e-6, 2e-6, 1e-6]
+        data[:, idx[ok]] += np.dot(weights, shapes[:, ok])
+
+    fwts = firls(round(3 * sr / 0.5) + 1, [0, 0.4 / (sr / 2), 0.9 / (sr / 2), 1], [0, 0, 1, 1])
+
+    return data, qrs[np.newaxis, :], fwts, sr
+
+
+# ESG-like recording [20 channels + ECG] at 1kHz with a heartbeat artefact of three components, QRS annotations and
+# one projector already present
+@pytest.fixture
+def ssp_raw():
+    sfreq = 1000
+    rng = np.random.default_rng(0)
+    n_times = 120 * sfreq
+    ecg = np.zeros(n_times)
+    peaks = np.cumsum(rng.uniform(0.7, 1.1, 200) * sfreq).astype(int)
+    for peak in peaks[peaks < n_times - 500]:
+        ecg[peak - 50:peak + 51] += np.exp(-np.arange(-50, 51) ** 2 / 50)
+    artefact = np.vstack([np.convolve(ecg, np.hanning(k), 'same') for k in [41, 121, 301]])
+    ch_names = [f'S{i}' for i in range(1, 21)]
+    data = np.dot(rng.standard_normal((len(ch_names), 3)), artefact) * 2e-5 + \
+        rng.standard_normal((len(ch_names), n_times)) * 1e-6
+    raw = mne.io.RawArray(np.vstack([data, ecg * 1e-3]), mne.create_info(ch_names + ['ECG'], sfreq,
+                                                                         ['eeg'] * len(ch_names) + ['ecg']),
+                          verbose=False)
+    raw.set_annotations(mne.Annotations(peaks[peaks < n_times - 500] / sfreq, 0, 'qrs'))
+    # A projector already in the data comes before the ECG ones in the output of compute_proj_ecg
+    vector = rng.standard_normal(len(ch_names))
+    raw.add_proj(mne.Projection(data=dict(nrow=1, ncol=len(ch_names), row_names=None, col_names=ch_names,
+                                          data=vector[np.newaxis, :] / np.linalg.norm(vector)),
+                                desc='existing', kind=1, active=False), verbose=False)
+
+    return raw
@@ -0,0 +1,31 @@
+# All channels at once (PCA_OBS_multichannel) against PCA_OBS run on each channel
+
+import numpy as np
+import pytest
+from PCA_OBS import PCA_OBS
+from PCA_OBS_multichannel import PCA_OBS_multichannel
+
+
+def test_PCA_OBS_multichannel(heartbeat_data):
+    data, qrs, fwts, sr = heartbeat_data
+    kwargs = dict(debug_mode=False, qrs=qrs, filter_coords=fwts, sr=sr, ch_names=None, sub_nr=None, condition=None,
+                  savename=None, current_channel=None)
+
+    cleaned = PCA_OBS_multichannel(data, **kwargs)
+    for ch in range(data.shape[0]):
+        expected = PCA_OBS(data[ch], **kwargs)
+        np.testing.assert_allclose(cleaned[ch], expected, rtol=0, atol=1e-8 * np.max(np.abs(expected)))
+
+
+def test_PCA_OBS_multichannel_window_at_start(heartbeat_data):
+    # The template window of the second beat starts before the data - PCA_OBS fails, so must the multichannel version
+    # rather than take the samples from the end of the recording
+    data, qrs, fwts, sr = heartbeat_data
+    qrs = np.concatenate([[50, 250], qrs[0, 1:]])[np.newaxis, :]
+    kwargs = dict(debug_mode=False, qrs=qrs, filter_coords=fwts, sr=sr, ch_names=None, sub_nr=None, condition=None,
+                  savename=None, current_channel=None)
+
+    with pytest.raises(ValueError):
+        PCA_OBS(data[0], **kwargs)
+    with pytest.raises(AssertionError):
+        PCA_OBS_multichannel(data, **kwargs)
@@ -0,0 +1,16 @@
+# Component sweep from one decomposition (PCA_OBS_sweep) against a separate PCA_OBS run for each number of components
+
+import numpy as np
+from PCA_OBS_multichannel import PCA_OBS_variants, PCA_OBS_sweep
+
+
+def test_PCA_OBS_sweep(heartbeat_data):
+    data, qrs, fwts, sr = heartbeat_data
+    kwargs = dict(qrs=qrs, filter_coords=fwts, sr=sr, filter_backend='fft')
+
+    n_swept = 0
+    for k, cleaned in PCA_OBS_sweep(data, max_components=5, **kwargs):
+        expected = PCA_OBS_variants(data, n_components=k, **kwargs)[None]
+        np.testing.assert_allclose(cleaned, expected, rtol=0, atol=1e-10 * np.max(np.abs(expected)))
+        n_swept += 1
+    assert n_swept == 6  # Mean effect only, then 1 to 5 components
@@ -0,0 +1,43 @@
+# SSP cleaned data of every n from one ECG decomposition and one filtered recording (SSP) against compute_proj_ecg run
+# for each n and the data projected and then filtered for each n
+
+import numpy as np
+import mne
+import get_filtered_raw
+from filter_esg import filter_esg
+
+
+def test_ssp_projectors(ssp_raw):
+    projs, _ = mne.preprocessing.compute_proj_ecg(ssp_raw, n_eeg=20, reject=None, ch_name='ECG', verbose=False)
+    n_existing = len(ssp_raw.info['projs'])
+    assert projs[0]['desc'] == 'existing'
+
+    for n in [1, 2, 6, 20]:
+        expected, _ = mne.preprocessing.compute_proj_ecg(ssp_raw, n_eeg=n, reject=None, ch_name='ECG', verbose=False)
+        assert len(expected) == n_existing + n
+        for proj, expected_proj in zip(projs[:n_existing + n], expected):
+            assert proj['desc'] == expected_proj['desc']
+            np.testing.assert_array_equal(proj['data']['data'], expected_proj['data']['data'])
+
+
+# Filtered once and projected for each n (SSP) against projected for each n and then filtered
+def test_ssp_filter_order(ssp_raw, tmp_path, monkeypatch):
+    monkeypatch.setattr(get_filtered_raw, 'cache_path', str(tmp_path / 'filtered_cache'))
+    ssp_raw.del_proj()  # As the prepared data, which holds no projectors
+    fname = str(tmp_path / 'ssp_raw.fif')
+    ssp_raw.save(fname, fmt='double', verbose=False)
+    projs, _ = mne.preprocessing.compute_proj_ecg(ssp_raw, n_eeg=6, reject=None, ch_name='ECG', verbose=False)
+    n_existing = len(ssp_raw.info['projs'])
+    raw_filtered = get_filtered_raw.get_filtered_raw(fname, [30, 400], [50], 'TH6')
+
+    for n in [1, 6]:
+        expected = mne.io.read_raw_fif(fname, preload=True, verbose=False)
+        expected.add_proj(projs[:n_existing + n], verbose=False).apply_proj(verbose=False)
+        mne.add_reference_channels(expected, ref_channels=['TH6'], copy=False)
+        filter_esg(expected, [30, 400], [50])
+
+        clean_raw = raw_filtered.copy().add_proj(projs[n_existing:n_existing + n], verbose=False)
+        clean_raw.apply_proj(verbose=False)
+        assert clean_raw.ch_names == expected.ch_names
+        np.testing.assert_allclose(clean_raw.get_data(), expected.get_data(), rtol=0,
+                                   atol=1e-10 * np.max(np.abs(expected.get_data())))
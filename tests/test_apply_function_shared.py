@@ -0,0 +1,38 @@
+# Per-channel functions run on the shared buffer (apply_function_shared) against raw.apply_function
+
+import multiprocessing
+import numpy as np
+import mne
+import pytest
+from scipy.signal import butter
+from apply_function_shared import apply_function_shared
+from filter_esg import apply_sos
+
+
+@pytest.mark.parametrize('picks', [['S35', 'Iz', 'ECG'], ['Iz', 'S35'], 'data', 'all', 'ecg', [0, 2]])
+@pytest.mark.parametrize('n_jobs', [1, 3])
+def test_apply_function_shared(picks, n_jobs, monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 8)  # Shared buffer and workers on any machine
+    rng = np.random.default_rng(0)
+    ch_names = ['S35', 'S24', 'Iz', 'ECG']
+    raw = mne.io.RawArray(rng.standard_normal((len(ch_names), 5000)),
+                          mne.create_info(ch_names, 1000, ['eeg'] * 3 + ['ecg']), verbose=False)
+    sos = butter(2, [30, 400], 'bandpass', fs=1000, output='sos')
+
+    expected = raw.copy().apply_function(apply_sos, picks=picks, channel_wise=True, sos=sos, padlen=100,
+                                         verbose=False)
+    shared = apply_function_shared(raw.copy(), apply_sos, picks=picks, n_jobs=n_jobs, sos=sos, padlen=100)
+    np.testing.assert_array_equal(shared.get_data(), expected.get_data())
+
+
+def failing(x):
+    raise ValueError('Channel failed')
+
+
+def test_apply_function_shared_error(monkeypatch):
+    # The error of the function reaches the caller, the shared buffer is released
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 8)
+    raw = mne.io.RawArray(np.zeros((4, 100)), mne.create_info(4, 1000, 'eeg'), verbose=False)
+    for n_jobs in [1, 3]:
+        with pytest.raises(ValueError, match='Channel failed'):
+            apply_function_shared(raw, failing, picks='data', n_jobs=n_jobs)
@@ -0,0 +1,30 @@
+# Cleaned data rebuilt from the stored artefact model (save_artefact_model, load_artefact_model) against the output of
+# the PCA_OBS run that stored it
+
+import numpy as np
+from PCA_OBS_multichannel import PCA_OBS_variants
+from load_artefact_model import load_artefact_model, get_cleaned, get_fitted_art
+
+
+def test_artefact_model(heartbeat_data, tmp_path):
+    data, qrs, fwts, sr = heartbeat_data
+    kwargs = dict(qrs=qrs, filter_coords=fwts, sr=sr, filter_backend='fft')
+    model_fname = str(tmp_path / 'artefact_model.h5')
+    cleaned = PCA_OBS_variants(data, tukey_alphas=[None, 0.25], model_fname=model_fname, **kwargs)
+    cleaned[0.5] = PCA_OBS_variants(data, tukey_alphas=[0.5], **kwargs)[0.5]  # Taper not run with the model
+
+    model = load_artefact_model(model_fname)
+    for alpha, expected in cleaned.items():
+        atol = 1e-12 * np.max(np.abs(expected))
+        np.testing.assert_allclose(get_cleaned(model, data, tukey_alpha=alpha), expected, rtol=0, atol=atol)
+
+        # A subset of channels and samples, starting inside a fitted window
+        picks = [2, 0]
+        start, stop = qrs[0, 10] - 5, qrs[0, 20] + 5
+        np.testing.assert_allclose(get_cleaned(model, data[picks, start:stop], picks, start, alpha),
+                                   expected[picks, start:stop], rtol=0, atol=atol)
+
+    # Any range of the fitted artefact is the same stretch of the whole of it
+    fitted_art = get_fitted_art(model, tukey_alpha=0.25)
+    np.testing.assert_array_equal(get_fitted_art(model, [1, 3], 1234, 5678, 0.25), fitted_art[[1, 3], 1234:5678])
+    model.file.close()
@@ -0,0 +1,42 @@
+# Blocks written into one preallocated array (concatenate_blocks) against mne.concatenate_raws
+
+import numpy as np
+import mne
+from concatenate_blocks import allocate_blocks, add_block, get_concatenated
+from stream_import_block import stream_import_block, get_stream_length
+
+
+def make_block(n_times, rng):
+    info = mne.create_info(['S35', 'S24', 'ECG'], 1000, ['eeg', 'eeg', 'ecg'])
+    raw = mne.io.RawArray(rng.standard_normal((3, n_times)), info, verbose=False)
+    onset = np.sort(rng.uniform(0, (n_times - 1) / 1000, 5))
+    raw.set_annotations(mne.Annotations(onset, 0, ['Median - Stimulation'] * 5))
+
+    return raw
+
+
+def test_concatenate_blocks():
+    rng = np.random.default_rng(0)
+    block_lengths = [3000, 4501, 2750]
+    raws = [make_block(n_times, rng) for n_times in block_lengths]
+
+    blocks = allocate_blocks(block_lengths)
+    for iblock, raw in enumerate(raws):
+        add_block(blocks, iblock, raw)
+    raw_concat = get_concatenated(blocks)
+    expected = mne.concatenate_raws([raw.copy() for raw in raws])
+
+    np.testing.assert_array_equal(raw_concat.get_data(), expected.get_data())
+    assert list(raw_concat.annotations.description) == list(expected.annotations.description)
+    np.testing.assert_allclose(raw_concat.annotations.onset - raw_concat.first_time,
+                               expected.annotations.onset - expected.first_time, rtol=0, atol=1e-9)
+
+
+# Streamed blocks fill exactly the length import_data allocates for them, so the boundaries land where the data joins
+def test_stream_length():
+    rng = np.random.default_rng(0)
+    for n_times in [20000, 20001, 20009]:
+        raw = mne.io.RawArray(rng.standard_normal((2, n_times)), mne.create_info(['S35', 'ECG'], 10000, 'eeg'),
+                              verbose=False)
+        output, = stream_import_block(raw, [(['S35', 'ECG'], [-0.007, 0.007])], [], 1000, True)
+        assert output.shape[1] == get_stream_length(n_times, 10000, 1000)
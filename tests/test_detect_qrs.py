@@ -0,0 +1,72 @@
+# R peaks found by detect_qrs against the beats of a synthetic ECG, and the QRS store lookup import_data relies on to
+# run it for subjects without QRS_Timing
+
+import numpy as np
+import get_qrs
+from detect_qrs import detect_qrs
+from compare_qrs import compare_qrs
+
+
+def make_ecg(qrs, n_times, rng):
+    k = np.arange(-300, 500)
+    beat = np.exp(-0.5 * (k / 8) ** 2) - 0.15 * np.exp(-0.5 * ((k + 25) / 6) ** 2) - \
+        0.25 * np.exp(-0.5 * ((k - 25) / 7) ** 2) + 0.3 * np.exp(-0.5 * ((k - 250) / 40) ** 2)
+    ecg = 0.05 * rng.standard_normal(n_times) + 0.5 * np.sin(2 * np.pi * 0.2 * np.arange(n_times) / 1000)
+    for q in qrs:
+        idx = q + k
+        ok = (idx >= 0) & (idx < n_times)
+        ecg[idx[ok]] += beat[ok] * rng.uniform(0.8, 1.2)
+
+    return ecg * 1e-4
+
+
+def test_detect_qrs():
+    sr = 1000
+    rng = np.random.default_rng(0)
+    qrs = np.cumsum(rng.integers(700, 1100, 200)) + 500
+    ecg = make_ecg(qrs, qrs[-1] + 1000, rng)
+
+    detected = detect_qrs(ecg, sr)
+    comparison = compare_qrs(detected, qrs, sr)
+    assert comparison.sensitivity >= 0.99 and comparison.ppv >= 0.99
+    assert abs(comparison.median_offset) <= 2
+
+    # Chunks join up seamlessly
+    np.testing.assert_array_equal(detect_qrs(ecg, sr, chunk_sec=7.3), detected)
+
+
+def test_detect_qrs_dropout():
+    # Flat stretches longer than the 5s kept between chunks - the first long RR makes the search back wait over 5s
+    # after the second, by which time the T wave check noise peak after the last beat is out of the buffers
+    sr = 1000
+    rng = np.random.default_rng(0)
+    qrs = np.cumsum(rng.integers(700, 1100, 60)) + 500
+    qrs[20:] += 20000
+    qrs[23:] += 8000
+    ecg = make_ecg(qrs, qrs[-1] + 1000, rng)
+    k = np.arange(-30, 31)
+    ecg[qrs[22] + 250 + k] += 0.5e-4 * np.exp(-0.5 * (k / 8) ** 2)
+    for start, stop in [(qrs[19] + 600, qrs[20] - 400), (qrs[22] + 600, qrs[23] - 400)]:
+        ecg[start:stop] = ecg[start]
+
+    for chunk_sec in [2, 7.3, 60]:
+        detected = detect_qrs(ecg, sr, chunk_sec=chunk_sec)
+        comparison = compare_qrs(detected, qrs, sr)
+        assert comparison.sensitivity == 1 and comparison.ppv == 1
+
+
+def test_has_qrs(tmp_path, monkeypatch):
+    # No store at all, then a store without the subject - import_data then only runs with qrs_source='python'
+    monkeypatch.setattr(get_qrs, 'store_fname', str(tmp_path / 'qrs_store.npy'))
+    monkeypatch.setattr(get_qrs, 'index_fname', str(tmp_path / 'qrs_store_index.npy'))
+    monkeypatch.setattr(get_qrs, 'qrs_store', {})
+    assert not get_qrs.has_qrs(1, 2)
+
+    np.save(get_qrs.store_fname, np.arange(10, dtype=np.int32))
+    index = np.array([('sub-002', 'median', 1000, 0, 10)], dtype=[('subject_id', 'U8'), ('cond_name', 'U16'),
+                                                                  ('sampling_rate', 'i4'), ('start', 'i8'),
+                                                                  ('stop', 'i8')])
+    np.save(get_qrs.index_fname, index)
+    assert not get_qrs.has_qrs(1, 2)
+    assert get_qrs.has_qrs(2, 2)
+    np.testing.assert_array_equal(get_qrs.get_qrs(2, 2), np.arange(10))
@@ -0,0 +1,72 @@
+# Evoked responses read from the epoch store (epoch_store) against mne.Epochs on the recording (SNR_functions)
+
+import numpy as np
+import mne
+import pytest
+from numpy.lib.format import open_memmap
+import get_filtered_raw
+import epoch_store
+from filter_esg import set_filter_method, get_filter_method
+from SNR_functions import evoked_from_raw
+from epoch_store import get_epoch_store, evoked_from_store
+
+
+@pytest.fixture
+def raw_fname(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_filtered_raw, 'cache_path', str(tmp_path / 'filtered_cache'))
+    method = get_filter_method()
+    yield make_raw(str(tmp_path / 'test_raw.fif'))
+    set_filter_method(method)
+
+
+def make_raw(fname):
+    sfreq = 1000
+    rng = np.random.default_rng(0)
+    ch_names = ['S35', 'S24', 'S36', 'Iz', 'ECG']
+    raw = mne.io.RawArray(rng.standard_normal((len(ch_names), 30 * sfreq)) * 1e-6,
+                          mne.create_info(ch_names, sfreq, ['eeg'] * 4 + ['ecg']), verbose=False)
+    stim = np.arange(0.05, 29.9, 0.25)  # First and last epochs run over the ends of the recording
+    raw.set_annotations(mne.Annotations(np.concatenate([stim, [10.0]]), np.concatenate([np.zeros(len(stim)), [1.0]]),
+                                        ['Median - Stimulation'] * len(stim) + ['BAD segment']))
+    raw.save(fname, verbose=False)
+
+    return fname
+
+
+def test_evoked_from_store(raw_fname):
+    raw = mne.io.read_raw_fif(raw_fname, preload=True, verbose=False)
+    expected = evoked_from_raw(raw, [-0.1, 0.3], [-0.1, -0.01], 'Median - Stimulation', False)
+    store = get_epoch_store(raw_fname)
+    evoked = evoked_from_store(store, [-0.1, 0.3], [-0.1, -0.01], 'Median - Stimulation', False)
+
+    assert evoked.nave == expected.nave
+    np.testing.assert_allclose(evoked.data, expected.data, rtol=0, atol=1e-12 * np.max(np.abs(expected.data)))
+
+
+def test_store_follows_filter_method(raw_fname):
+    # Switching the filter method rebuilds the store rather than reusing the epochs filtered with the other method
+    for method in ['sos', 'fir', 'sos']:
+        set_filter_method(method)
+        store = get_epoch_store(raw_fname, [30, 400], [50])
+        expected = get_filtered_raw.get_filtered_raw(raw_fname, [30, 400], [50], 'TH6').get_data()
+        np.testing.assert_array_equal(np.asarray(store.data).T, expected)
+
+
+def test_store_after_crash(raw_fname, monkeypatch):
+    # A conversion stopped part way (crash, or killed with its parallel caller) is redone rather than reused
+    get_epoch_store(raw_fname)
+    raw = mne.io.read_raw_fif(raw_fname, preload=True, verbose=False)
+    raw._data *= 2
+    raw.save(raw_fname, overwrite=True, verbose=False)
+
+    def open_memmap_crash(*args, **kwargs):
+        open_memmap(*args, **kwargs)  # The data file is created, then the conversion stops
+        raise RuntimeError('Crashed while writing the store')
+
+    with monkeypatch.context() as m:
+        m.setattr(epoch_store, 'open_memmap', open_memmap_crash)
+        with pytest.raises(RuntimeError):
+            get_epoch_store(raw_fname)
+
+    store = get_epoch_store(raw_fname)
+    np.testing.assert_array_equal(np.asarray(store.data).T, raw.get_data())
@@ -0,0 +1,27 @@
+# Single pass band-pass and notch (filter_esg) against raw.filter followed by raw.notch_filter
+
+import numpy as np
+import mne
+import pytest
+from filter_esg import filter_esg
+
+
+@pytest.mark.parametrize('method, tol', [('fir', 1e-8), ('sos', 5e-3)])
+def test_filter_esg(method, tol):
+    sfreq = 1000
+    rng = np.random.default_rng(0)
+    t = np.arange(60 * sfreq) / sfreq
+    data = np.cumsum(rng.standard_normal((3, len(t))), axis=1) * 1e-7 + 1e-6 * np.sin(2 * np.pi * 50 * t)
+    raw = mne.io.RawArray(data, mne.create_info(['S35', 'S24', 'ECG'], sfreq, ['eeg', 'eeg', 'ecg']), verbose=False)
+
+    expected = raw.copy().filter(l_freq=30, h_freq=400, method='iir', iir_params={'order': 2, 'ftype': 'butter'},
+                                 phase='zero', verbose=False)
+    expected.notch_filter(freqs=[50], method='fir', phase='zero', verbose=False)
+    filtered = filter_esg(raw.copy(), [30, 400], [50], method)
+
+    # The padding at the ends differs, inside the recording 'fir' reproduces the two calls and 'sos' is close
+    interior = slice(10 * sfreq, -10 * sfreq)
+    np.testing.assert_allclose(filtered.get_data()[:, interior], expected.get_data()[:, interior], rtol=0,
+                               atol=tol * np.max(np.abs(expected.get_data())))
+    assert (filtered.info['highpass'], filtered.info['lowpass']) == (expected.info['highpass'],
+                                                                     expected.info['lowpass'])
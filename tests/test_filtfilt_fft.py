@@ -0,0 +1,14 @@
+# FFT overlap-add filtering (filtfilt_fft) against scipy.signal.filtfilt, for the high pass of PCA_OBS
+
+import numpy as np
+from scipy.signal import filtfilt
+from filtfilt_fft import filtfilt_fft
+
+
+def test_filtfilt_fft(heartbeat_data):
+    data, _, fwts, _ = heartbeat_data
+    expected = filtfilt(fwts, 1, data, axis=1)
+
+    np.testing.assert_allclose(filtfilt_fft(fwts, data), expected, rtol=0, atol=1e-10 * np.max(np.abs(expected)))
+    np.testing.assert_allclose(filtfilt_fft(fwts, data[0]), expected[0], rtol=0,
+                               atol=1e-10 * np.max(np.abs(expected)))  # Single channel
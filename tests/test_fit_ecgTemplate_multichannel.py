@@ -0,0 +1,31 @@
+# Template fit of every channel and heartbeat at once (fit_ecgTemplate_multichannel) against the least squares fit of
+# each heartbeat on its own, as fit_ecgTemplate did it
+
+import numpy as np
+from get_heartbeat_geometry import get_heartbeat_geometry
+from fit_ecgTemplate_multichannel import project_ecgTemplate_multichannel
+
+
+def test_project_ecgTemplate_multichannel(heartbeat_data):
+    data, qrs, _, _ = heartbeat_data
+    geometry = get_heartbeat_geometry(qrs, data.shape[1])
+    peak_range = geometry.peak_range
+    rng = np.random.default_rng(1)
+    pca_template = rng.standard_normal((data.shape[0], 2 * peak_range + 1, 5))
+
+    coeffs, edge_fit = project_ecgTemplate_multichannel(data, pca_template, geometry)
+    assert len(edge_fit) > 0  # The first beat is closer to the start than peak_range
+
+    for b, peak in enumerate(geometry.fit_peaks):
+        start = max(peak - peak_range, 0)
+        end = min(peak + peak_range + 1, data.shape[1])
+        rows = slice(start - (peak - peak_range), end - (peak - peak_range))
+        for c in range(data.shape[0]):
+            window = data[c, start:end] - np.mean(data[c, start:end])
+            least_square = np.linalg.lstsq(pca_template[c, rows, :], window, rcond=None)
+            expected = np.dot(pca_template[c], least_square[0])
+            if b in edge_fit:
+                pad_fit = edge_fit[b][c]
+            else:
+                pad_fit = np.dot(pca_template[c], coeffs[c, b, :])
+            np.testing.assert_allclose(pad_fit, expected, rtol=0, atol=1e-10 * np.max(np.abs(expected)))
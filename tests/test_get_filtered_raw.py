@@ -0,0 +1,69 @@
+# Filtered recording shared through the cache (get_filtered_raw) against reading, re-referencing and filtering it
+
+import os
+import numpy as np
+import mne
+import pytest
+import get_filtered_raw
+from filter_esg import filter_esg
+
+
+@pytest.mark.parametrize('reference', [None, 'TH6', 'AC', 'average'])
+def test_get_filtered_raw(tmp_path, monkeypatch, reference):
+    monkeypatch.setattr(get_filtered_raw, 'cache_path', str(tmp_path / 'filtered_cache'))
+    rng = np.random.default_rng(0)
+    raw = mne.io.RawArray(np.cumsum(rng.standard_normal((4, 20000)), axis=1) * 1e-7,
+                          mne.create_info(['S35', 'S24', 'AC', 'ECG'], 1000, ['eeg'] * 3 + ['ecg']), verbose=False)
+    raw.set_annotations(mne.Annotations([1.5, 7.25], [0, 0], ['qrs', 'Median - Stimulation']))
+    fname = str(tmp_path / 'test_raw.fif')
+    raw.save(fname, verbose=False)
+
+    # As the stages did it - reference, then filter
+    expected = mne.io.read_raw_fif(fname, preload=True, verbose=False)
+    if reference == 'TH6':
+        mne.add_reference_channels(expected, ref_channels=['TH6'], copy=False)
+    elif reference is not None:
+        expected.set_eeg_reference(ref_channels=[reference] if reference == 'AC' else 'average', verbose=False)
+    filter_esg(expected, [30, 400], [50])
+
+    for _ in range(2):  # Filtered on the first call, read from the cache on the second
+        filtered = get_filtered_raw.get_filtered_raw(fname, [30, 400], [50], reference)
+        assert filtered.ch_names == expected.ch_names
+        np.testing.assert_allclose(filtered.get_data(), expected.get_data(), rtol=0,
+                                   atol=1e-12 * np.max(np.abs(expected.get_data())))
+        assert list(filtered.annotations.description) == ['qrs', 'Median - Stimulation']
+        filtered._data[:] = 0  # Changes by the caller never reach the cache
+    assert len([f for f in os.listdir(get_filtered_raw.cache_path) if f.endswith('.npy')]) == 1
+
+
+def test_filtered_cache_eviction(tmp_path, monkeypatch):
+    # Each filter setting leaves a full copy - past max_cache_gb the least recently used ones are removed
+    monkeypatch.setattr(get_filtered_raw, 'cache_path', str(tmp_path / 'filtered_cache'))
+    rng = np.random.default_rng(0)
+    raw = mne.io.RawArray(rng.standard_normal((2, 10000)) * 1e-6, mne.create_info(['S35', 'AC'], 1000, 'eeg'),
+                          verbose=False)
+    fname = str(tmp_path / 'test_raw.fif')
+    raw.save(fname, verbose=False)
+    entry_gb = raw.get_data().nbytes / 1e9
+
+    def entries():
+        return sorted(f for f in os.listdir(get_filtered_raw.cache_path) if f.endswith('.npy'))
+
+    monkeypatch.setattr(get_filtered_raw, 'max_cache_gb', 2.5 * entry_gb)
+    get_filtered_raw.get_filtered_raw(fname, [30, 400], [50])
+    first = entries()
+    get_filtered_raw.get_filtered_raw(fname, [20, 400], [50])
+    get_filtered_raw.get_filtered_raw(fname, [30, 400], [50])  # Used again, so the second setting is older
+    second = sorted(set(entries()) - set(first))
+    get_filtered_raw.get_filtered_raw(fname, [10, 400], [50])
+    assert len(entries()) == 2 and set(first) <= set(entries()) and not set(second) & set(entries())
+
+    # Still filtered as before once removed
+    filtered = get_filtered_raw.get_filtered_raw(fname, [20, 400], [50])
+    expected = mne.io.read_raw_fif(fname, preload=True, verbose=False)
+    filter_esg(expected, [20, 400], [50])
+    np.testing.assert_allclose(filtered.get_data(), expected.get_data(), rtol=0,
+                               atol=1e-12 * np.max(np.abs(expected.get_data())))
+
+    get_filtered_raw.clean_filtered_cache()
+    assert not any(f.endswith(('.npy', '.fif')) for f in os.listdir(get_filtered_raw.cache_path))
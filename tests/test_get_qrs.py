@@ -0,0 +1,33 @@
+# QRS events from the packed store (build_qrs_store, get_qrs) against loading the QRS_Timing .mat files
+
+import os
+import numpy as np
+from scipy.io import savemat, loadmat
+import build_qrs_store
+import get_qrs
+
+
+def test_get_qrs(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    qrs_path = str(tmp_path / 'QRS_Timing')
+    monkeypatch.setattr(build_qrs_store, 'qrs_path', qrs_path)
+    for module in [build_qrs_store, get_qrs]:
+        monkeypatch.setattr(module, 'store_fname', os.path.join(qrs_path, 'qrs_store.npy'))
+        monkeypatch.setattr(module, 'index_fname', os.path.join(qrs_path, 'qrs_store_index.npy'))
+    monkeypatch.setattr(get_qrs, 'qrs_store', {})
+
+    # QRS_Timing/sub-XXX/raw_{sr}_spinal_{cond}.mat for a few subjects and conditions (2 median, 3 tibial)
+    mat_fnames = {}
+    for subject in [1, 2, 36]:
+        subject_id = f'sub-{str(subject).zfill(3)}'
+        os.makedirs(os.path.join(qrs_path, subject_id))
+        for condition, cond_name in [(2, 'median'), (3, 'tibial')]:
+            fname = os.path.join(qrs_path, subject_id, f'raw_1000_spinal_{cond_name}.mat')
+            savemat(fname, {'QRSevents': np.cumsum(rng.integers(700, 1100, rng.integers(50, 100)))[np.newaxis, :]})
+            mat_fnames[(subject, condition)] = fname
+    build_qrs_store.build_qrs_store()
+
+    for (subject, condition), fname in mat_fnames.items():
+        assert get_qrs.has_qrs(subject, condition)
+        np.testing.assert_array_equal(get_qrs.get_qrs(subject, condition, 1, 1000), loadmat(fname)['QRSevents'][0])
+    assert not get_qrs.has_qrs(3, 2)
@@ -0,0 +1,44 @@
+# SSP cleaned data of each n from the one saved recording (get_ssp_raw, apply_ssp_projs) against the filtered data
+# projected for that n, as SSP saved it for each n
+
+import os
+import numpy as np
+import mne
+import pytest
+import get_ssp_raw
+from filter_esg import filter_esg
+
+
+@pytest.mark.parametrize('n', [1, 3, 6])
+def test_get_ssp_raw(ssp_raw, tmp_path, monkeypatch, n):
+    monkeypatch.setattr(get_ssp_raw, 'ssp_path', str(tmp_path) + '/')
+    ssp_raw.del_proj()
+    projs, _ = mne.preprocessing.compute_proj_ecg(ssp_raw, n_eeg=6, reject=None, ch_name='ECG', verbose=False)
+    mne.add_reference_channels(ssp_raw, ref_channels=['TH6'], copy=False)
+    filter_esg(ssp_raw, [30, 400], [50])
+
+    # As SSP saves it - the filtered data with the projectors of every n, inactive
+    expected = ssp_raw.copy().add_proj(projs[:n], verbose=False).apply_proj(verbose=False)
+    ssp_raw.add_proj(projs, verbose=False)
+    os.makedirs(str(tmp_path / 'sub-001'))
+    ssp_raw.save(get_ssp_raw.get_ssp_fname('sub-001', 'median'), fmt='double', verbose=False)
+    tol = 1e-6 * np.max(np.abs(expected.get_data()))  # The projectors are stored in single precision
+
+    raw = get_ssp_raw.get_ssp_raw('sub-001', 'median', n)
+    assert [proj['desc'] for proj in raw.info['projs']] == [proj['desc'] for proj in projs[:n]]
+    np.testing.assert_allclose(raw.get_data(), expected.get_data(), rtol=0, atol=tol)
+
+    # Epochs and the evoked response, projected as read and projected after averaging
+    events = mne.make_fixed_length_events(expected, duration=2.0)
+    expected_epochs = mne.Epochs(expected, events, tmin=-0.2, tmax=0.5, baseline=(None, 0), preload=True,
+                                 verbose=False)
+    epochs = mne.Epochs(raw, events, tmin=-0.2, tmax=0.5, baseline=(None, 0), preload=True, verbose=False)
+    np.testing.assert_allclose(epochs.get_data(), expected_epochs.get_data(), rtol=0, atol=tol)
+    raw = mne.io.read_raw_fif(get_ssp_raw.get_ssp_fname('sub-001', 'median'), preload=False, verbose=False)
+    evoked = mne.Epochs(raw, events, tmin=-0.2, tmax=0.5, baseline=(None, 0), proj=False, preload=True,
+                        verbose=False).average()
+    evoked = get_ssp_raw.apply_ssp_projs(evoked, n)
+    np.testing.assert_allclose(evoked.data, expected_epochs.average().data, rtol=0, atol=tol)
+
+    with pytest.raises(AssertionError):
+        get_ssp_raw.get_ssp_raw('sub-001', 'median', len(projs) + 1)
@@ -0,0 +1,64 @@
+# Heartbeat geometry computed once per recording (get_heartbeat_geometry) against the per-beat loop of PCA_OBS
+
+import math
+import numpy as np
+import pytest
+import get_heartbeat_geometry as geometry_module
+from get_heartbeat_geometry import get_heartbeat_geometry
+
+
+# Windows as the loop over the heartbeats in PCA_OBS sets them
+def get_loop_geometry(qrs, n_times):
+    peak_idx = np.unique(qrs[qrs < n_times])
+    peak_range = round(np.median(np.diff(peak_idx)) / 2)
+    peak_count = len(peak_idx)
+    while peak_idx[peak_count - 1] + peak_range > n_times:
+        peak_count -= 1
+
+    fit_peaks, pre_ranges, post_ranges = [], [], []
+    for p in range(0, peak_count):
+        if p + 1 >= len(peak_idx):
+            continue  # No following peak for the post range
+        pre_range = peak_range if p == 0 else min(math.floor((peak_idx[p] - peak_idx[p - 1]) / 2), peak_range)
+        post_range = min(math.floor((peak_idx[p + 1] - peak_idx[p]) / 2), peak_range)
+        fit_peaks.append(peak_idx[p])
+        pre_ranges.append(pre_range)
+        post_ranges.append(post_range)
+
+    return np.array(fit_peaks), np.array(pre_ranges), np.array(post_ranges), peak_range
+
+
+def test_heartbeat_geometry():
+    rng = np.random.default_rng(0)
+    n_times = 60000
+    # First beat closer to the start than peak_range
+    qrs = np.cumsum(np.concatenate([[200], rng.integers(600, 1200, 80)]))
+    geometry = get_heartbeat_geometry(qrs[np.newaxis, :], n_times)
+
+    fit_peaks, pre_range, post_range, peak_range = get_loop_geometry(qrs, n_times)
+    assert geometry.peak_range == peak_range
+    np.testing.assert_array_equal(geometry.fit_peaks, fit_peaks)
+    np.testing.assert_array_equal(geometry.pre_range, pre_range)
+    np.testing.assert_array_equal(geometry.post_range, post_range)
+
+    # Fit windows for the annotations stay inside the data, as the first beat's window would start before sample 0
+    assert fit_peaks[0] - peak_range < 0
+    assert np.all(geometry.window_start_idx >= 0) and np.all(geometry.window_end_idx < n_times)
+    interior = (fit_peaks - peak_range >= 0) & (fit_peaks + peak_range < n_times)
+    np.testing.assert_array_equal(geometry.window_start_idx[interior], fit_peaks[interior] - peak_range)
+    np.testing.assert_array_equal(geometry.window_end_idx[interior], fit_peaks[interior] + peak_range)
+
+    # Computed once per set of QRS events and recording length
+    assert get_heartbeat_geometry(qrs, n_times) is geometry
+    assert get_heartbeat_geometry(qrs, n_times - 1) is not geometry
+    with pytest.raises(ValueError):
+        geometry.fit_peaks[0] = 0  # Shared by every caller, so read only
+
+    # Other events of the same length never get this geometry, and only the last few recordings are kept
+    other = qrs.copy()
+    other[-1] += 1
+    assert get_heartbeat_geometry(other, n_times) is not geometry
+    for shift in range(2 * geometry_module.max_cached):
+        get_heartbeat_geometry(qrs + shift, n_times)
+    assert len(geometry_module.geometry_cache) == geometry_module.max_cached
+    assert get_heartbeat_geometry(qrs, n_times) is not geometry
@@ -0,0 +1,32 @@
+# PCA basis of the heartbeat matrix from each svd_solver (pca_basis) against sklearn PCA(svd_solver="full"), as
+# PCA_OBS computed it
+
+import numpy as np
+import pytest
+from pca_basis import pca_basis
+
+PCA = pytest.importorskip('sklearn.decomposition').PCA
+
+
+@pytest.mark.parametrize('svd_solver, tol', [('full', 1e-10), ('covariance', 1e-8), ('arpack', 1e-8),
+                                             ('randomized', 1e-4)])
+def test_pca_basis(svd_solver, tol):
+    n_components = 4
+    rng = np.random.default_rng(0)
+    # Heartbeat matrices [channel x epoch x time] with a few dominant components, as PCA_OBS builds them
+    shapes = rng.standard_normal((6, 301)) * np.array([10, 6, 4, 2, 1, 0.5])[:, np.newaxis]
+    dpcamat = np.einsum('cek,kt->cet', rng.standard_normal((3, 80, 6)), shapes) + \
+        0.1 * rng.standard_normal((3, 80, 301))
+    dpcamat -= np.mean(dpcamat, axis=2, keepdims=True)
+
+    eigen_vectors, eigen_values, expl_var = pca_basis(dpcamat, None if svd_solver == 'full' else n_components,
+                                                      svd_solver)
+    for c in range(dpcamat.shape[0]):
+        pca = PCA(svd_solver="full")
+        pca.fit(dpcamat[c])
+        np.testing.assert_allclose(eigen_values[c, :n_components], pca.explained_variance_[:n_components], rtol=tol)
+        np.testing.assert_allclose(expl_var[c, :n_components], pca.explained_variance_ratio_[:n_components], rtol=tol)
+        # Components up to their sign
+        signs = np.sign(np.sum(eigen_vectors[c, :n_components] * pca.components_[:n_components], axis=1))
+        np.testing.assert_allclose(eigen_vectors[c, :n_components] * signs[:, np.newaxis],
+                                   pca.components_[:n_components], rtol=0, atol=tol)
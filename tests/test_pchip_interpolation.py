@@ -0,0 +1,35 @@
+# Stimulus artefact interpolation of all events and channels in one pass (PCHIP_interpolation, pchip_batch) against
+# scipy's PCHIP for each event and channel in turn, as the loop it replaces
+
+import numpy as np
+import pytest
+from scipy.interpolate import PchipInterpolator
+from pchip_interpolation import PCHIP_interpolation
+
+
+def interpolate_each(data, trigger_indices, interpol_window_sec, fs):
+    intpol_window = np.ceil([round(interpol_window_sec[0] * fs), round(interpol_window_sec[1] * fs)]).astype(int)
+    x_fit_raw = np.concatenate([np.arange(intpol_window[0] - 6, intpol_window[0]),
+                                np.arange(intpol_window[1] + 1, intpol_window[1] + 7)])
+    x_interpol_raw = np.arange(intpol_window[0], intpol_window[1] + 1)
+    for channel in data:
+        for trigger in trigger_indices:
+            x_fit = trigger + x_fit_raw
+            channel[trigger + x_interpol_raw] = PchipInterpolator(x_fit, channel[x_fit])(trigger + x_interpol_raw)
+
+    return data
+
+
+# Events far apart are interpolated in one pass, events close enough to share samples in turn
+@pytest.mark.parametrize('spacing', [2500, 60])
+def test_PCHIP_interpolation(spacing):
+    fs = 10000
+    rng = np.random.default_rng(0)
+    data = np.cumsum(rng.standard_normal((3, 50000)), axis=1)
+    data[:, ::7] += 50  # Steps, so the slopes of the PCHIP are limited at some fit points
+    trigger_indices = np.arange(1000, 49000, spacing) + rng.integers(0, 20, len(np.arange(1000, 49000, spacing)))
+
+    expected = interpolate_each(data.copy(), trigger_indices, [-0.007, 0.007], fs)
+    interpolated = PCHIP_interpolation(data.copy(), debug_mode=False, interpol_window_sec=[-0.007, 0.007],
+                                       trigger_indices=trigger_indices, fs=fs)
+    np.testing.assert_allclose(interpolated, expected, rtol=0, atol=1e-10 * np.max(np.abs(expected)))
@@ -0,0 +1,48 @@
+# Skipping of up to date stages (stage_cache) against running every stage, and the files registered for them
+# (stage_files) against where the stages write
+
+import os
+import stage_cache
+from stage_files import get_stage_files
+from import_data import prepared_path
+
+
+def test_import_data_outputs():
+    _, outputs = get_stage_files('import_data', 1, 2, 1, 1000, False, True, 'python')
+    assert all(fname.startswith(prepared_path + 'sub-001/esg/prepro/') for fname in outputs)
+
+
+def test_run_stage(tmp_path, monkeypatch):
+    in_fname = str(tmp_path / 'input.txt')
+    out_fname = str(tmp_path / 'output.txt')
+    monkeypatch.setattr(stage_cache, 'manifest_path', str(tmp_path / 'manifests'))
+    monkeypatch.setattr(stage_cache, 'get_stage_files', lambda stage, *args: ([in_fname], [out_fname]))
+    calls = []
+
+    def copy_stage(scale):
+        calls.append(scale)
+        with open(in_fname) as infile, open(out_fname, 'w') as outfile:
+            outfile.write(infile.read() * scale)
+
+    with open(in_fname, 'w') as outfile:
+        outfile.write('a')
+    stage_cache.run_stage(copy_stage, (2,))
+    stage_cache.run_stage(copy_stage, (2,))  # Up to date
+    assert calls == [2]
+
+    # Same contents with a new modification time is still up to date, new contents or arguments are not
+    os.utime(in_fname, ns=(0, 0))
+    stage_cache.run_stage(copy_stage, (2,))
+    assert calls == [2]
+    with open(in_fname, 'w') as outfile:
+        outfile.write('b')
+    stage_cache.run_stage(copy_stage, (2,))
+    stage_cache.run_stage(copy_stage, (3,))
+    assert calls == [2, 2, 3]
+
+    # An output changed or removed since the run makes it run again
+    os.remove(out_fname)
+    stage_cache.run_stage(copy_stage, (3,))
+    assert calls == [2, 2, 3, 3]
+    stage_cache.run_stage(copy_stage, (3,), skip_up_to_date=False)
+    assert calls == [2, 2, 3, 3, 3]
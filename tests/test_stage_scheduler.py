@@ -0,0 +1,102 @@
+# Stages run as a task graph on a process pool (stage_scheduler) against running them one after the other
+
+import os
+import time
+import glob
+import multiprocessing
+from multiprocessing import resource_tracker
+import numpy as np
+import mne
+import pytest
+import apply_function_shared
+import stage_cache
+import stage_scheduler
+
+files = {}
+
+
+def first(path):
+    with open(os.path.join(path, 'first.txt'), 'w') as outfile:
+        outfile.write('first')
+
+
+def second(path):
+    with open(os.path.join(path, 'first.txt')) as infile, open(os.path.join(path, 'second.txt'), 'w') as outfile:
+        outfile.write(infile.read() + ' second')
+
+
+# A stage filtering 8 channels with one worker each, as filter_esg does
+def parallel(path, task):
+    raw = mne.io.RawArray(np.zeros((8, 100)), mne.create_info(8, 1000, 'eeg'), verbose=False)
+    apply_function_shared.apply_function_shared(raw, count_workers, picks='all', n_jobs=8, path=path,
+                                                root=os.getppid())
+    with open(os.path.join(path, f'parallel_{task}.txt'), 'w') as outfile:
+        outfile.write('parallel')
+
+
+# Records the number of live processes started by the workers of the scheduler, the pool workers of the stages
+def count_workers(x, path, root):
+    time.sleep(0.5)  # The workers of every stage running at the same time are alive
+    parents = {}
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat') as infile:
+                parents[int(pid)] = int(infile.read().rsplit(')', 1)[1].split()[1])
+        except (FileNotFoundError, ProcessLookupError):
+            pass
+    n_workers = sum(parents.get(parent) == root for parent in parents.values())
+    with open(os.path.join(path, f'workers_{os.getpid()}_{time.time()}.txt'), 'w') as outfile:
+        outfile.write(str(n_workers))
+
+    return x
+
+
+def failing(path):
+    raise ValueError('Stage failed')
+
+
+def after_failing(path):
+    with open(os.path.join(path, 'after_failing.txt'), 'w') as outfile:
+        outfile.write('after_failing')
+
+
+@pytest.mark.parametrize('cpu_budget', [1, 4])
+def test_run_tasks(tmp_path, monkeypatch, cpu_budget):
+    path = str(tmp_path)
+    files.update({'first': ([], [path + '/first.txt']), 'second': ([path + '/first.txt'], [path + '/second.txt']),
+                  'failing': ([], [path + '/failing.txt']),
+                  'after_failing': ([path + '/failing.txt'], [path + '/after_failing.txt'])})
+    monkeypatch.setattr(stage_scheduler, 'get_stage_files', lambda stage, *args: files[stage])
+    monkeypatch.setattr(stage_cache, 'get_stage_files', lambda stage, *args: files[stage])
+    monkeypatch.setattr(stage_cache, 'manifest_path', path + '/manifests')
+    monkeypatch.setattr(stage_scheduler, 'log_path', path + '/logs')
+
+    # second waits for first, the failure of failing only stops after_failing
+    status = stage_scheduler.run_tasks([(failing, (path,)), (after_failing, (path,)), (first, (path,)),
+                                        (second, (path,))], cpu_budget=cpu_budget)
+    assert status == ['failed', 'not run', 'done', 'done']
+    with open(path + '/second.txt') as infile:
+        assert infile.read() == 'first second'
+    assert not os.path.isfile(path + '/after_failing.txt')
+    assert len(glob.glob(path + '/logs/*.log')) == 3  # One per task run
+
+
+# Each task starts at most threads_per_task workers, so all tasks at a time stay within cpu_budget
+def test_run_tasks_cpu_budget(tmp_path, monkeypatch):
+    path = str(tmp_path)
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 16)  # As on the cluster, more CPUs than the budget
+    monkeypatch.setattr(stage_scheduler, 'get_stage_files', lambda stage, *args: ([], []))
+    monkeypatch.setattr(stage_cache, 'get_stage_files', lambda stage, *args: ([], []))
+    monkeypatch.setattr(stage_cache, 'manifest_path', path + '/manifests')
+    monkeypatch.setattr(stage_scheduler, 'log_path', path + '/logs')
+
+    resource_tracker.ensure_running()  # Shared by the processes forked from here, so only pool workers are counted
+    status = stage_scheduler.run_tasks([(parallel, (path, task)) for task in range(4)], cpu_budget=4,
+                                       threads_per_task=2)
+    assert status == ['done'] * 4
+    n_workers = []
+    for fname in glob.glob(path + '/workers_*.txt'):
+        with open(fname) as infile:
+            n_workers.append(int(infile.read()))
+    assert len(n_workers) == 4 * 8
+    assert 2 <= max(n_workers) <= 4
@@ -0,0 +1,39 @@
+# Chunked stimulus repair and decimation (stream_import_block) against repairing and decimating the whole block
+
+import numpy as np
+import mne
+import pytest
+from scipy.signal import resample_poly
+from pchip_interpolation import PCHIP_interpolation
+from stream_import_block import stream_import_block, fix_stim_linear
+
+
+@pytest.mark.parametrize('pchip', [True, False])
+def test_chunked_equals_whole_block(pchip):
+    fs = 10000
+    chunk_sec = 1
+    rng = np.random.default_rng(0)
+    ch_names = ['S35', 'S24', 'ECG', 'Fz', 'Cz']
+    data = np.cumsum(rng.standard_normal((len(ch_names), int(4.5 * fs))), axis=1)
+    groups = [(['S35', 'S24', 'ECG'], [-0.007, 0.007]), (['Fz', 'Cz', 'ECG'], [-0.0015, 0.006])]
+
+    # Triggers just before each chunk boundary, outside the read window of the next chunk with too small a margin but
+    # close enough for their repair to reach its filter, and spread through the rest of the block
+    boundaries = np.arange(1, 5) * chunk_sec * fs
+    triggers = np.sort(np.concatenate([boundaries[:-1] - 150, np.arange(2000, data.shape[1] - 2000, 2900)]))
+    for trigger in triggers:
+        data[:, trigger - 20:trigger + 40] += 1e3  # Stimulus artefact
+    raw = mne.io.RawArray(data, mne.create_info(ch_names, fs, 'eeg'), verbose=False)
+
+    outputs = stream_import_block(raw, groups, triggers, 1000, pchip, chunk_sec=chunk_sec)
+    for (chans, window), output in zip(groups, outputs):
+        group_data = data[[ch_names.index(ch) for ch in chans], :].copy()
+        if pchip:
+            group_data = PCHIP_interpolation(group_data, debug_mode=False, interpol_window_sec=window,
+                                             trigger_indices=triggers, fs=fs)
+        else:
+            group_data = fix_stim_linear(group_data, triggers, window, fs)
+        expected = resample_poly(group_data, 1, 10, axis=1)
+
+        assert output.shape == expected.shape
+        np.testing.assert_allclose(output, expected, rtol=0, atol=1e-9 * np.max(np.abs(expected)))
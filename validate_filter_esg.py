@@ -0,0 +1,114 @@
+############## Validates the single pass ESG filtering (filter_esg) against raw.filter + raw.notch_filter ##############
+# Frequency response: the zero-phase response of each method against the two calls, from their impulse responses -
+# max deviation in the passband (esg_bp_freq away from the notches), attenuation at the notch frequencies
+# Data: each method on the prepared data of each subject and condition against the two calls - max deviation relative
+# to the max of the filtered data, inside the recording (edge_sec from either end) and at its edges, and the time taken
+
+import time
+from scipy.io import loadmat
+from scipy.signal import sosfreqz
+import numpy as np
+import mne
+import h5py
+from filter_esg import filter_esg, get_esg_filter
+
+
+# Zero-phase response of the two calls at freqs, from their impulse response
+def get_chain_response(sfreq, esg_bp_freq, notch_freq, freqs):
+    impulse = np.zeros(int(20 * sfreq) + 1)
+    impulse[len(impulse) // 2] = 1
+    h = mne.filter.filter_data(impulse, sfreq, esg_bp_freq[0], esg_bp_freq[1], method='iir',
+                               iir_params={'order': 2, 'ftype': 'butter'}, phase='zero', verbose=False)
+    h = mne.filter.notch_filter(h, sfreq, notch_freq, method='fir', phase='zero', verbose=False)
+
+    return get_response(h, sfreq, freqs)
+
+
+# Zero-phase response of a symmetric kernel, centred in h, at freqs
+def get_response(h, sfreq, freqs):
+    t = (np.arange(len(h)) - len(h) // 2) / sfreq
+
+    return np.array([np.sum(h * np.cos(2 * np.pi * f * t)) for f in freqs])
+
+
+# Zero-phase response of a set of second order sections applied forward-backward
+def get_sos_response(sos, sfreq, freqs):
+    _, h = sosfreqz(sos, worN=freqs, fs=sfreq)
+
+    return np.abs(h) ** 2
+
+
+if __name__ == '__main__':
+    subjects = np.arange(1, 37)  # 1 through 36 to access subject data
+    cond_names = ['median', 'tibial']
+    sampling_rate = 1000
+    edge_sec = 10  # Deviations within this many seconds of either end are reported as edge effects
+
+    cfg_path = "/data/pt_02569/"  # Contains important info about experiment
+    cfg = loadmat(cfg_path + 'cfg.mat')
+    notch_freq = cfg['notch_freq'][0]
+    esg_bp_freq = cfg['esg_bp_freq'][0]
+    methods = ['fir', 'sos']
+
+    class save_validation():
+        def __init__(self):
+            pass
+
+    saveval = save_validation()
+
+    ########################### Frequency response ###########################
+    freqs = np.arange(0.1, sampling_rate / 2, 0.01)
+    chain = get_chain_response(sampling_rate, esg_bp_freq, notch_freq, freqs)
+    passband = (freqs > esg_bp_freq[0]) & (freqs < esg_bp_freq[1])
+    for freq in notch_freq:
+        passband &= np.abs(freqs - freq) > 5
+    notch_idx = [np.argmin(np.abs(freqs - freq)) for freq in notch_freq]
+    print(f'Two calls: attenuation at {notch_freq} Hz {20 * np.log10(np.abs(chain[notch_idx]))} dB')
+    for method in methods:
+        esg_filter = get_esg_filter(sampling_rate, esg_bp_freq, notch_freq, method)
+        if method == 'fir':
+            response = get_response(esg_filter['kernel'], sampling_rate, freqs)
+        else:
+            response = get_sos_response(esg_filter['sos'], sampling_rate, freqs)
+        max_passband = np.max(np.abs(response[passband] - chain[passband]))
+        print(f'{method}: max passband deviation {max_passband:.3g} (linear gain), attenuation at {notch_freq} Hz '
+              f'{20 * np.log10(np.abs(response[notch_idx]))} dB')
+        setattr(saveval, f'response_{method}', np.concatenate([[max_passband], np.abs(response[notch_idx])]))
+
+    ########################### Data ###########################
+    # [interior deviation, edge deviation, time of the two calls (s), time of the method (s)], per recording
+    deviation = {method: [] for method in methods}
+    for subject in subjects:
+        subject_id = f'sub-{str(subject).zfill(3)}'
+        input_path = "/data/pt_02569/tmp_data/prepared_py/" + subject_id + "/esg/prepro/"
+        for cond_name in cond_names:
+            raw = mne.io.read_raw_fif(f"{input_path}noStimart_sr{sampling_rate}_{cond_name}_withqrs.fif",
+                                      preload=True)
+            raw_chain = raw.copy()
+            start = time.time()
+            raw_chain.filter(l_freq=esg_bp_freq[0], h_freq=esg_bp_freq[1], n_jobs=len(raw.ch_names), method='iir',
+                             iir_params={'order': 2, 'ftype': 'butter'}, phase='zero')
+            raw_chain.notch_filter(freqs=notch_freq, n_jobs=len(raw.ch_names), method='fir', phase='zero')
+            time_chain = time.time() - start
+            data_chain = raw_chain.get_data()
+            interior = slice(int(edge_sec * sampling_rate), data_chain.shape[1] - int(edge_sec * sampling_rate))
+
+            for method in methods:
+                raw_method = raw.copy()
+                start = time.time()
+                filter_esg(raw_method, esg_bp_freq, notch_freq, method)
+                time_method = time.time() - start
+                diff = np.abs(raw_method.get_data() - data_chain) / np.max(np.abs(data_chain))
+                deviation[method].append([np.max(diff[:, interior]), np.max(diff), time_chain, time_method])
+
+    for method in methods:
+        dev = np.array(deviation[method])
+        print(f'{method}: max relative deviation inside {np.max(dev[:, 0]):.3g}, with the edges {np.max(dev[:, 1]):.3g}'
+              f', mean time {np.mean(dev[:, 3]):.2f}s against {np.mean(dev[:, 2]):.2f}s for the two calls')
+        setattr(saveval, f'data_{method}', dev)
+
+    # Save to file
+    dataset_keywords = [a for a in dir(saveval) if not a.startswith('__')]
+    with h5py.File("/data/pt_02569/tmp_data/filter_esg_validation.h5", "w") as outfile:
+        for keyword in dataset_keywords:
+            outfile.create_dataset(keyword, data=getattr(saveval, keyword))